@@ -1,9 +1,17 @@
+import argparse
+import itertools
 import json
-import os
-import urllib.request
-import urllib.parse
-import urllib.error
+import sys
+from contextlib import redirect_stdout
+from functools import lru_cache
 from colorama import Fore, init
+from app_inventory import AppInventory
+from http_client import configure as configure_http_client
+from graph_throttle import configure as configure_graph_throttle, throttle_stats
+from intune_inventory import iter_inventory_apps
+from report_enrichment import enrich_apps, format_assignments, format_install_summary
+from report_export import FORMATS, export_rows, open_output
+from telemetry import configure as configure_telemetry, span
 
 init(autoreset=True)
 
@@ -11,51 +19,15 @@ def load_config(config_file="config.json"):
     try:
         with open(config_file, 'r', encoding='utf-8') as f:
             config = json.load(f)
+            configure_http_client(config)
+            configure_graph_throttle(config)
+            configure_telemetry(config)
             return config
     except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
         error_msg("Error loading configuration from config.json", e)
         return None
 
-def get_access_token(config):
-    try:
-        url = f"https://login.microsoftonline.com/{config['intune_tenant_id']}/oauth2/v2.0/token"
-        data = urllib.parse.urlencode({
-            'grant_type': 'client_credentials',
-            'client_id': config['intune_client_id'],
-            'client_secret': config['intune_client_secret'],
-            'scope': 'https://graph.microsoft.com/.default'
-        }).encode('utf-8')
-        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('access_token')
-    except urllib.error.HTTPError as e:
-        error_msg("Error requesting token", e)
-        return None
-    except Exception as e:
-        error_msg("Unexpected authentication error", e)
-        return None
-
-def get_intune_apps(token):
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "ConsistencyLevel": "eventual"
-    }
-    uri = "https://graph.microsoft.com/v1.0/deviceAppManagement/mobileApps"
-    all_apps = []
-    while uri:
-        try:
-            req = urllib.request.Request(uri, headers=headers)
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                all_apps.extend(data.get('value', []))
-                uri = data.get('@odata.nextLink')
-        except urllib.error.HTTPError as e:
-            error_msg("Error fetching apps from Intune", e)
-            break
-    return all_apps
-
+@lru_cache(maxsize=None) # Called per app, but a tenant has only a few distinct types
 def determine_platform(odata_type):
     if "win32LobApp" in odata_type:
         return "Windows"
@@ -66,69 +38,125 @@ def determine_platform(odata_type):
     else:
         return "Not specified"
 
-def generate_report(apps):
-    if not apps:
-        print(f"{Fore.YELLOW}⚠️ No apps found.")
-        return
+REPORT_COLUMNS = [ # (row key, title, width)
+    ("name", "Name", 32),
+    ("platform", "Platform", 12),
+    ("version", "Version", 10),
+    ("vppTokenName", "VPP Token Name", 17),
+    ("assigned", "Assigned", 10),
+    ("developer", "Developer", 24)
+]
+ENRICHED_COLUMNS = [ # Filled in by report_enrichment
+    ("assignments", "Assignments", 40),
+    ("installs", "Installs (devices)", 30)
+]
 
-    # Define column widths
-    col_widths = {
-        "Name": 32,
-        "Platform": 12,
-        "Version": 10,
-        "VPP Token Name": 17,
-        "Assigned": 10,
-        "Developer": 24
+def report_row(app, enriched=False):
+    """Flatten a Graph app dict into one report row."""
+    platform = determine_platform(app.get('@odata.type', ''))
+    row = {
+        "name": app.get('displayName', 'N/A'),
+        "platform": platform,
+        "version": app.get('displayVersion', 'N/A') or app.get('committedContentVersion', 'N/A') or app.get('appVersion', 'N/A'),
+        "vppTokenName": app.get('vppTokenName', 'N/A') if platform == "iOS" else 'N/A',
+        "assigned": 'Yes' if app.get('isAssigned') else 'No',
+        "developer": app.get('publisher', 'N/A'),
+        "id": app.get('id')
     }
-    # Create the border line
-    border_line = "+" + "+".join(["-" * (width + 2) for width in col_widths.values()]) + "+"
+    if enriched:
+        row["assignments"] = format_assignments(app.get('assignments'))
+        row["installs"] = format_install_summary(app.get('installSummary'))
+    return row
 
-    # Print header
-    print(Fore.CYAN + "App Report:")
-    print(border_line)
-    header = "|"
-    for col, width in col_widths.items():
-        header += " " + f"{col:<{width}}" + " |"
-    print(header)
-    print(border_line)
+SUMMARY_COLUMNS = [
+    ("group", "Group", 10),
+    ("value", "Value", 32),
+    ("apps", "Apps", 8),
+    ("unassigned", "Unassigned", 10)
+]
 
-    # Print each row
-    for app in apps:
-        name = app.get('displayName', 'N/A')
-        platform = determine_platform(app.get('@odata.type', ''))
-        version = app.get('displayVersion', 'N/A') or app.get('committedContentVersion', 'N/A') or app.get('appVersion', 'N/A')
-        vpp_token_name = app.get('vppTokenName', 'N/A') if platform == "iOS" else 'N/A'
-        assigned = 'Yes' if app.get('isAssigned') else 'No'
-        developer = app.get('publisher', 'N/A')
+def summary_rows(apps, top_publishers=10):
+    """Counts per platform and per publisher (top_publishers largest) with their unassigned apps."""
+    inventory = apps if isinstance(apps, AppInventory) else AppInventory.from_apps(apps, platform_of=determine_platform)
+    yield {"group": "total", "value": "All apps", "apps": len(inventory), "unassigned": len(inventory.unassigned())}
+    for key, group, limit in (("platform", "platform", None), ("publisher", "publisher", top_publishers)):
+        groups = inventory.group_by(key)
+        for value in list(inventory.count_by(key))[:limit]:
+            members = groups[value]
+            yield {"group": group, "value": value, "apps": len(members), "unassigned": len(members.unassigned())}
 
-        row = (
-            f"| {name:<{col_widths['Name']}} | "
-            f"{platform:<{col_widths['Platform']}} | "
-            f"{version:<{col_widths['Version']}} | "
-            f"{vpp_token_name:<{col_widths['VPP Token Name']}} | "
-            f"{assigned:<{col_widths['Assigned']}} | "
-            f"{developer:<{col_widths['Developer']}} |"
-        )
-        print(row)
-        print(border_line)
+def generate_report(apps, enriched=False, fmt='table', stream=None, fit_widths=False):
+    """Write the report rows as they are read from the inventory. Returns the number of rows."""
+    apps = iter(apps or [])
+    first_app = next(apps, None)
+    if first_app is None:
+        print(f"{Fore.YELLOW}⚠️ No apps found.", file=sys.stderr if fmt != 'table' else sys.stdout)
+        return 0
+
+    columns = REPORT_COLUMNS + (ENRICHED_COLUMNS if enriched else [])
+    if fmt != 'table':
+        columns = columns + [("id", "Id", 36)] # Machine-readable exports keep the app id
+    elif stream in (None, sys.stdout):
+        print(Fore.CYAN + "App Report:")
+    rows = (report_row(app, enriched) for app in itertools.chain((first_app,), apps))
+    return export_rows(rows, columns, fmt, stream=stream, fit_widths=fit_widths, row_borders=True)
 
 def error_msg(step, error):
     print(f"\n{Fore.RED}❌ Error during {step}: {error}")
 
-def main():
-    print(f"{Fore.CYAN}Initializing...")
-    config = load_config()
-    if not config:
-        return
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a report of all apps in the Intune tenant.")
+    parser.add_argument("--refresh", action="store_true", help="Re-list all Intune apps instead of using the local inventory cache.")
+    parser.add_argument("--enrich", action="store_true", help="Also fetch assignment targets and install counts of every app.")
+    parser.add_argument("--concurrency", type=int, help="Parallel Graph requests for --enrich (default: report_concurrency from config, 16).")
+    parser.add_argument("--format", choices=FORMATS, default='table', help="Output format (default: table). csv and jsonl are streamed with the app id added.")
+    parser.add_argument("--output", help="Write the report to this file instead of stdout.")
+    parser.add_argument("--fit", action="store_true", help="Fit table columns to the data (holds all rows in memory; default: fixed layout, streamed).")
+    parser.add_argument("--summary", action="store_true", help="Print app counts per platform and top publishers (with unassigned apps) instead of one row per app.")
+    parser.add_argument("--trace", metavar="FILE", help="Append timing spans to this JSON-lines file.")
+    parser.add_argument("--metrics", metavar="FILE", help="Write a Prometheus textfile summary to this file.")
+    args = parser.parse_args(argv)
+    if args.summary and args.enrich:
+        parser.error("--summary cannot be combined with --enrich")
+
+    # Progress messages must not end up in a csv/jsonl export written to stdout
+    status_stream = sys.stderr if args.format != 'table' and not args.output else sys.stdout
+    with redirect_stdout(status_stream):
+        print(f"{Fore.CYAN}Initializing...")
+        config = load_config()
+        if not config:
+            return
+        if args.trace or args.metrics:
+            config['trace_file'] = args.trace or config.get('trace_file')
+            config['metrics_file'] = args.metrics or config.get('metrics_file')
+            configure_telemetry(config)
 
-    print(f"{Fore.BLUE}Authenticating...")
-    token = get_access_token(config)
-    if not token:
-        return
+        print(f"{Fore.CYAN}Retrieving app information from Intune...")
+        apps = iter_inventory_apps(config, refresh=args.refresh)
+        if apps is None:
+            return
+        if args.enrich:
+            from alive_progress import alive_bar # Only --enrich shows a progress bar
+            apps = list(apps)
+            print(f"{Fore.CYAN}Fetching assignments and install status of {len(apps)} apps...")
+            with alive_bar(len(apps), title="Enriching", length=30) as bar:
+                apps = enrich_apps(apps, config, concurrency=args.concurrency, on_progress=bar)
+            failed = sum(1 for app in apps if app.get('enrichmentError'))
+            if failed:
+                error_msg("enrichment", f"{failed} app(s) could not be enriched completely (shown as '?').")
 
-    print(f"{Fore.CYAN}Retrieving app information from Intune...")
-    apps = get_intune_apps(token)
-    generate_report(apps)
+    with open_output(args.output) as stream, span("report", format=args.format, summary=args.summary) as report_span:
+        if args.summary:
+            row_count = export_rows(summary_rows(apps), SUMMARY_COLUMNS, args.format, stream=stream, fit_widths=args.fit, row_borders=True)
+        else:
+            row_count = generate_report(apps, enriched=args.enrich, fmt=args.format, stream=stream, fit_widths=args.fit)
+        report_span.set(items=row_count)
+    with redirect_stdout(status_stream):
+        if args.output:
+            print(f"{Fore.GREEN}{row_count} {'summary row' if args.summary else 'app'}(s) written to {args.output}")
+        for host, stats in throttle_stats().items():
+            if stats['throttled'] or stats['retries'] or stats['failures']:
+                print(f"{Fore.YELLOW}{host}: {stats['throttled']} throttled, {stats['retries']} retries, {stats['failures']} failed, waited {stats['waited_seconds']}s")
 
 if __name__ == "__main__":
     main()
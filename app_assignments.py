@@ -0,0 +1,129 @@
+##
+## Post-publish assignment of Intune apps to groups.
+##
+## An assignment policy is a list of assignments, given per batch (--assign, manifest
+## "defaults") or per app (manifest app entry):
+##   "required:allDevices"   "available:allUsers"   "uninstall:<group id>"
+##   {"intent": "required", "target": "<group id>", "exclude": true}
+## The apps' current assignments are read first (one batched GET per app), and every
+## (app, assignment) pair not among them becomes one POST mobileApps/{id}/assignments,
+## so re-running a batch over apps that are already assigned posts nothing. Reads and
+## writes go through the Graph $batch engine (graph_batch.py), 20 per round-trip.
+## A POST that failed with a 5xx may have created the assignment anyway: the app's
+## assignments are read back and the POST is only sent again if it is not among them.
+##
+
+import re
+import urllib.parse
+from graph_batch import execute_batch
+
+INTENTS = ('required', 'available', 'uninstall')
+SPECIAL_TARGETS = {
+    "alldevices": "#microsoft.graph.allDevicesAssignmentTarget",
+    "allusers": "#microsoft.graph.allLicensedUsersAssignmentTarget",
+}
+_GUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE)
+
+def parse_assignment(value):
+    """Normalize one assignment ("intent:target" or dict) to {"intent", "target", "exclude"}. Raises ValueError."""
+    if isinstance(value, str):
+        intent, separator, target = value.partition(":")
+        if not separator:
+            raise ValueError(f"Assignment '{value}' must look like 'intent:target', e.g. 'required:allDevices'")
+        value = {"intent": intent, "target": target}
+    if not isinstance(value, dict):
+        raise ValueError(f"Invalid assignment: {value!r}")
+    intent = str(value.get('intent') or '').strip()
+    target = str(value.get('target') or value.get('group') or '').strip()
+    exclude = bool(value.get('exclude'))
+    if intent not in INTENTS:
+        raise ValueError(f"Assignment intent must be one of {', '.join(INTENTS)} (got '{intent}')")
+    if target.lower() in SPECIAL_TARGETS:
+        if exclude:
+            raise ValueError(f"Only groups can be excluded, not '{target}'")
+        target = "allDevices" if target.lower() == "alldevices" else "allUsers"
+    elif _GUID_RE.match(target):
+        target = target.lower()
+    else:
+        raise ValueError(f"Assignment target must be allDevices, allUsers or a group object id (got '{target}')")
+    return {"intent": intent, "target": target, "exclude": exclude}
+
+def parse_assignment_policy(values):
+    """Normalize a list of assignments (None or empty: no assignments). Raises ValueError."""
+    if values is None:
+        return []
+    if isinstance(values, (str, dict)):
+        values = [values]
+    return [parse_assignment(value) for value in values]
+
+def format_assignment(assignment):
+    """'required:allDevices' / 'exclude available:<group id>' - also the key of a done assignment in the journal."""
+    return f"{'exclude ' if assignment['exclude'] else ''}{assignment['intent']}:{assignment['target']}"
+
+def assignment_body(assignment):
+    """Graph mobileAppAssignment for a normalized assignment."""
+    if assignment['target'].lower() in SPECIAL_TARGETS:
+        target = {"@odata.type": SPECIAL_TARGETS[assignment['target'].lower()]}
+    else:
+        target_type = "exclusionGroupAssignmentTarget" if assignment['exclude'] else "groupAssignmentTarget"
+        target = {"@odata.type": f"#microsoft.graph.{target_type}", "groupId": assignment['target']}
+    return {"@odata.type": "#microsoft.graph.mobileAppAssignment", "intent": assignment['intent'], "target": target}
+
+def assignment_request(intune_app_id, assignment):
+    """$batch request creating one assignment of an app."""
+    return {"method": "POST", "url": f"/deviceAppManagement/mobileApps/{urllib.parse.quote(intune_app_id)}/assignments",
+            "body": assignment_body(assignment)}
+
+def same_assignment(assignment, existing):
+    """True if existing (a mobileAppAssignment read from Graph) is the normalized assignment."""
+    wanted = assignment_body(assignment)
+    target = existing.get('target') or {}
+    return (existing.get('intent') == wanted['intent'] and target.get('@odata.type') == wanted['target']['@odata.type']
+            and (target.get('groupId') or '').lower() == wanted['target'].get('groupId', ''))
+
+def read_assignments(config, app_ids):
+    """Current assignments of these apps in $batch requests: {app_id: [mobileAppAssignment]}, apps that could not be read left out."""
+    app_ids = sorted(set(app_ids))
+    reads = execute_batch(config, [{"method": "GET", "url": f"/deviceAppManagement/mobileApps/{urllib.parse.quote(app_id)}/assignments"}
+                                   for app_id in app_ids])
+    return {app_id: (read['body'] or {}).get('value', []) for app_id, read in zip(app_ids, reads) if not read['error']}
+
+def assign_apps(config, apps):
+    """Create the assignments of many apps in $batch requests, skipping those the apps already have.
+
+    apps maps a key (e.g. the PackageId) to (intune_app_id, [normalized assignments]).
+    Returns {key: {"done": [format_assignment(...)], "errors": ["<assignment>: <error>"]}}.
+    """
+    items = [(key, assignment) for key, (_, assignments) in apps.items() for assignment in assignments]
+    assigned = read_assignments(config, [apps[key][0] for key, _ in items]) # An app that cannot be read is posted to anyway
+    results = [{"status": 200, "body": None, "error": None} if any(same_assignment(assignment, existing) for existing in assigned.get(apps[key][0], []))
+               else None for key, assignment in items]
+    post = [position for position, result in enumerate(results) if result is None]
+    for position, result in zip(post, execute_batch(config, [assignment_request(apps[items[position][0]][0], items[position][1]) for position in post])):
+        results[position] = result
+
+    uncertain = [position for position, result in enumerate(results) if result['error'] and result.get('uncertain')]
+    if uncertain: # Created or not? Read the apps' assignments back before sending anything twice
+        existing = read_assignments(config, [apps[items[position][0]][0] for position in uncertain])
+        resend = []
+        for position in uncertain:
+            key, assignment = items[position]
+            app_id = apps[key][0]
+            if app_id not in existing:
+                continue # Could not be read back: keep the original error
+            if any(same_assignment(assignment, current) for current in existing[app_id]):
+                results[position] = {"status": 201, "body": None, "error": None}
+            else:
+                resend.append(position)
+        if resend:
+            for position, result in zip(resend, execute_batch(config, [assignment_request(apps[items[position][0]][0], items[position][1]) for position in resend])):
+                # 409: created meanwhile (the first POST finished late), which is what was asked for
+                results[position] = dict(result, error=None) if result['status'] == 409 else result
+
+    outcome = {key: {"done": [], "errors": []} for key in apps}
+    for (key, assignment), result in zip(items, results):
+        if result['error']:
+            outcome[key]["errors"].append(f"{format_assignment(assignment)}: {result['error']}")
+        else:
+            outcome[key]["done"].append(format_assignment(assignment))
+    return outcome
@@ -0,0 +1,121 @@
+##
+## In-memory indexes over the Intune inventory for batch duplicate detection.
+##
+## The inventory is loaded once per batch and indexed by normalized display name,
+## by publisher and by a prefix trie over lowercased name tokens, so that checking a
+## winget package ID against the tenant is a handful of dictionary lookups instead of
+## a Graph query plus a linear scan per app.
+##
+## Only "exact" matches mean the app is already in the tenant. "prefix" matches merely
+## share the publisher ('Microsoft.PowerToys' vs. 'Microsoft Teams'); they are shown for
+## information and never block publishing (see exact_matches).
+##
+
+import re
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Decorations Intune/WinTuner display names often carry: "(x64 en-US)", trailing versions
+_DECORATION_RE = re.compile(r"\s*(\([^)]*\)|\[[^\]]*\]|\bv?\d+(\.\d+)+\S*)\s*$")
+
+def name_tokens(text):
+    """Split a display name / package ID into lowercased alphanumeric tokens."""
+    return _TOKEN_RE.findall((text or "").lower())
+
+def normalize_name(text):
+    """Normalized form used for exact matching: lowercase alphanumerics only ('Mozilla.Firefox' -> 'mozillafirefox')."""
+    return "".join(name_tokens(text))
+
+def name_join_keys(display_name):
+    """Yield normalized join keys for a display name: as-is, then with trailing decorations removed.
+
+    Lazy, so the common case (the name matches the catalog as-is) never runs the regex.
+    """
+    yield normalize_name(display_name)
+    stripped = display_name or ""
+    while True:
+        shorter = _DECORATION_RE.sub("", stripped)
+        if shorter == stripped or not shorter:
+            return
+        stripped = shorter
+        yield normalize_name(stripped)
+
+def exact_name_keys(package_id, catalog_name=None):
+    """Normalized display names that are exact matches for a package ID: the full ID, its name part
+    and the catalog Name of the package ('Zoom.Zoom' is published as 'Zoom Workplace')."""
+    keys = {normalize_name(package_id), normalize_name(".".join(package_id.split(".")[1:])), normalize_name(catalog_name)}
+    return keys - {""}
+
+def is_exact_name(display_name, name_keys):
+    """True if display_name, as-is or without its decorations ('Mozilla Firefox (x64 en-US)'), is one of name_keys."""
+    return any(key in name_keys for key in name_join_keys(display_name))
+
+def exact_matches(matches):
+    """The matches that are the app itself (matchType "exact"): what an if-absent policy decides on."""
+    return [match for match in matches or [] if match.get('matchType') == "exact"]
+
+class AppIndex:
+    """Hash and prefix-trie indexes over report records (app_inventory.AppRecord, from generate_report_output)."""
+
+    def __init__(self, report_data):
+        self.apps = list(report_data or [])
+        self.by_name = {} # normalized display name, as-is and without decorations (name_join_keys) -> [row index]
+        self.by_publisher = {} # first publisher token -> [row index]
+        self.trie = {} # token character trie; every node's "" key lists the rows below it
+        publisher_keys = {} # publisher -> first token; publishers repeat across many apps
+
+        for position, app_info in enumerate(self.apps):
+            display_name = app_info.get('originalDisplayName') or app_info.get('displayName') or ''
+            for key in set(name_join_keys(display_name)):
+                self.by_name.setdefault(key, []).append(position)
+            publisher = app_info.get('publisher')
+            publisher_key = publisher_keys.get(publisher)
+            if publisher_key is None:
+                publisher_tokens = name_tokens(publisher)
+                publisher_key = publisher_keys[publisher] = publisher_tokens[0] if publisher_tokens else ""
+            if publisher_key:
+                self.by_publisher.setdefault(publisher_key, []).append(position)
+            for token in set(name_tokens(display_name)):
+                node = self.trie
+                for char in token:
+                    node = node.setdefault(char, {})
+                    node.setdefault("", []).append(position)
+
+    def __len__(self):
+        return len(self.apps)
+
+    def prefix_lookup(self, prefix):
+        """Row indexes of apps having a name token that starts with prefix (lowercase)."""
+        node = self.trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get("", [])
+
+    def match(self, package_id, catalog_name=None):
+        """Return structured matches for a winget package ID, exact matches first.
+
+        Each match is the report dict of the app (AppRecord.as_dict) with an added 'matchType':
+          - "exact":  the normalized display name, with or without decorations, equals the
+                      package ID, its name part or the catalog Name of the package
+                      ('Mozilla.Firefox' matches 'Mozilla Firefox (x64 en-US)' and 'Firefox')
+          - "prefix": a display name token starts with the publisher part of the ID
+                      ('Mozilla' matches 'Mozilla Thunderbird'), or the app's publisher
+                      starts with that same token
+        """
+        publisher_part = normalize_name(package_id.split(".")[0])
+        exact_keys = exact_name_keys(package_id, catalog_name)
+
+        matches = []
+        seen = set()
+        for key in exact_keys:
+            for position in self.by_name.get(key, []):
+                if position not in seen:
+                    seen.add(position)
+                    matches.append(self.apps[position].as_dict(matchType="exact"))
+        if publisher_part:
+            for position in self.prefix_lookup(publisher_part) + self.by_publisher.get(publisher_part, []):
+                if position not in seen:
+                    seen.add(position)
+                    matches.append(self.apps[position].as_dict(matchType="prefix"))
+        return matches
@@ -0,0 +1,169 @@
+##
+## Compact in-memory model of the Intune inventory for reports, duplicate checks and diffs.
+##
+## Every app becomes one AppRecord (__slots__, no per-app dict) instead of an 8-key
+## report dict. Values shared by many apps are stored once: the platform is classified
+## once per distinct @odata.type (determine_platform is memoized) and publisher names
+## are interned per inventory. Records answer row.get(key) with the report keys
+## (originalDisplayName, platform, displayVersion, ...), so report writers, AppIndex
+## and find_outdated_apps use them like the old dicts.
+##
+## AppInventory holds the records and answers queries in single passes over them:
+##   inventory.filter(platform="Windows", assigned=False)
+##   inventory.sort("displayVersion", reverse=True)      # winget version order
+##   inventory.count_by("publisher")                     # {"Mozilla": 12, ...}, largest first
+##   inventory.group_by("platform")["Windows"]           # AppInventory per value
+## Filters and sorts return new AppInventory views sharing the same records.
+##
+
+import sys
+from functools import lru_cache
+from operator import attrgetter
+from winget_version import batch_sort_keys
+
+# (lowercase @odata.type substring, platform), checked in order
+PLATFORM_RULES = (
+    ("win32lobapp", "Windows"),
+    ("windowsuniversalappx", "Windows UWP"),
+    ("microsoftstoreforbusinessapp", "Win Store"),
+    ("managedandroidlobapp", "Android LOB"),
+    ("androidstoreapp", "Android Store"),
+    ("ioslobapp", "iOS LOB"),
+    ("iosvppapp", "iOS VPP"),
+    ("macoslobapp", "macOS LOB"),
+    ("macosdmgapp", "macOS DMG"),
+    ("microsoftedge", "Edge"), # MicrosoftEdgeApp
+    ("webapp", "Web App") # WebApp
+)
+
+@lru_cache(maxsize=None) # A tenant has a handful of distinct types: classify each once
+def determine_platform(odata_type):
+    """Determine app platform based on @odata.type."""
+    odata_type = (odata_type or "").lower() # Case-insensitive check
+    if not odata_type:
+        return "Unknown Type"
+    for fragment, platform in PLATFORM_RULES:
+        if fragment in odata_type:
+            return platform
+    # Extract simple type if complex one not matched
+    simple_type = odata_type.split('.')[-1]
+    return sys.intern(simple_type.replace('app', '').capitalize() or "Other")
+
+class AppRecord:
+    """One Intune app as a report row: attributes named like the report keys, plus get()."""
+    __slots__ = ("id", "originalDisplayName", "platform", "displayVersion", "vppTokenName", "assigned", "publisher")
+
+    def __init__(self, app_id, name, platform, version, vpp_token_name, assigned, publisher):
+        self.id = app_id
+        self.originalDisplayName = name
+        self.platform = platform
+        self.displayVersion = version
+        self.vppTokenName = vpp_token_name
+        self.assigned = assigned
+        self.publisher = publisher
+
+    @property
+    def displayName(self):
+        """Name up to the first '.' (the report's short name)."""
+        return self.originalDisplayName.split(".")[0]
+
+    @property
+    def isAssigned(self):
+        return 'Yes' if self.assigned else 'No'
+
+    def get(self, key, default=None):
+        """Dict-style access with the report keys (report writers, AppIndex, outdated diff)."""
+        return getattr(self, key, default)
+
+    def as_dict(self, **extra):
+        """The report dict of this app (e.g. for a duplicate-check match or JSON results)."""
+        return dict({"displayName": self.displayName, "originalDisplayName": self.originalDisplayName, "platform": self.platform,
+                     "displayVersion": self.displayVersion, "vppTokenName": self.vppTokenName, "isAssigned": self.isAssigned,
+                     "publisher": self.publisher, "id": self.id}, **extra)
+
+    def __repr__(self):
+        return f"AppRecord({self.originalDisplayName!r}, {self.platform!r}, {self.displayVersion!r})"
+
+def iter_records(apps, platform_of=determine_platform, interned=None):
+    """Yield one AppRecord per Graph app dict as the apps arrive (apps may be a stream).
+
+    interned is the dict used to share equal publisher names (one per inventory).
+    """
+    interned = {} if interned is None else interned
+    for app in apps:
+        platform = platform_of(app.get('@odata.type', ''))
+        version = app.get('displayVersion', 'N/A') or app.get('committedContentVersion', 'N/A') or app.get('appVersion', 'N/A') or 'N/A' # Ensure default
+        # Field name for VPP token might be vppTokenAppleId or similar, adjust if needed based on Graph API output
+        vpp_token_name = app.get('vppTokenAppleId', 'N/A') if platform == "iOS VPP" else 'N/A'
+        publisher = app.get('publisher', 'N/A')
+        publisher = interned.setdefault(publisher, publisher) if isinstance(publisher, str) else publisher
+        yield AppRecord(app.get('id', 'N/A'), app.get('displayName') or 'N/A', platform, version, vpp_token_name, bool(app.get('isAssigned')), publisher)
+
+class AppInventory:
+    """Sequence of AppRecords with filter / sort / group-by queries."""
+
+    def __init__(self, records=None):
+        self.records = list(records or [])
+
+    @classmethod
+    def from_apps(cls, apps, platform_of=determine_platform):
+        """Build the inventory from Graph app dicts (any iterable, consumed once)."""
+        return cls(iter_records(apps, platform_of))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, position):
+        return self.records[position]
+
+    def filter(self, platform=None, publisher=None, assigned=None, name_contains=None, predicate=None):
+        """Apps matching every given criterion (platform / publisher: a value or a collection of values)."""
+        records = self.records
+        if platform is not None:
+            platforms = {platform} if isinstance(platform, str) else set(platform)
+            records = [record for record in records if record.platform in platforms]
+        if publisher is not None:
+            publishers = {publisher} if isinstance(publisher, str) else set(publisher)
+            records = [record for record in records if record.publisher in publishers]
+        if assigned is not None:
+            records = [record for record in records if record.assigned is assigned]
+        if name_contains:
+            needle = name_contains.lower()
+            records = [record for record in records if needle in record.originalDisplayName.lower()]
+        if predicate is not None:
+            records = [record for record in records if predicate(record)]
+        return AppInventory(records)
+
+    def sort(self, key="originalDisplayName", reverse=False):
+        """Apps ordered by a record key: versions in winget order, text case-insensitively."""
+        values = list(map(attrgetter(key), self.records))
+        if key == "displayVersion":
+            sort_keys = batch_sort_keys(values)
+        else:
+            sort_keys = [value.casefold() if isinstance(value, str) else value for value in values]
+        order = sorted(range(len(values)), key=sort_keys.__getitem__, reverse=reverse)
+        return AppInventory([self.records[position] for position in order])
+
+    def group_by(self, key):
+        """{value: AppInventory} for a record key, in order of first appearance."""
+        groups = {}
+        for value, record in zip(map(attrgetter(key), self.records), self.records):
+            group = groups.get(value)
+            if group is None:
+                group = groups[value] = []
+            group.append(record)
+        return {value: AppInventory(records) for value, records in groups.items()}
+
+    def count_by(self, key):
+        """{value: number of apps} for a record key, largest count first."""
+        counts = {}
+        for value in map(attrgetter(key), self.records):
+            counts[value] = counts.get(value, 0) + 1
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def unassigned(self):
+        """Apps without any assignment."""
+        return self.filter(assigned=False)
@@ -0,0 +1,121 @@
+##
+## Single command line entry point for the Intune packaging tools.
+##
+##   python automattuner.py package Mozilla.Firefox Zoom.Zoom [--architecture arm64 ...]
+##   python automattuner.py publish [Mozilla.Firefox ...] [publish_installer.py options]
+##   python automattuner.py report [--format csv --output apps.csv ...]
+##   python automattuner.py diff [--ids-only]
+##   python automattuner.py catalog lookup Mozilla.Firefox
+##   python automattuner.py search mozila firefx
+##   python automattuner.py cache stats
+##   python automattuner.py daemon serve | submit publish Mozilla.Firefox --wait | status
+##   python automattuner.py bootstrap
+##
+## Only argparse is imported at start-up. Every subcommand imports the modules it needs
+## when it runs, so 'catalog' or 'cache' never load colorama, alive_progress or the
+## Graph stack, and '--help' answers in a few milliseconds. The per-script entry points
+## (publish_installer.py, Report.py, ...) keep working unchanged.
+##
+
+import argparse
+import contextlib
+import sys
+
+HELP_FLAGS = ("-h", "--help")
+
+def split_ids(extra):
+    """Leading App IDs (before the first option) and the remaining pass-through arguments."""
+    count = next((position for position, item in enumerate(extra) if item.startswith("-")), len(extra))
+    return [item.strip(",") for item in extra[:count] if item.strip(",")], extra[count:]
+
+def cmd_package(args, extra):
+    """Package apps without publishing (headless batch with --publish never)."""
+    import publish_installer
+    ids, extra = split_ids(extra)
+    if not ids:
+        if any(flag in extra for flag in HELP_FLAGS):
+            return publish_installer.main(["--help"])
+        build_parser().error("package: at least one APP_ID is required")
+    return publish_installer.main(["--ids", ",".join(ids), "--publish", "never", *extra])
+
+def cmd_publish(args, extra):
+    """Package and publish apps: headless with IDs (default policy 'always'), else the interactive batch loop."""
+    import publish_installer
+    ids, extra = split_ids(extra)
+    if ids:
+        return publish_installer.main(["--ids", ",".join(ids), "--publish", "always", *extra]) # A later --publish wins
+    return publish_installer.main(extra)
+
+def cmd_report(args, extra):
+    import Report
+    return Report.main(extra)
+
+def cmd_diff(args, extra):
+    """Print the Intune apps that have a newer version in the winget catalog."""
+    import publish_installer
+    config = publish_installer.load_config()
+    if not config:
+        return 1
+    config['inventory_refresh'] = args.refresh
+    if args.ids_only:
+        with contextlib.redirect_stdout(sys.stderr): # Keep stdout for the ID list
+            queue = publish_installer.get_outdated_app_queue(config)
+        if queue:
+            print(",".join(queue))
+    else:
+        queue = publish_installer.get_outdated_app_queue(config)
+    return 0 if queue is not None else 1
+
+def cmd_catalog(args, extra):
+    import winget_catalog
+    return winget_catalog.main(extra)
+
+def cmd_search(args, extra):
+    import winget_catalog
+    return winget_catalog.main(["search", *extra])
+
+def cmd_cache(args, extra):
+    import package_cache
+    return package_cache.main(extra)
+
+def cmd_daemon(args, extra):
+    import job_daemon
+    return job_daemon.main(extra)
+
+def cmd_bootstrap(args, extra):
+    import install_requirements
+    install_requirements.install_all_dependencies()
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="automattuner", description="Package winget apps with WinTuner, publish them to Intune and report on the tenant.")
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    # Pass-through commands: options after the subcommand go to the underlying script (add_help=False forwards -h too)
+    subparsers.add_parser("package", add_help=False, help="APP_ID... [options]: package apps without publishing (options: see 'publish_installer.py -h').").set_defaults(handler=cmd_package)
+    subparsers.add_parser("publish", add_help=False, help="[APP_ID...] [options]: package and publish apps; without IDs runs the interactive batch loop.").set_defaults(handler=cmd_publish)
+    subparsers.add_parser("report", add_help=False, help="Report of all apps in the tenant (options: see 'Report.py -h').").set_defaults(handler=cmd_report)
+    subparsers.add_parser("catalog", add_help=False, help="Build / query the winget catalog index (build, lookup, prefix, publisher).").set_defaults(handler=cmd_catalog)
+    subparsers.add_parser("search", add_help=False, help="TEXT... [--limit N]: typo-tolerant search of the winget catalog by PackageId or name.").set_defaults(handler=cmd_search)
+    subparsers.add_parser("cache", add_help=False, help="Inspect and clean the package cache (stats, gc, verify).").set_defaults(handler=cmd_cache)
+    subparsers.add_parser("daemon", add_help=False, help="Run the warm worker daemon or submit jobs to it (serve, submit, status, cancel).").set_defaults(handler=cmd_daemon)
+
+    diff = subparsers.add_parser("diff", help="List Intune apps with a newer version in the winget catalog.")
+    diff.add_argument("--refresh", action="store_true", help="Re-list all Intune apps instead of using the local inventory cache.")
+    diff.add_argument("--ids-only", action="store_true", help="Print only a comma-separated PackageId list (e.g. for 'publish --ids').")
+    diff.set_defaults(handler=cmd_diff)
+    subparsers.add_parser("bootstrap", help="Install the Python packages, .NET SDK, WinTuner and PowerShell modules.").set_defaults(handler=cmd_bootstrap)
+    return parser
+
+def main(argv=None):
+    args, extra = build_parser().parse_known_args(argv)
+    if args.command in ("diff", "bootstrap") and extra:
+        build_parser().error(f"unrecognized arguments: {' '.join(extra)}")
+    return args.handler(args, extra) or 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\nOperation cancelled by user.")
+        sys.exit(0)
@@ -0,0 +1,108 @@
+##
+## Fake 'wintuner' executable for benchmarks: same command line, configurable runtime and output.
+##
+##   wintuner package <PackageId> --package-folder DIR [--version V] [--architecture A] [--installer-context C]
+##   wintuner publish <PackageId> --package-folder DIR --tenant T --token X [--version V]
+##
+## 'package' prints download / extract / intunewin phase lines with percentages (what
+## process_supervisor parses) and writes <DIR>/<PackageId>/<Version>/ with an installer
+## and an .intunewin file; 'publish' prints upload progress and the new app's GUID. When
+## AUTOMATTUNER_GRAPH_URL is set (the mock server), 'publish' creates the app there with
+## POST mobileApps like the real wintuner does, so later existence checks find it.
+##
+## Environment:
+##   FAKE_WINTUNER_PACKAGE_SECONDS  runtime of 'package' (default 0.5)
+##   FAKE_WINTUNER_PUBLISH_SECONDS  runtime of 'publish' (default 0.3)
+##   FAKE_WINTUNER_SIZE_KB          size of the generated installer (default 256)
+##   FAKE_WINTUNER_FAIL             comma-separated PackageIds whose commands exit with 1
+##                                  (PackageId/arm64: only when packaging that architecture,
+##                                  PackageId@1.2: only when packaging that --version, e.g. one
+##                                  pulled from winget)
+##   FAKE_WINTUNER_LINES            progress lines per phase (default 5)
+##
+## install_shim(bin_dir) writes a 'wintuner' launcher for this script into bin_dir; put
+## bin_dir first on PATH.
+##
+
+import argparse
+import json
+import os
+import stat
+import sys
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+
+def emit_phase(label, seconds, lines):
+    for step in range(1, lines + 1):
+        time.sleep(seconds / lines)
+        print(f"{label} {step * 100 // lines}%", flush=True)
+
+def package(args):
+    seconds = float(os.environ.get('FAKE_WINTUNER_PACKAGE_SECONDS', 0.5))
+    lines = int(os.environ.get('FAKE_WINTUNER_LINES', 5))
+    version = args.version or "1.0.0"
+    print(f"Packaging {args.package_id} {version} ({args.architecture}, {args.installer_context})", flush=True)
+    emit_phase("Downloading installer", seconds * 0.6, lines)
+    emit_phase("Extracting installer", seconds * 0.1, lines)
+    target = Path(args.package_folder) / args.package_id / version
+    target.mkdir(parents=True, exist_ok=True)
+    installer = f"{args.package_id} {version} {args.architecture}\n".encode('utf-8')
+    installer += b"\0" * (int(os.environ.get('FAKE_WINTUNER_SIZE_KB', 256)) * 1024)
+    (target / "installer.exe").write_bytes(installer)
+    emit_phase("Creating intunewin package", seconds * 0.3, lines)
+    (target / f"{args.package_id}.intunewin").write_bytes(installer[: len(installer) // 2])
+    (target / "app.json").write_text(f'{{"PackageId": "{args.package_id}", "Version": "{version}"}}\n', encoding='utf-8')
+    print(f"Package written to {target}", flush=True)
+
+def publish(args):
+    seconds = float(os.environ.get('FAKE_WINTUNER_PUBLISH_SECONDS', 0.3))
+    lines = int(os.environ.get('FAKE_WINTUNER_LINES', 5))
+    emit_phase(f"Uploading {args.package_id}", seconds, lines)
+    app_id = str(uuid.uuid4())
+    graph_url = os.environ.get('AUTOMATTUNER_GRAPH_URL')
+    if graph_url:
+        app = {"@odata.type": "#microsoft.graph.win32LobApp", "displayName": args.package_id, "displayVersion": args.version}
+        request = urllib.request.Request(graph_url.rstrip("/") + "/v1.0/deviceAppManagement/mobileApps", data=json.dumps(app).encode('utf-8'),
+                                         headers={"Authorization": f"Bearer {args.token}", "Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=30) as response:
+            app_id = json.loads(response.read().decode('utf-8'))['id']
+    print(f"Published {args.package_id} as app {app_id}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="wintuner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("package", "publish"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("package_id")
+        sub.add_argument("--package-folder", required=True)
+        sub.add_argument("--version")
+        sub.add_argument("--architecture", default="x64")
+        sub.add_argument("--installer-context", default="system")
+        sub.add_argument("--tenant")
+        sub.add_argument("--token")
+    args = parser.parse_args(argv)
+    failing = os.environ.get('FAKE_WINTUNER_FAIL', '').split(',')
+    if args.package_id in failing or (args.command == "package" and (f"{args.package_id}/{args.architecture}" in failing
+                                                                      or f"{args.package_id}@{args.version}" in failing)):
+        print(f"Error: simulated failure for {args.package_id}", file=sys.stderr, flush=True)
+        return 1
+    (package if args.command == "package" else publish)(args)
+    return 0
+
+def install_shim(bin_dir):
+    """Write a 'wintuner' launcher (a shell script, or wintuner.cmd on Windows) into bin_dir."""
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    script = Path(__file__).resolve()
+    if os.name == 'nt':
+        (bin_dir / "wintuner.cmd").write_text(f'@"{sys.executable}" "{script}" %*\r\n', encoding='utf-8')
+        return bin_dir
+    shim = bin_dir / "wintuner"
+    shim.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n', encoding='utf-8')
+    shim.chmod(shim.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+if __name__ == "__main__":
+    sys.exit(main())
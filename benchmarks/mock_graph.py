@@ -0,0 +1,254 @@
+##
+## Local stand-in for the token endpoint and the Microsoft Graph calls this tool makes.
+##
+##   POST /<tenant>/oauth2/v2.0/token                         client-credentials token (JWT-shaped, 'tid' = <tenant>)
+##   GET  /v1.0/deviceAppManagement/mobileApps                paginated ($top, $skiptoken,
+##                                                            contains(displayName) / lastModifiedDateTime filters)
+##   POST /v1.0/deviceAppManagement/mobileApps                create an app (used by fake_wintuner publish)
+##   GET  /v1.0/deviceAppManagement/mobileApps/<id>           single app (404 if unknown)
+##   GET  /v1.0/deviceAppManagement/mobileApps/<id>/assignments   assignments created through $batch
+##   GET  /beta/deviceAppManagement/mobileApps/<id>/installSummary
+##   GET  /v1.0/groups/<id>
+##   POST /v1.0/$batch                                        POST / GET <app>/assignments sub-requests are
+##                                                            served, every other sub-request answers 201
+##
+## App names come from the bundled winget catalog, so duplicate checks find real matches.
+## Latency and throttling are configurable: every throttle_every-th request is answered
+## with 429 + Retry-After. Point the tool at it with AUTOMATTUNER_GRAPH_URL /
+## AUTOMATTUNER_LOGIN_URL (or the graph_url / login_url config keys). fail_batch_items()
+## makes the next $batch sub-requests fail with given statuses, optionally after the
+## write was applied (a 500 that created the assignment anyway). revoke_token() makes
+## Graph answer 401 to a token, like a token Entra ID no longer accepts.
+##
+## Standalone: python benchmarks/mock_graph.py --apps 5000 --latency-ms 30 --throttle-every 50
+##
+
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_CATALOG = Path(__file__).resolve().parent.parent / "index.json"
+MAX_PAGE_SIZE = 999
+_BATCH_ASSIGNMENTS_RE = re.compile(r"^/deviceAppManagement/mobileApps/([^/?]+)/assignments$")
+_APP_RE = re.compile(r"^/(v1\.0|beta)/deviceAppManagement/mobileApps/([^/?]+)(/assignments|/installSummary)?$")
+_CONTAINS_RE = re.compile(r"contains\(tolower\(displayName\), '([^']*)'\)")
+_MODIFIED_RE = re.compile(r"lastModifiedDateTime ge (\S+)")
+
+def make_apps(count, catalog_path=DEFAULT_CATALOG):
+    """count Graph-like win32LobApp dicts named after catalog entries (cycled if count exceeds the catalog)."""
+    try:
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        catalog = [{"Name": f"Mock App {i}", "PackageId": f"Mock.App{i}", "Version": "1.0"} for i in range(1000)]
+    apps = []
+    for i in range(count):
+        entry = catalog[i % len(catalog)]
+        apps.append({
+            "@odata.type": "#microsoft.graph.win32LobApp",
+            "id": f"00000000-0000-4000-8000-{i:012d}",
+            "displayName": entry['Name'] if i < len(catalog) else f"{entry['Name']} ({i // len(catalog)})",
+            "publisher": entry['PackageId'].split('.')[0],
+            "displayVersion": entry.get('Version') or "1.0",
+            "isAssigned": i % 3 == 0,
+            "lastModifiedDateTime": "2025-01-01T00:00:00Z",
+            "largeIcon": {"type": "image/png", "value": "A" * 512} # Payload that $select is expected to drop
+        })
+    return apps
+
+def mock_token(tenant):
+    """Unsigned JWT-shaped token whose 'tid' claim names the tenant (per-tenant throttling reads it)."""
+    def segment(claims):
+        return base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).rstrip(b"=").decode('ascii')
+    claims = {'tid': tenant, 'iat': int(time.time()), 'jti': uuid.uuid4().hex} # jti: two tokens are never equal
+    return f"{segment({'alg': 'none', 'typ': 'JWT'})}.{segment(claims)}.mock"
+
+class MockGraphServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, apps=1000, latency_ms=0.0, throttle_every=0, retry_after=1, page_size=MAX_PAGE_SIZE, port=0):
+        super().__init__(("127.0.0.1", port), MockGraphHandler)
+        self.apps = make_apps(apps) if isinstance(apps, int) else apps
+        self.apps_by_id = {app['id']: app for app in self.apps}
+        self.latency = latency_ms / 1000.0
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self.assignments = {} # app id -> [mobileAppAssignment]
+        self.batch_faults = [] # (status, applied, method) answers for the next $batch sub-requests
+        self.revoked_tokens = set() # Bearer tokens answered with 401
+        self.counters = {"requests": 0, "throttled": 0, "tokens": 0, "pages": 0, "batch_items": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def add_app(self, app):
+        with self._lock:
+            self.apps.append(app)
+            self.apps_by_id[app['id']] = app
+
+    def revoke_token(self, token):
+        """Answer every Graph request made with this token with 401."""
+        with self._lock:
+            self.revoked_tokens.add(token)
+
+    def fail_batch_items(self, faults, method=None):
+        """Answer the next $batch sub-requests (of this method, or any) with these (status, applied) faults, in order."""
+        with self._lock:
+            self.batch_faults.extend((status, applied, method) for status, applied in faults)
+
+    def batch_item(self, item):
+        """Sub-response of one $batch sub-request."""
+        status, applied = None, True
+        with self._lock:
+            for position, (fault_status, fault_applied, method) in enumerate(self.batch_faults):
+                if method in (None, item['method']):
+                    status, applied = fault_status, fault_applied
+                    del self.batch_faults[position]
+                    break
+        response = {"id": item['id'], "status": 201, "body": dict(item.get('body') or {}, id=item['id'])}
+        match = _BATCH_ASSIGNMENTS_RE.match(urllib.parse.urlsplit(item['url']).path)
+        if applied and match:
+            app_id = urllib.parse.unquote(match.group(1))
+            with self._lock:
+                if item['method'] == "POST":
+                    self.assignments.setdefault(app_id, []).append(response['body'])
+                else:
+                    response = {"id": item['id'], "status": 200, "body": {"value": list(self.assignments.get(app_id, []))}}
+        if status is not None:
+            headers = {"Retry-After": "0"} if status == 429 else {}
+            response = {"id": item['id'], "status": status, "headers": headers, "body": {"error": {"code": "MockFault", "message": f"Injected {status}"}}}
+        return response
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+            return self.counters[counter]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-graph", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class MockGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like Graph
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def begin(self):
+        """Apply latency, revoked tokens and throttling; returns False if the request was answered with 401 / 429."""
+        server = self.server
+        number = server.count("requests")
+        if server.latency:
+            time.sleep(server.latency)
+        if self.headers.get('Authorization', '').partition(" ")[2] in server.revoked_tokens:
+            self.send_json(401, {"error": {"code": "InvalidAuthenticationToken", "message": "Access token has been revoked."}})
+            return False
+        if server.throttle_every and number % server.throttle_every == 0:
+            server.count("throttled")
+            self.send_json(429, {"error": {"code": "TooManyRequests", "message": "Mock throttling"}}, {"Retry-After": str(server.retry_after)})
+            return False
+        return True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = urllib.parse.urlsplit(self.path).path
+        if path.endswith("/oauth2/v2.0/token"):
+            self.server.count("tokens")
+            self.send_json(200, {"token_type": "Bearer", "expires_in": 3599, "access_token": mock_token(path.strip("/").split("/")[0])})
+        elif path == "/v1.0/deviceAppManagement/mobileApps":
+            if not self.begin():
+                return
+            app = dict(json.loads(body or b"{}"), id=str(uuid.uuid4()), lastModifiedDateTime=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            self.server.add_app(app)
+            self.send_json(201, app)
+        elif path == "/v1.0/$batch":
+            if not self.begin():
+                return
+            requests = json.loads(body or b"{}").get('requests', [])
+            self.server.count("batch_items", len(requests))
+            self.send_json(200, {"responses": [self.server.batch_item(item) for item in requests]})
+        else:
+            self.send_json(404, {"error": {"code": "NotFound", "message": path}})
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        if not self.begin():
+            return
+        if parts.path == "/v1.0/deviceAppManagement/mobileApps":
+            return self.list_apps(parts, query)
+        match = _APP_RE.match(parts.path)
+        if match:
+            app = self.server.apps_by_id.get(urllib.parse.unquote(match.group(2)))
+            if app is None:
+                return self.send_json(404, {"error": {"code": "ResourceNotFound", "message": "App not found"}})
+            if match.group(3) == "/assignments":
+                return self.send_json(200, {"value": self.server.assignments.get(app['id'], [])})
+            if match.group(3) == "/installSummary":
+                return self.send_json(200, {"installedDeviceCount": 10, "failedDeviceCount": 1, "pendingInstallDeviceCount": 2})
+            return self.send_json(200, {key: value for key, value in app.items() if key != 'largeIcon'})
+        if parts.path.startswith("/v1.0/groups/"):
+            return self.send_json(200, {"displayName": "Mock Group"})
+        self.send_json(404, {"error": {"code": "NotFound", "message": parts.path}})
+
+    def list_apps(self, parts, query):
+        self.server.count("pages")
+        apps = self.server.apps
+        filter_text = query.get('$filter', '')
+        modified_since = _MODIFIED_RE.search(filter_text)
+        if modified_since: # ISO timestamps in the same format compare correctly as strings
+            apps = [app for app in apps if app.get('lastModifiedDateTime', '') >= modified_since.group(1)]
+        name_filter = _CONTAINS_RE.search(filter_text)
+        if name_filter:
+            apps = [app for app in apps if name_filter.group(1) in app['displayName'].lower()]
+        page_size = min(int(query.get('$top', self.server.page_size)), self.server.page_size)
+        offset = int(query.get('$skiptoken', 0))
+        page = apps[offset:offset + page_size]
+        selected = query.get('$select')
+        if selected:
+            keep = set(selected.split(",")) | {'@odata.type'}
+            page = [{key: value for key, value in app.items() if key in keep} for app in page]
+        payload = {"@odata.context": "mock", "value": page}
+        if offset + page_size < len(apps):
+            next_query = dict(query, **{'$skiptoken': str(offset + page_size)})
+            payload["@odata.nextLink"] = f"{self.server.url}{parts.path}?{urllib.parse.urlencode(next_query)}"
+        self.send_json(200, payload)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the mock Graph / token endpoint until Ctrl+C.")
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429 (0: never).")
+    parser.add_argument("--page-size", type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument("--port", type=int, default=8400)
+    args = parser.parse_args()
+    server = MockGraphServer(args.apps, args.latency_ms, args.throttle_every, page_size=args.page_size, port=args.port)
+    print(f"Mock Graph listening on {server.url} ({len(server.apps)} apps). Set AUTOMATTUNER_GRAPH_URL and AUTOMATTUNER_LOGIN_URL to it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,267 @@
+##
+## Benchmark suite: runs the tool against the mock Graph server and the fake wintuner.
+##
+## Scenarios (select with --scenarios, default all):
+##   startup     wall time of 'automattuner.py --help' / 'catalog lookup' / 'import publish_installer'
+##               in fresh interpreters, checked against STARTUP_BUDGETS_MS; also fails if the
+##               CLI's start-up path imports a module listed in LAZY_MODULES
+##   pagination  intune_inventory.get_intune_apps over the full mock tenant
+##   check       build the indexed inventory once, then check_intune_app_report_based per PackageId
+##   batch       run_batch_pipeline (package + check + publish) with the fake wintuner, cold and warm
+##   report      'Report.py --format jsonl --output ...' as a subprocess, first (seeding) and warm runs
+##
+## Prints (or writes with --output) one JSON document: per scenario the sample count,
+## p50 / p95 / p99 / max latency in ms, throughput and the mock server's counters.
+## Exit code 1 if a start-up budget is exceeded, so the suite can run in CI.
+##
+##   python benchmarks/run_benchmarks.py --apps 5000 --latency-ms 20 --throttle-every 40 --output bench.json
+##
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path[:0] = [str(REPO_DIR), str(BENCH_DIR)]
+
+from mock_graph import MockGraphServer
+from fake_wintuner import install_shim
+
+SCENARIOS = ('startup', 'pagination', 'check', 'batch', 'report')
+STARTUP_BUDGETS_MS = { # Median wall time of a fresh interpreter, including interpreter start-up
+    "cli_help": 250,
+    "catalog_lookup": 300,
+    "import_publish_installer": 900,
+}
+STARTUP_COMMANDS = {
+    "cli_help": [str(REPO_DIR / "automattuner.py"), "--help"],
+    "catalog_lookup": [str(REPO_DIR / "automattuner.py"), "catalog", "lookup", "Mozilla.Firefox"],
+    "import_publish_installer": ["-c", "import publish_installer"],
+}
+LAZY_MODULES = ("colorama", "alive_progress", "publish_installer", "graph_auth", "http_client", "sqlite3")
+
+def percentiles(samples_ms):
+    """Latency summary of a list of millisecond samples (nearest-rank percentiles)."""
+    if not samples_ms:
+        return {"samples": 0}
+    ordered = sorted(samples_ms)
+    def rank(fraction):
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))], 2)
+    return {"samples": len(ordered), "p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99),
+            "max_ms": round(ordered[-1], 2), "mean_ms": round(sum(ordered) / len(ordered), 2)}
+
+def timed(function, *args, **kwargs):
+    """(result, elapsed ms) of one call."""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+def make_config(work_dir, server, args):
+    work_dir = Path(work_dir)
+    config = {
+        "intune_tenant_id": "mock-tenant", "intune_client_id": "mock-client", "intune_client_secret": "mock-secret",
+        "wintuner_download_dir": str(work_dir / "downloads"), "log_dir": str(work_dir / "logs"),
+        "inventory_db": str(work_dir / "inventory.db"), "publish_ledger_db": str(work_dir / "ledger.db"),
+        "journal_dir": str(work_dir / "journals"), "graph_url": server.url, "login_url": server.url,
+        "max_workers": args.workers, "token_background_refresh": False,
+    }
+    if args.rate_limit:
+        config.update(graph_rate_limit=args.rate_limit, graph_burst=int(args.rate_limit * 2))
+    for key in ("wintuner_download_dir", "log_dir"):
+        Path(config[key]).mkdir(parents=True, exist_ok=True)
+    return config
+
+def apply_config(config):
+    from http_client import configure as configure_http_client
+    from graph_throttle import configure as configure_graph_throttle
+    configure_http_client(config)
+    configure_graph_throttle(config)
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Swallow the tool's console output while a scenario runs."""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def server_stats(server, before):
+    return {key: value - before.get(key, 0) for key, value in server.counters.items()}
+
+###############################################################################
+## Scenarios
+###############################################################################
+def bench_startup(args, server, work_dir):
+    results, failures = {}, []
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(REPO_DIR), os.environ.get('PYTHONPATH', '')]))
+    for name, command in STARTUP_COMMANDS.items():
+        samples = []
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable, *command], cwd=REPO_DIR, env=env, capture_output=True)
+            samples.append((time.perf_counter() - started) * 1000)
+            if completed.returncode != 0:
+                results[name] = {"skipped": completed.stderr.decode('utf-8', 'replace').strip().splitlines()[-1:]}
+                break
+        else:
+            results[name] = dict(percentiles(samples), budget_ms=STARTUP_BUDGETS_MS[name])
+            if results[name]["p50_ms"] > STARTUP_BUDGETS_MS[name]:
+                failures.append(f"{name}: median {results[name]['p50_ms']} ms > budget {STARTUP_BUDGETS_MS[name]} ms")
+
+    # Modules the CLI must not import before a subcommand needs them
+    probe = (f"import runpy, sys\nsys.argv = ['automattuner', '--help']\n"
+             f"try:\n    runpy.run_path({str(REPO_DIR / 'automattuner.py')!r}, run_name='__main__')\nexcept SystemExit:\n    pass\n"
+             "print(','.join(sorted({name.split('.')[0] for name in sys.modules})), file=sys.stderr)")
+    completed = subprocess.run([sys.executable, "-c", probe], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    loaded = set(completed.stderr.strip().splitlines()[-1].split(",")) if completed.stderr.strip() else set()
+    eager = sorted(loaded.intersection(LAZY_MODULES))
+    results["cli_help_eager_imports"] = eager
+    if eager:
+        failures.append(f"cli --help imports {', '.join(eager)}")
+    return results, failures
+
+def bench_pagination(args, server, work_dir):
+    from graph_auth import get_access_token
+    from intune_inventory import get_intune_apps
+    config = make_config(work_dir, server, args)
+    apply_config(config)
+    token = get_access_token(config)
+    before = dict(server.counters)
+    samples, count = [], 0
+    with quiet(not args.verbose):
+        for _ in range(args.runs):
+            apps, elapsed = timed(get_intune_apps, token)
+            samples.append(elapsed)
+            count = len(apps or [])
+    summary = percentiles(samples)
+    return dict(summary, apps=count, apps_per_second=round(count / (summary["p50_ms"] / 1000), 1) if count else 0,
+                server=server_stats(server, before)), []
+
+def bench_check(args, server, work_dir):
+    import publish_installer
+    from winget_catalog import open_catalog
+    config = make_config(work_dir, server, args)
+    apply_config(config)
+    before = dict(server.counters)
+    with quiet(not args.verbose):
+        app_index, index_ms = timed(publish_installer.build_app_index, config)
+    catalog = open_catalog(config)
+    package_ids = [entry['PackageId'] for _, entry in zip(range(args.checks), catalog.prefix_scan(""))]
+    samples, matched = [], 0
+    for package_id in package_ids:
+        matches, elapsed = timed(publish_installer.check_intune_app_report_based, package_id, config, app_index=app_index)
+        samples.append(elapsed)
+        matched += bool(matches)
+    summary = percentiles(samples)
+    return dict(summary, index_build_ms=round(index_ms, 2), checks=len(package_ids), matched=matched,
+                checks_per_second=round(len(samples) / (sum(samples) / 1000), 1) if samples and sum(samples) else None,
+                server=server_stats(server, before)), []
+
+def bench_batch(args, server, work_dir):
+    import publish_installer
+    from winget_catalog import open_catalog
+    config = make_config(work_dir, server, args)
+    apply_config(config)
+    bin_dir = install_shim(Path(work_dir) / "bin")
+    os.environ['PATH'] = str(bin_dir) + os.pathsep + os.environ.get('PATH', '')
+    os.environ['AUTOMATTUNER_GRAPH_URL'] = server.url # fake wintuner publish creates the app in the mock tenant
+    os.environ.setdefault('FAKE_WINTUNER_PACKAGE_SECONDS', str(args.package_seconds))
+    os.environ.setdefault('FAKE_WINTUNER_PUBLISH_SECONDS', str(args.publish_seconds))
+    catalog = open_catalog(config)
+    package_ids = [entry['PackageId'] for _, entry in zip(range(args.batch_apps), catalog.prefix_scan("Mozilla"))]
+    package_ids += [entry['PackageId'] for _, entry in zip(range(args.batch_apps - len(package_ids)), catalog.prefix_scan("Microsoft"))]
+
+    results = {}
+    for label in ("cold", "warm"): # warm: every package is cached and already published (ledger)
+        jobs = publish_installer.make_app_jobs(package_ids, None, 'x64', 'system', check=True, publish='always')
+        before = dict(server.counters)
+        with quiet(not args.verbose):
+            batch_results, elapsed = timed(publish_installer.run_batch_pipeline, jobs, config)
+        results[label] = {"apps": len(jobs), "total_ms": round(elapsed, 2),
+                          "apps_per_minute": round(len(jobs) / (elapsed / 60000), 1),
+                          "outcome": {bucket: len(batch_results[bucket]) for bucket in ("success", "unchanged", "failed_pkg", "failed_pub", "skipped")},
+                          "server": server_stats(server, before)}
+    return results, []
+
+def bench_report(args, server, work_dir):
+    work_dir = Path(work_dir)
+    config = make_config(work_dir, server, args)
+    (work_dir / "config.json").write_text(json.dumps(config), encoding='utf-8')
+    env = dict(os.environ, AUTOMATTUNER_GRAPH_URL=server.url, AUTOMATTUNER_LOGIN_URL=server.url)
+    output = work_dir / "report.jsonl"
+    samples = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, str(REPO_DIR / "Report.py"), "--format", "jsonl", "--output", str(output)],
+                                   cwd=work_dir, env=env, capture_output=True)
+        samples.append((time.perf_counter() - started) * 1000)
+        if completed.returncode != 0:
+            return {"skipped": completed.stderr.decode('utf-8', 'replace').strip().splitlines()[-1:]}, []
+    rows = sum(1 for _ in open(output, 'r', encoding='utf-8')) if output.exists() else 0
+    return {"rows": rows, "first_run_ms": round(samples[0], 2), "warm": percentiles(samples[1:])}, []
+
+###############################################################################
+## Runner
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tool against a local mock Graph server and a fake wintuner.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}.")
+    parser.add_argument("--apps", type=int, default=2000, help="Apps in the mock tenant.")
+    parser.add_argument("--page-size", type=int, default=999)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Added latency per mock Graph request.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth mock Graph request with 429.")
+    parser.add_argument("--rate-limit", type=float, help="graph_rate_limit for the run (default: the tool's default).")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions of the pagination / report scenarios.")
+    parser.add_argument("--startup-runs", type=int, default=7)
+    parser.add_argument("--checks", type=int, default=500, help="PackageIds checked in the check scenario.")
+    parser.add_argument("--batch-apps", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="max_workers for the batch scenario.")
+    parser.add_argument("--package-seconds", type=float, default=0.5)
+    parser.add_argument("--publish-seconds", type=float, default=0.3)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--verbose", action="store_true", help="Show the tool's console output.")
+    args = parser.parse_args(argv)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected).difference(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    server = MockGraphServer(args.apps, args.latency_ms, args.throttle_every, page_size=args.page_size).start()
+    document = {"python": platform.python_version(), "platform": platform.platform(),
+                "settings": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+                "scenarios": {}, "budget_failures": []}
+    try:
+        for name in selected:
+            with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as work_dir:
+                print(f"Running {name}...", file=sys.stderr)
+                try:
+                    result, failures = globals()[f"bench_{name}"](args, server, work_dir)
+                except ImportError as e: # e.g. colorama / alive_progress not installed
+                    result, failures = {"skipped": f"missing dependency: {e.name}"}, []
+                document["scenarios"][name] = result
+                document["budget_failures"].extend(failures)
+    finally:
+        server.stop()
+
+    text = json.dumps(document, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding='utf-8')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    for failure in document["budget_failures"]:
+        print(f"BUDGET EXCEEDED: {failure}", file=sys.stderr)
+    return 1 if document["budget_failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+##
+## Typo-tolerant search over the winget catalog (PackageId and Name).
+##
+## A trigram index is built in memory over the case-folded PackageId and Name of every
+## catalog entry (one pass, ~100 ms for the bundled catalog; shared per process and
+## rebuilt when the compiled catalog is). A query is split into the same trigrams, the
+## entries sharing the most trigrams are scored with the Dice coefficient, and the best
+## candidates are re-ranked by that score averaged with their PackageId edit similarity,
+## so 'Mozila.Firefx' or 'firefox' answer in a few milliseconds.
+##
+## resolve_package_id() is the batch-input check: an ID found in the catalog resolves
+## to its canonical spelling, a typo with a single close match (at most
+## AUTO_RESOLVE_DISTANCE edits, no rival within one more edit) is corrected
+## automatically, anything else comes back with ranked suggestions.
+##
+
+import heapq
+import threading
+from winget_catalog import open_catalog
+
+CANDIDATES_PER_RESULT = 4 # Trigram candidates re-ranked by edit distance per requested result
+MIN_SIMILARITY = 0.25 # Dice coefficient below which an entry is not a candidate
+MIN_SCORE = 0.3 # Final score below which a candidate is not a result
+AUTO_RESOLVE_DISTANCE = 2 # Max. edits for an automatic correction (fewer for short IDs, see CatalogSearch.resolve)
+
+def trigrams(text):
+    """Set of case-folded character trigrams of text, padded so short words and word starts count."""
+    padded = f"  {(text or '').casefold()} "
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+def edit_distance(left, right):
+    """Optimal string alignment distance (insert / delete / substitute / swap adjacent characters)."""
+    if left == right:
+        return 0
+    previous_row = None
+    row = list(range(len(right) + 1))
+    for i in range(1, len(left) + 1):
+        before_previous, previous_row, row = previous_row, row, [i] + [0] * len(right)
+        for j in range(1, len(right) + 1):
+            cost = left[i - 1] != right[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and cost and left[i - 1] == right[j - 2] and left[i - 2] == right[j - 1]:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+    return row[-1]
+
+class CatalogSearch:
+    """Trigram index over a CatalogIndex (catalog positions are the document ids)."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.id_postings = {} # trigram -> [position] for PackageIds
+        self.name_postings = {} # trigram -> [position] for Names
+        self.id_sizes = []
+        self.name_sizes = []
+        for position in range(len(catalog)):
+            entry = catalog.entry(position)
+            for postings, sizes, text in ((self.id_postings, self.id_sizes, entry['PackageId']), (self.name_postings, self.name_sizes, entry['Name'])):
+                grams = trigrams(text)
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(position)
+
+    def _scores(self, query_grams):
+        """{position: Dice similarity} of every entry sharing a trigram with the query (best of id / name)."""
+        scores = {}
+        for postings, sizes in ((self.id_postings, self.id_sizes), (self.name_postings, self.name_sizes)):
+            shared = {}
+            for gram in query_grams:
+                for position in postings.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            for position, count in shared.items():
+                score = 2.0 * count / (len(query_grams) + sizes[position])
+                if score > scores.get(position, 0.0):
+                    scores[position] = score
+        return scores
+
+    def search(self, query, limit=10):
+        """Ranked catalog matches for query: list of dicts (PackageId, Name, Version, score, distance).
+
+        score averages the trigram similarity (PackageId or Name) with the edit similarity of
+        the PackageId; distance is the edit distance between the query and the PackageId
+        (case-insensitive). Results are ordered by score.
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        scores = self._scores(trigrams(query))
+        candidates = heapq.nlargest(limit * CANDIDATES_PER_RESULT, ((score, position) for position, score in scores.items() if score >= MIN_SIMILARITY))
+        folded_query = query.casefold()
+        results = []
+        for similarity, position in candidates:
+            entry = self.catalog.entry(position)
+            distance = edit_distance(folded_query, entry['PackageId'].casefold())
+            entry["score"] = round((similarity + 1.0 - distance / max(len(folded_query), len(entry['PackageId']))) / 2, 3)
+            entry["distance"] = distance
+            if entry["score"] >= MIN_SCORE:
+                results.append(entry)
+        results.sort(key=lambda entry: (-entry['score'], entry['distance'], entry['PackageId'].casefold()))
+        return results[:limit]
+
+    def resolve(self, package_id, limit=5):
+        """(resolved PackageId or None, suggestions). See resolve_package_id."""
+        entry = self.catalog.lookup(package_id)
+        if entry:
+            return entry['PackageId'], []
+        suggestions = self.search(package_id, limit=limit)
+        max_distance = min(AUTO_RESOLVE_DISTANCE, max(1, len(package_id) // 5)) # 'Git.Gt' may fix one edit, never two
+        closest = sorted(suggestions, key=lambda entry: entry['distance'])[:2]
+        if closest and closest[0]['distance'] <= max_distance:
+            if len(closest) == 1 or closest[1]['distance'] > closest[0]['distance'] + 1: # No rival within one more edit
+                return closest[0]['PackageId'], suggestions
+        return None, suggestions
+
+_searches = {}
+_searches_lock = threading.Lock()
+
+def get_catalog_search(config=None):
+    """The shared CatalogSearch of the configured catalog (rebuilt when the catalog is)."""
+    catalog = open_catalog(config)
+    with _searches_lock:
+        search = _searches.get(id(catalog))
+        if search is None or search.catalog is not catalog:
+            search = _searches[id(catalog)] = CatalogSearch(catalog)
+        return search
+
+def resolve_package_id(package_id, config=None):
+    """Check a typed PackageId against the catalog.
+
+    Returns (resolved, suggestions): resolved is the catalog's spelling of the ID (exact
+    case-insensitive match, suggestions empty) or of its unambiguous correction
+    (suggestions non-empty), or None with the ranked suggestions (possibly none).
+    """
+    return get_catalog_search(config).resolve(package_id)
@@ -0,0 +1,66 @@
+##
+## Shared console helpers for the Intune packaging scripts.
+##
+## Output from pipeline worker threads and background token refreshes goes through
+## these helpers so that lines from different apps never interleave. While a thread
+## asks the user something (hold_output / console_input), the other threads' lines are
+## held back and printed once the answer is in; those threads keep working meanwhile.
+##
+
+import threading
+from contextlib import contextmanager
+from colorama import Fore, Style
+
+console_lock = threading.RLock() # Serializes console output across threads (re-entrant for nested prints)
+_holder = None # Thread asking the user something; other threads' lines wait in _held_lines
+_hold_depth = 0
+_held_lines = []
+
+def _emit(message):
+    """Print a line now, or keep it for later while another thread holds the output (caller holds console_lock)."""
+    if _holder is not None and _holder is not threading.current_thread():
+        _held_lines.append(message)
+    else:
+        print(message, flush=True)
+
+def console_print(message):
+    """Print one complete line without interleaving with other pipeline threads."""
+    with console_lock:
+        _emit(message)
+
+def error_msg(step, error):
+    """Print a formatted error message."""
+    lines = [f"\n{Fore.RED}{Style.BRIGHT}❌ Error during {step}:{Style.RESET_ALL}"]
+    lines.extend(f"  {Fore.YELLOW}{line}" for line in str(error).splitlines())
+    with console_lock:
+        for line in lines:
+            _emit(line)
+
+@contextmanager
+def hold_output():
+    """Hold back the console_print lines of other threads for the duration of the block.
+
+    For prompts: the question (and what it is about) stays together and the typed answer
+    is not split by worker output. The console lock is not held meanwhile, so other
+    threads never wait for the user; their lines are printed when the block ends.
+    """
+    global _holder, _hold_depth
+    with console_lock:
+        _holder = threading.current_thread()
+        _hold_depth += 1
+    try:
+        yield
+    finally:
+        with console_lock:
+            _hold_depth -= 1
+            if _hold_depth == 0:
+                _holder = None
+                held = _held_lines[:]
+                del _held_lines[:]
+                for line in held:
+                    print(line, flush=True)
+
+def console_input(question):
+    """input() while the other threads' output is held back (see hold_output)."""
+    with hold_output():
+        return input(question)
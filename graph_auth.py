@@ -0,0 +1,250 @@
+##
+## Shared Microsoft Graph access token provider (client credentials).
+##
+## publish_installer.py and Report.py both call get_access_token(config). Tokens are
+## cached per (tenant, client id) until shortly before they expire, optionally mirrored
+## to a permission-restricted file on disk so the next run can reuse them, and refreshed
+## in the background before expiry so long batches never block on a token round-trip.
+## A token Graph rejects with 401 before it expires (revoked, or a stale disk-cached one)
+## is dropped and renewed once, and the request is retried (renew_rejected_token).
+##
+## Optional config keys:
+##   "token_cache_file":         path of the on-disk token cache (disabled when not set)
+##   "token_refresh_margin":     seconds before expiry at which a token is renewed (default 300)
+##   "token_background_refresh": renew proactively on a background timer (default true)
+##
+
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.error
+from pathlib import Path
+from console import error_msg
+from http_client import login_url
+from graph_throttle import graph_request, set_unauthorized_handler, token_tenant
+from telemetry import count, span
+
+DEFAULT_REFRESH_MARGIN = 300 # Renew tokens 5 minutes before 'expires_in' runs out
+RETRY_REFRESH_DELAY = 30 # Background refresh retry delay after a failed attempt
+
+###############################################################################
+## Token Endpoint Request
+###############################################################################
+def request_access_token(config):
+    """Request a new token from the token endpoint. Returns (access_token, expires_in) or (None, 0)."""
+    try:
+        tenant_id = config['intune_tenant_id']
+        client_id = config['intune_client_id']
+        client_secret = config['intune_client_secret'] # Ensure this is handled securely
+
+        url = login_url(f"/{tenant_id}/oauth2/v2.0/token")
+        data = urllib.parse.urlencode({
+            'grant_type': 'client_credentials',
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'scope': 'https://graph.microsoft.com/.default' # Scope for client credentials
+        }).encode('utf-8')
+
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        # Client-credential token requests have no side effects, so throttled ones may be retried
+        with graph_request('POST', url, headers=headers, body=data, timeout=30, idempotent=True) as response:
+            if response.status == 200:
+                result = json.loads(response.read().decode('utf-8'))
+                if "access_token" in result:
+                    return result['access_token'], int(result.get('expires_in', 3599))
+                else:
+                    error_msg("MSAL Authentication Error (Token not found)", result.get("error_description", "No error description provided."))
+                    return None, 0
+            else:
+                 error_body = "N/A"
+                 try: # Try reading body
+                     error_body = response.read().decode('utf-8', errors='replace')
+                 except Exception: pass
+                 error_msg("MSAL Authentication Error", f"HTTP Status {response.status}, Body: {error_body}")
+                 return None, 0
+
+    except urllib.error.HTTPError as e:
+        error_body = "N/A"
+        try:
+            error_body = e.read().decode('utf-8', errors='replace') # Try reading the body
+        except Exception:
+            pass # Ignore if reading fails
+        error_msg("MSAL Authentication HTTP Error", f"Code: {e.code}, Reason: {e.reason}\nResponse Body: {error_body}")
+        return None, 0
+    except urllib.error.URLError as e:
+        error_msg("MSAL Authentication Network Error", str(e.reason))
+        return None, 0
+    except Exception as e:
+        error_msg("MSAL Authentication Exception", str(e))
+        return None, 0
+
+###############################################################################
+## Cached Token Provider
+###############################################################################
+class TokenProvider:
+    """Caches one client-credentials token in memory (and optionally on disk) until it nears expiry."""
+
+    def __init__(self, config):
+        self.config = config
+        self.tenant_id = config['intune_tenant_id']
+        self.client_id = config['intune_client_id']
+        self.refresh_margin = int(config.get('token_refresh_margin', DEFAULT_REFRESH_MARGIN))
+        self.background_refresh = bool(config.get('token_background_refresh', True))
+        cache_file = config.get('token_cache_file')
+        self.cache_path = Path(cache_file) if cache_file else None
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0 # Wall-clock time so disk-cached tokens stay meaningful across runs
+        self._timer = None
+        self.fetch_count = 0 # Number of token endpoint round-trips (useful for diagnostics)
+        self._load_disk_cache()
+
+    def get_token(self):
+        """Return a valid access token, fetching a new one only when the cached one is (nearly) expired."""
+        with self._lock:
+            if self._is_fresh():
+                return self._token
+            return self._refresh_locked()
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Graph rejected it with HTTP 401."""
+        with self._lock:
+            self._invalidate_locked()
+
+    def renew(self, rejected_token):
+        """Return a new token after Graph rejected rejected_token with HTTP 401.
+
+        If another request already renewed it, the current token is returned without a
+        second token endpoint round-trip. None if no new token could be fetched.
+        """
+        with self._lock:
+            if self._token != rejected_token and self._is_fresh():
+                return self._token
+            self._invalidate_locked()
+            return self._refresh_locked()
+
+    def _invalidate_locked(self):
+        self._token = None
+        self._expires_at = 0.0
+        if self.cache_path:
+            try:
+                self.cache_path.unlink()
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop the background refresh timer."""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def _refresh_locked(self):
+        with span("token.fetch", tenant=self.tenant_id) as fetch_span:
+            token, expires_in = request_access_token(self.config)
+            if not token:
+                fetch_span.error("no token")
+        self.fetch_count += 1
+        if not token:
+            return None
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        self._save_disk_cache()
+        self._schedule_refresh(self._expires_at - self.refresh_margin - time.time())
+        return token
+
+    def _schedule_refresh(self, delay):
+        if not self.background_refresh:
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 1.0), self._background_refresh)
+        self._timer.daemon = True # Never keep the process alive just to renew a token
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            self._timer = None
+            if self._refresh_locked() is None and self._token and time.time() < self._expires_at:
+                # Current token is still usable: try again shortly instead of giving up
+                self._schedule_refresh(min(RETRY_REFRESH_DELAY, self._expires_at - time.time()))
+
+    def _load_disk_cache(self):
+        if not self.cache_path or not self.cache_path.is_file():
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('tenant_id') != self.tenant_id or cached.get('client_id') != self.client_id:
+                return # Cache belongs to another app registration
+            self._token = cached['access_token']
+            self._expires_at = float(cached['expires_at'])
+            if self._is_fresh():
+                self._schedule_refresh(self._expires_at - self.refresh_margin - time.time())
+        except (OSError, ValueError, KeyError):
+            self._token = None # Unreadable or corrupt cache: simply fetch a new token
+            self._expires_at = 0.0
+
+    def _save_disk_cache(self):
+        if not self.cache_path:
+            return
+        payload = {
+            "tenant_id": self.tenant_id,
+            "client_id": self.client_id,
+            "access_token": self._token,
+            "expires_at": self._expires_at
+        }
+        temp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Create the file owner-read/write only (0600) before any secret is written to it
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.chmod(temp_path, 0o600) # Enforce mode even if the temp file already existed
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            error_msg("Writing token cache", f"{self.cache_path}: {e}")
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_token_provider(config):
+    """Return the process-wide TokenProvider for the tenant/client in config."""
+    key = (config['intune_tenant_id'], config['intune_client_id'])
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = TokenProvider(config)
+        return provider
+
+def renew_rejected_token(token):
+    """graph_throttle's 401 handler: a new token from the provider that issued token, or None.
+
+    The provider is the one holding token, else the one of its tenant ('tid' claim).
+    """
+    tenant = token_tenant(f"Bearer {token}")
+    with _providers_lock:
+        providers = list(_providers.values())
+    provider = (next((provider for provider in providers if provider._token == token), None)
+                or next((provider for provider in providers if tenant and provider.tenant_id == tenant), None))
+    if provider is None:
+        return None
+    count("token.renewals")
+    return provider.renew(token)
+
+set_unauthorized_handler(renew_rejected_token)
+
+def get_access_token(config):
+    """Get access token for Microsoft Graph API using client credentials (cached, shared)."""
+    count("token.requests") # Cache hits included; only actual fetches are "token.fetch" spans
+    try:
+        return get_token_provider(config).get_token()
+    except KeyError as e:
+        error_msg("MSAL Authentication Exception", f"Missing configuration key: {e}")
+        return None
@@ -0,0 +1,141 @@
+##
+## Microsoft Graph JSON $batch engine.
+##
+## Many small writes (e.g. one assignment per app and group) are sent as POST /v1.0/$batch
+## envelopes of up to 20 sub-requests instead of one round-trip each. Graph answers every
+## sub-request separately, so a batch can partly fail:
+##   - 2xx sub-responses are done
+##   - 429 / 503 sub-responses (and envelopes rejected with 429 / 503, where nothing ran)
+##     are collected and sent again in new batches after Retry-After or a jittered
+##     exponential backoff, up to graph_max_retries times; so are other 5xx answers
+##     to reads
+##   - a write answered with another 5xx may have been applied anyway: it is not sent
+##     again but returned as "uncertain", for the caller to check the resource first
+##     (see app_assignments.assign_apps); the same goes for envelopes that failed
+##     without telling which sub-requests ran
+##   - any other status is a final failure of that item only
+## Envelopes go through graph_request, so they share the per-host rate limiter, and
+## throttled sub-requests slow that limiter down like a throttled single request would.
+##
+
+import json
+import time
+import urllib.error
+from graph_auth import get_access_token
+from graph_throttle import (IDEMPOTENT_METHODS, RETRY_STATUSES, THROTTLE_STATUSES, backoff_delay, get_max_retries,
+                            get_rate_limiter, graph_request, limiter_key, parse_retry_after)
+from http_client import graph_url
+
+MAX_BATCH_SIZE = 20 # Graph rejects $batch envelopes with more sub-requests
+
+def chunked(items, size=MAX_BATCH_SIZE):
+    """Split a list into consecutive lists of at most size items."""
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+def error_text(status, body):
+    """Readable error of a failed sub-response: Graph's error message if there is one."""
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        error = body['error']
+        return f"HTTP {status}: {error.get('code', '')} {error.get('message', '')}".strip()
+    return f"HTTP {status}"
+
+def post_batch(token, sub_requests, version="v1.0"):
+    """Send one $batch envelope. Returns {sub-request id: sub-response dict}.
+
+    sub_requests are Graph $batch request dicts ({"id", "method", "url", "body"}; url
+    relative to the version, e.g. "/deviceAppManagement/mobileApps/{id}/assignments").
+    Raises urllib.error.HTTPError / URLError if the envelope itself fails.
+    """
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json", "Accept": "application/json"}
+    payload = json.dumps({"requests": sub_requests}).encode('utf-8')
+    # Not idempotent as a whole: the sub-requests may be writes, retries are done per item below
+    with graph_request('POST', graph_url(f"/{version}/$batch"), headers=headers, body=payload, timeout=60, idempotent=False) as response:
+        result = json.loads(response.read().decode('utf-8'))
+    return {str(item.get('id')): item for item in result.get('responses', [])}
+
+def execute_batch(config, requests, version="v1.0", max_retries=None):
+    """Run requests ({"method", "url", "body", "headers"}) through $batch envelopes.
+
+    Returns one result per request, in input order: {"status": int or None, "body",
+    "error": None on success, else a message}. Only throttled / failed-transiently
+    items are retried; items that succeeded are never sent twice. A failed write that
+    may still have been applied is not retried and its result has "uncertain": True.
+    """
+    max_retries = get_max_retries() if max_retries is None else max_retries
+    # The envelopes' limiter: per tenant when several tenants are configured (graph_throttle.limiter_key)
+    limiter = get_rate_limiter(limiter_key(graph_url("/"), {"Authorization": f"Bearer {get_access_token(config)}"}))
+    results = [None] * len(requests)
+    pending = list(range(len(requests)))
+    attempt = 0
+
+    while pending:
+        retry, retry_after = [], None
+        for chunk in chunked(pending):
+            token = get_access_token(config) # Cached; renewed in the background during long runs
+            if not token:
+                for index in chunk:
+                    results[index] = {"status": None, "body": None, "error": "No access token available."}
+                continue
+            sub_requests = []
+            for index in chunk:
+                request = requests[index]
+                sub_request = {"id": str(index), "method": request['method'], "url": request['url']}
+                if request.get('body') is not None:
+                    sub_request['body'] = request['body']
+                    sub_request['headers'] = dict({"Content-Type": "application/json"}, **request.get('headers', {}))
+                elif request.get('headers'):
+                    sub_request['headers'] = request['headers']
+                sub_requests.append(sub_request)
+
+            try:
+                responses = post_batch(token, sub_requests, version=version)
+            except urllib.error.HTTPError as e:
+                if e.code in THROTTLE_STATUSES: # The envelope was rejected before any sub-request ran
+                    retry.extend(chunk)
+                    delay = parse_retry_after(e.headers.get('Retry-After')) if e.headers else None
+                    if delay is not None:
+                        retry_after = max(retry_after or 0, delay)
+                    continue
+                for index in chunk:
+                    results[index] = {"status": e.code, "body": None, "error": f"$batch request failed: HTTP {e.code} {e.reason}", "uncertain": e.code >= 500}
+                continue
+            except (urllib.error.URLError, ValueError) as e:
+                # Unknown which sub-requests ran: report them as failed instead of risking duplicate writes
+                for index in chunk:
+                    results[index] = {"status": None, "body": None, "error": f"$batch request failed: {e}", "uncertain": True}
+                continue
+
+            for index in chunk:
+                response = responses.get(str(index))
+                if response is None:
+                    results[index] = {"status": None, "body": None, "error": "No response for this item in the $batch result."}
+                    continue
+                status = int(response.get('status', 0))
+                body = response.get('body')
+                if 200 <= status < 300:
+                    results[index] = {"status": status, "body": body, "error": None}
+                    continue
+                results[index] = {"status": status, "body": body, "error": error_text(status, body)}
+                if status in RETRY_STATUSES and status not in THROTTLE_STATUSES and requests[index]['method'].upper() not in IDEMPOTENT_METHODS:
+                    results[index]["uncertain"] = True # A 500 / 502 / 504 write may have been applied: never resent blindly
+                elif status in RETRY_STATUSES:
+                    retry.append(index)
+                    response_headers = {key.lower(): value for key, value in (response.get('headers') or {}).items()}
+                    delay = parse_retry_after(response_headers.get('retry-after'))
+                    if status in THROTTLE_STATUSES:
+                        limiter.on_throttle(delay)
+                    if delay is not None:
+                        retry_after = max(retry_after or 0, delay)
+
+        if not retry or attempt >= max_retries:
+            break # Items still in retry keep their last error
+        for _ in retry:
+            limiter.count("retries")
+        time.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+        attempt += 1
+        pending = sorted(retry)
+
+    for index, result in enumerate(results):
+        if result is None: # Throttled envelope on the last attempt
+            results[index] = {"status": 429, "body": None, "error": "$batch request still throttled after retries."}
+    return results
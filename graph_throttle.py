@@ -0,0 +1,301 @@
+##
+## Throttling-aware request layer for Microsoft Graph and the token endpoint.
+##
+## Parallel reports and checks make Graph answer 429 / 503 with Retry-After. Every
+## request goes through a per-host AdaptiveRateLimiter:
+##   - a token bucket caps the request rate (graph_rate_limit requests/s, graph_burst)
+##   - the number of requests in flight adapts AIMD-style: +1 slot per window of
+##     successful requests up to graph_max_concurrency, halved on every throttle
+##   - Retry-After pauses all requests to that host, not just the throttled one
+##   - idempotent requests (GET, or callers passing idempotent=True) are retried on
+##     429 / 5xx / network errors with jittered exponential backoff (graph_max_retries)
+## Counters (requests, throttled, retries, failures, seconds waited) are kept per host
+## and summarized by format_throttle_stats(); each request is also a "graph.request" span
+## (telemetry.py) carrying its status and retry count.
+##
+## Graph throttles per app and tenant. With several tenants configured (tenants.py, or
+## graph_throttle_per_tenant), each tenant gets its own limiter per host ("host (tenant id)"),
+## so a tenant that is being throttled does not slow down the others. The tenant is the
+## 'tid' claim of the bearer token, or the tenant segment of a token endpoint URL.
+##
+## A request whose bearer token is rejected with 401 (revoked, or a stale disk-cached
+## token) is sent once more with a renewed token from the registered unauthorized
+## handler (graph_auth.renew_rejected_token), whatever its method.
+##
+
+import base64
+import email.utils
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+from functools import lru_cache
+from http_client import get_http_client
+from telemetry import span
+
+DEFAULT_RATE_LIMIT = 10.0 # Requests per second per host
+DEFAULT_BURST = 20
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0 # Seconds, doubled per attempt
+BACKOFF_CAP = 60.0
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_settings = {
+    "rate": DEFAULT_RATE_LIMIT,
+    "burst": DEFAULT_BURST,
+    "max_concurrency": DEFAULT_MAX_CONCURRENCY,
+    "max_retries": DEFAULT_MAX_RETRIES,
+    "per_tenant": False
+}
+
+def configure(config):
+    """Apply the graph_rate_limit / graph_burst / graph_max_concurrency / graph_max_retries config keys."""
+    _settings["rate"] = float(config.get('graph_rate_limit', DEFAULT_RATE_LIMIT))
+    _settings["burst"] = int(config.get('graph_burst', DEFAULT_BURST))
+    _settings["max_concurrency"] = int(config.get('graph_max_concurrency', DEFAULT_MAX_CONCURRENCY))
+    _settings["max_retries"] = int(config.get('graph_max_retries', DEFAULT_MAX_RETRIES))
+    _settings["per_tenant"] = bool(config.get('graph_throttle_per_tenant', bool(config.get('tenants'))))
+    with _limiters_lock:
+        for limiter in _limiters.values():
+            limiter.reconfigure(_settings["rate"], _settings["burst"], _settings["max_concurrency"])
+
+def get_max_retries():
+    """Configured number of retries of a throttled / failed request (graph_max_retries)."""
+    return _settings["max_retries"]
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Jittered exponential backoff: half the delay is fixed, half random, so retries spread out."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+###############################################################################
+## Rate Limiter
+###############################################################################
+class AdaptiveRateLimiter:
+    """Token bucket plus AIMD concurrency limit for one host. Thread-safe."""
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self._cond = threading.Condition()
+        self.reconfigure(rate, burst, max_concurrency)
+        self.tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self.concurrency = float(min(4, self.max_concurrency)) # Start conservative, grow on success
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.counters = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0, "waited_seconds": 0.0}
+
+    def reconfigure(self, rate, burst, max_concurrency):
+        with self._cond:
+            self.rate = max(0.1, rate)
+            self.burst = max(1, burst)
+            self.max_concurrency = max(1, max_concurrency)
+            if getattr(self, 'concurrency', 0) > self.max_concurrency:
+                self.concurrency = float(self.max_concurrency)
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self):
+        """Block until a request may be sent (a bucket token and a concurrency slot are free)."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    has_slot = self.in_flight < int(self.concurrency)
+                    if has_slot and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        self.counters["requests"] += 1
+                        self.counters["waited_seconds"] += time.monotonic() - started
+                        return
+                    # No token: wait for the next one. No slot: wait for a release (notify)
+                    wait = (1 - self.tokens) / self.rate if has_slot else None
+                self._cond.wait(wait)
+
+    def release(self):
+        """Free the concurrency slot taken by acquire()."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        """Additive increase: about one more slot per window of successful requests."""
+        with self._cond:
+            if self.concurrency < self.max_concurrency:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self._cond.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        """Multiplicative decrease, and pause every request to this host for Retry-After seconds."""
+        with self._cond:
+            self.counters["throttled"] += 1
+            self.concurrency = max(1.0, self.concurrency / 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.tokens = min(self.tokens, 0.0) # Do not burst right after being throttled
+
+    def count(self, counter):
+        with self._cond:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters, concurrency=int(self.concurrency), waited_seconds=round(self.counters["waited_seconds"], 2))
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_unauthorized_handler = None # fn(rejected token) -> new token or None; set by graph_auth
+
+def set_unauthorized_handler(handler):
+    """Register the function renewing a bearer token that Graph answered with 401."""
+    global _unauthorized_handler
+    _unauthorized_handler = handler
+
+def get_rate_limiter(host):
+    """Return the shared limiter of a host, creating it with the configured settings."""
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = AdaptiveRateLimiter(_settings["rate"], _settings["burst"], _settings["max_concurrency"])
+        return limiter
+
+@lru_cache(maxsize=64) # One entry per token: decoded once, not per request
+def token_tenant(authorization):
+    """Tenant id ('tid' claim) of an 'Authorization: Bearer <JWT>' header value, or None."""
+    try:
+        payload = authorization.split(" ", 1)[1].split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))).get('tid')
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def limiter_key(url, headers=None):
+    """Limiter of a request: its host, or "host (tenant id)" while per-tenant throttling is on."""
+    parts = urllib.parse.urlsplit(url)
+    if not _settings["per_tenant"]:
+        return parts.hostname
+    if parts.path.endswith("/oauth2/v2.0/token"):
+        tenant = parts.path.strip("/").split("/", 1)[0]
+    else:
+        tenant = token_tenant((headers or {}).get('Authorization'))
+    return f"{parts.hostname} ({tenant})" if tenant else parts.hostname
+
+def throttle_stats():
+    """Counters of every host (per tenant: "host (tenant id)") contacted so far: {host: {...}}."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.stats() for host, limiter in limiters.items()}
+
+def format_throttle_stats():
+    """One summary line per host, e.g. 'graph.microsoft.com: 120 requests, 3 throttled, 3 retries, 0 failed, waited 12.5s'."""
+    return [f"{host}: {stats['requests']} requests, {stats['throttled']} throttled, {stats['retries']} retries, "
+            f"{stats['failures']} failed, waited {stats['waited_seconds']}s"
+            for host, stats in sorted(throttle_stats().items())]
+
+###############################################################################
+## Throttled Requests
+###############################################################################
+class ThrottledResponse:
+    """Proxy of a PooledResponse that frees the limiter slot when the response is closed."""
+
+    def __init__(self, response, limiter):
+        self._response = response
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def read(self, size=-1):
+        return self._response.read(size)
+
+    def close(self):
+        if self._limiter is not None:
+            self._response.close()
+            self._limiter.release()
+            self._limiter = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def renew_authorization(authorization):
+    """'Bearer <new token>' replacing a rejected 'Bearer <token>' header value, or None."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme != "Bearer" or not token or _unauthorized_handler is None:
+        return None
+    renewed = _unauthorized_handler(token)
+    return f"Bearer {renewed}" if renewed and renewed != token else None
+
+def graph_request(method, url, headers=None, body=None, timeout=None, idempotent=None):
+    """Send a request through the host's rate limiter, retrying throttled / failed idempotent requests.
+
+    Same contract as HttpClient.request: returns a response to use as a context manager,
+    raises urllib.error.HTTPError / URLError once retries are exhausted. A 401 to a bearer
+    token is retried once with a renewed token (set_unauthorized_handler).
+    """
+    host = urllib.parse.urlsplit(url).hostname
+    limiter = get_rate_limiter(limiter_key(url, headers))
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    attempt = 0
+    renewed = False
+    with span("graph.request", method=method.upper(), host=host) as request_span: # Time to response headers, retries included
+        while True:
+            limiter.acquire()
+            try:
+                response = get_http_client().request(method, url, headers=headers, body=body, timeout=timeout)
+            except urllib.error.HTTPError as e:
+                limiter.release()
+                request_span.set(status=e.code)
+                retry_after = parse_retry_after(e.headers.get('Retry-After')) if e.headers else None
+                if e.code in THROTTLE_STATUSES:
+                    limiter.on_throttle(retry_after)
+                if e.code == 401 and not renewed:
+                    renewed = True
+                    authorization = renew_authorization((headers or {}).get('Authorization'))
+                    if authorization: # Not applied with a rejected token, so safe to send again
+                        headers = dict(headers, Authorization=authorization)
+                        limiter.count("retries")
+                        request_span.add(retries=1)
+                        continue
+                if not idempotent or e.code not in RETRY_STATUSES or attempt >= _settings["max_retries"]:
+                    limiter.count("failures")
+                    raise
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            except urllib.error.URLError:
+                limiter.release()
+                if not idempotent or attempt >= _settings["max_retries"]:
+                    limiter.count("failures")
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                limiter.on_success()
+                request_span.set(status=response.status)
+                return ThrottledResponse(response, limiter)
+            attempt += 1
+            limiter.count("retries")
+            request_span.add(retries=1)
+            time.sleep(delay + random.uniform(0, 0.25)) # Jitter so parallel workers do not retry in lockstep
@@ -0,0 +1,261 @@
+##
+## Shared pooled HTTP client for all Graph and token traffic.
+##
+## urllib.request.urlopen opens a new TCP + TLS connection for every request. This
+## client keeps idle keep-alive connections per (scheme, host, port) and reuses them,
+## asks for gzip and decompresses transparently (also when the body is read
+## incrementally), and applies one consistent timeout. Failures are raised as the same
+## urllib.error.HTTPError / URLError exceptions the callers already handle.
+##
+## Endpoints can be redirected to a local stand-in server (tests, benchmarks) with the
+## AUTOMATTUNER_GRAPH_URL / AUTOMATTUNER_LOGIN_URL environment variables or the
+## "graph_url" / "login_url" config keys (environment wins).
+##
+## Measure the effect against any endpoint with:
+##   python http_client.py https://graph.microsoft.com/v1.0/$metadata --requests 20
+##
+
+import argparse
+import http.client
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+DEFAULT_GRAPH_URL = "https://graph.microsoft.com"
+DEFAULT_LOGIN_URL = "https://login.microsoftonline.com"
+DEFAULT_TIMEOUT = 45
+DEFAULT_MAX_IDLE_PER_HOST = 8
+READ_CHUNK_SIZE = 64 * 1024
+
+endpoints = {"graph": DEFAULT_GRAPH_URL, "login": DEFAULT_LOGIN_URL}
+
+def configure(config):
+    """Apply endpoint and timeout settings from config (environment variables take precedence)."""
+    endpoints["graph"] = os.environ.get("AUTOMATTUNER_GRAPH_URL") or config.get('graph_url') or DEFAULT_GRAPH_URL
+    endpoints["login"] = os.environ.get("AUTOMATTUNER_LOGIN_URL") or config.get('login_url') or DEFAULT_LOGIN_URL
+    client = get_http_client()
+    client.timeout = float(config.get('http_timeout', DEFAULT_TIMEOUT))
+    client.max_idle_per_host = int(config.get('http_max_idle_per_host', DEFAULT_MAX_IDLE_PER_HOST))
+
+def graph_url(path):
+    """Absolute Microsoft Graph URL for a path such as '/v1.0/deviceAppManagement/mobileApps'."""
+    return endpoints["graph"].rstrip("/") + path
+
+def login_url(path):
+    """Absolute Microsoft identity platform URL for a path such as '/<tenant>/oauth2/v2.0/token'."""
+    return endpoints["login"].rstrip("/") + path
+
+###############################################################################
+## Responses
+###############################################################################
+class PooledResponse:
+    """Response whose body can be read in chunks; the connection returns to the pool once the body is consumed."""
+
+    def __init__(self, client, pool_key, connection, raw, url):
+        self._client = client
+        self._pool_key = pool_key
+        self._connection = connection
+        self._raw = raw
+        self.url = url
+        self.status = raw.status
+        self.reason = raw.reason
+        self.headers = raw.headers
+        self.wire_bytes = 0 # Body bytes received before decompression
+        content_encoding = (raw.getheader('Content-Encoding') or '').lower()
+        if content_encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif content_encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = None
+        self._pending = b""
+        self._eof = False
+
+    def getheader(self, name, default=None):
+        return self._raw.getheader(name, default)
+
+    def _fill(self):
+        chunk = self._raw.read1(READ_CHUNK_SIZE) if hasattr(self._raw, 'read1') else self._raw.read(READ_CHUNK_SIZE)
+        if not chunk:
+            if self._decompressor:
+                self._pending += self._decompressor.flush()
+            self._eof = True
+            self._raw.close() # Marks the response finished so the connection accepts the next request
+            self._release()
+            return
+        self.wire_bytes += len(chunk)
+        self._pending += self._decompressor.decompress(chunk) if self._decompressor else chunk
+
+    def read(self, size=-1):
+        """Read up to size decompressed bytes (everything if size < 0)."""
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            self._fill()
+        if size < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _release(self):
+        if self._connection is not None:
+            self._client._release(self._pool_key, self._connection, reusable=not self._raw.will_close)
+            self._connection = None
+
+    def close(self):
+        """Finish with the response; an unread body means the connection cannot be reused."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._eof = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+###############################################################################
+## Client
+###############################################################################
+class HttpClient:
+    """Thread-safe HTTP/1.1 client with per-host keep-alive connection pools."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_idle_per_host=DEFAULT_MAX_IDLE_PER_HOST):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {} # (scheme, host, port) -> [connection]
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def _new_connection(self, scheme, host, port, timeout):
+        proxy = None
+        if scheme == 'https' and not urllib.request.proxy_bypass(host):
+            proxy = urllib.request.getproxies().get('https')
+        self.connections_opened += 1
+        if proxy: # CONNECT tunnel through the configured proxy, then TLS to the real host, like urllib does
+            proxy_parts = urllib.parse.urlsplit(proxy if "://" in proxy else "http://" + proxy)
+            connection = http.client.HTTPSConnection(proxy_parts.hostname, proxy_parts.port or 8080, timeout=timeout)
+            connection.set_tunnel(host, port)
+            return connection
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _acquire(self, pool_key, timeout):
+        with self._lock:
+            idle = self._idle.get(pool_key)
+            if idle:
+                connection = idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        return self._new_connection(*pool_key, timeout), False
+
+    def _release(self, pool_key, connection, reusable=True):
+        with self._lock:
+            idle = self._idle.setdefault(pool_key, [])
+            if reusable and len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def request(self, method, url, headers=None, body=None, timeout=None):
+        """Send a request and return a PooledResponse (use it as a context manager).
+
+        Raises urllib.error.HTTPError for status >= 400 and urllib.error.URLError for
+        network failures, exactly like urllib.request.urlopen.
+        """
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        pool_key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        request_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        request_headers.update(headers or {})
+        timeout = timeout or self.timeout
+
+        for attempt in range(2):
+            connection, reused = self._acquire(pool_key, timeout)
+            try:
+                connection.request(method, path, body=body, headers=request_headers)
+                raw = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError) as e:
+                connection.close()
+                if reused and attempt == 0:
+                    continue # The server closed an idle keep-alive connection: retry once on a fresh one
+                raise urllib.error.URLError(e) from e
+            except OSError as e:
+                connection.close()
+                raise urllib.error.URLError(e) from e
+        self.requests_sent += 1
+
+        response = PooledResponse(self, pool_key, connection, raw, url)
+        if response.status >= 400:
+            error_body = response.read()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(error_body))
+        return response
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_http_client():
+    """Return the process-wide shared HttpClient."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+###############################################################################
+## Latency Measurement
+###############################################################################
+def measure_latency(url, requests=20):
+    """Time sequential GETs with a fresh urlopen per request vs. the pooled client. Returns a dict of stats (ms)."""
+    def timed(fetch):
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            fetch()
+            samples.append((time.perf_counter() - started) * 1000)
+        return {"median_ms": round(statistics.median(samples), 2), "p95_ms": round(sorted(samples)[int(len(samples) * 0.95) - 1], 2),
+                "first_ms": round(samples[0], 2)}
+
+    def fetch_urlopen():
+        with urllib.request.urlopen(urllib.request.Request(url), timeout=DEFAULT_TIMEOUT) as response:
+            response.read()
+
+    client = HttpClient()
+    def fetch_pooled():
+        with client.request("GET", url) as response:
+            response.read()
+
+    results = {"url": url, "requests": requests, "urlopen": timed(fetch_urlopen), "pooled": timed(fetch_pooled),
+               "pooled_connections_opened": client.connections_opened}
+    client.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-request latency of urlopen and the pooled client.")
+    parser.add_argument("url")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    import json
+    json.dump(measure_latency(args.url, args.requests), sys.stdout, indent=2)
+    print()
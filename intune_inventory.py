@@ -0,0 +1,422 @@
+##
+## Persistent local Intune app inventory (SQLite) with incremental sync.
+##
+## Instead of listing every object under deviceAppManagement/mobileApps for each report
+## and duplicate check, the inventory is seeded once by a full listing and then kept up
+## to date by fetching only apps whose lastModifiedDateTime is newer than the last sync.
+## Deleted apps are reconciled periodically with a light id-only listing.
+##
+## Optional config keys:
+##   "inventory_db":              SQLite file of the inventory (default "intune_inventory.db")
+##   "inventory_ttl_minutes":     serve the store without any Graph call while younger than this (default 15)
+##   "inventory_reconcile_hours": interval between deletion reconciliations (default 24)
+##   "inventory_refresh":         force a full re-listing on the first sync of this process (--refresh)
+##
+
+import codecs
+import json
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.error
+from datetime import datetime, timedelta, timezone
+from colorama import Fore
+from app_index import exact_name_keys, is_exact_name, name_tokens
+from console import console_print, error_msg
+from graph_auth import get_access_token
+from http_client import graph_url
+from graph_throttle import graph_request
+from telemetry import record_span
+
+DEFAULT_INVENTORY_DB = "intune_inventory.db"
+DEFAULT_TTL_MINUTES = 15
+DEFAULT_RECONCILE_HOURS = 24
+SYNC_OVERLAP = timedelta(minutes=5) # Re-fetch a small window to cover clock skew between us and Graph
+
+_sync_lock = threading.Lock()
+_refreshed_dbs = set() # Databases already force-refreshed in this process (--refresh applies once)
+
+###############################################################################
+## Graph Listing (streamed, projected)
+###############################################################################
+# The only app properties the report, duplicate check and diff use. Everything else
+# (notably the base64 largeIcon) is neither transferred nor kept in memory.
+REPORT_FIELDS = ('id', 'displayName', 'publisher', 'isAssigned', 'lastModifiedDateTime',
+                 'displayVersion', 'committedContentVersion', 'appVersion', 'vppTokenAppleId')
+READ_CHUNK_SIZE = 64 * 1024
+
+class GraphRequestError(Exception):
+    """A Graph listing failed; the details were already reported with error_msg."""
+
+def iter_json_page(response):
+    """Parse one Graph collection page from a response stream.
+
+    Yields ("item", app) for every element of "value" as soon as its bytes have been
+    read, then ("meta", {...}) with the remaining top-level properties such as
+    @odata.nextLink. At most one element is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ""
+    position = 0
+    eof = False
+    meta = {}
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = response.read(READ_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            buffer = buffer[position:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+        return not eof or buffer
+
+    def skip_to(expected):
+        """Skip whitespace and one of the expected characters; returns the character found."""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                char = buffer[position]
+                if char not in expected:
+                    raise ValueError(f"Unexpected {char!r} in Graph response (expected one of {expected!r})")
+                position += 1
+                return char
+            if eof or not fill():
+                raise ValueError("Truncated Graph response")
+
+    def decode_value():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                if end < len(buffer) or eof: # A number at the very end of the buffer may continue in the next chunk
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    skip_to("{")
+    if skip_to('"}') == '}':
+        yield "meta", meta
+        return
+    position -= 1
+    while True:
+        key = decode_value()
+        skip_to(":")
+        if key == "value":
+            skip_to("[")
+            if skip_to(']{') == '{':
+                position -= 1
+                while True:
+                    yield "item", decode_value()
+                    if skip_to(",]") == "]":
+                        break
+        else:
+            meta[key] = decode_value()
+        if skip_to(",}") == "}":
+            break
+    yield "meta", meta
+
+def iter_intune_apps(token, package_id_filter=None, modified_since=None, select=REPORT_FIELDS):
+    """Yield Intune apps from Microsoft Graph page by page, optionally filtered by display name.
+
+    modified_since (datetime) limits the listing to apps changed after that moment and
+    select (property names, None for all) projects both the request ($select) and the
+    yielded dicts. Raises GraphRequestError after reporting the failure.
+    """
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "Accept": "application/json", # Good practice to include Accept header
+        "ConsistencyLevel": "eventual" # Required for certain filters/counts
+    }
+    # Use urlencode for query parameters
+    base_uri = graph_url("/v1.0/deviceAppManagement/mobileApps")
+    params = {'$top': '999'} # Fetch maximum allowed per page to reduce requests
+    filters = []
+    if package_id_filter:
+        # Add parameters for filtering and counting
+        filters.append(f"contains(tolower(displayName), '{package_id_filter.lower()}')")
+        params['$count'] = 'true' # Required header ConsistencyLevel is set
+    if modified_since:
+        filters.append(f"lastModifiedDateTime ge {format_graph_datetime(modified_since)}")
+    if filters:
+        params['$filter'] = " and ".join(filters)
+    keep = None
+    if select:
+        params['$select'] = ",".join(select)
+        keep = set(select) | {'@odata.type'} # @odata.type is always returned and drives the platform column
+
+    # Construct the initial URI with properly encoded parameters
+    uri = base_uri + "?" + urllib.parse.urlencode(params)
+    # Progress dots on one line only where nothing else can print in between: the main thread
+    # of a terminal. Pipeline and tenant workers get whole lines through console_print.
+    dots = threading.current_thread() is threading.main_thread() and sys.stdout.isatty()
+    fetching = f"{Fore.BLUE}Fetching Intune apps... (Filter: {params.get('$filter', 'None')})"
+    if dots:
+        print(fetching, end='', flush=True)
+    else:
+        console_print(fetching)
+    app_count = 0
+    page_number = 0
+    while uri:
+        if dots: print(".", end='', flush=True) # Progress indicator
+        page_started, page_t0, consumer_seconds, page_items = time.time(), time.perf_counter(), 0.0, 0
+        try:
+            # Ensure the request uses the potentially updated URI with encoded params
+            with graph_request('GET', uri, headers=headers, timeout=45) as response: # Rate-limited, retried on 429/5xx
+                next_link = None
+                for kind, payload in iter_json_page(response):
+                    if kind == "item":
+                        app_count += 1
+                        page_items += 1
+                        yielded_at = time.perf_counter()
+                        yield {key: value for key, value in payload.items() if key in keep} if keep else payload
+                        consumer_seconds += time.perf_counter() - yielded_at # The caller's time is not page time
+                    else:
+                        # IMPORTANT: Use the full URL provided in @odata.nextLink for pagination
+                        next_link = payload.get('@odata.nextLink')
+                uri = next_link
+            page_number += 1
+            record_span("graph.page", page_started, time.perf_counter() - page_t0 - consumer_seconds,
+                        page=page_number, items=page_items, bytes=response.wire_bytes)
+        except urllib.error.HTTPError as e:
+            error_body = "N/A"
+            try:
+                error_body = e.read().decode('utf-8', errors='replace') # Try reading the body
+            except Exception:
+                pass # Ignore if reading fails
+            if e.code == 400 and '$select' in params and app_count == 0:
+                # Derived-type properties in $select are rejected by some tenants: project client-side instead
+                if dots:
+                    print(f" {Fore.YELLOW}$select rejected, retrying without projection", end='', flush=True)
+                else:
+                    console_print(f"{Fore.YELLOW}$select rejected, retrying without projection")
+                del params['$select']
+                uri = base_uri + "?" + urllib.parse.urlencode(params)
+                continue
+            if dots: print() # Newline after progress dots
+            error_msg(f"Error fetching apps from Intune (HTTP {e.code})", f"Reason: {e.reason} for URL: {repr(uri)}\nResponse: {error_body}")
+            raise GraphRequestError(e.code) from e
+        except GraphRequestError:
+            raise
+        except Exception as e:
+            if dots: print() # Newline after progress dots
+            error_msg(f"Unexpected error fetching apps for URL: {repr(uri)}", e)
+            raise GraphRequestError(str(e)) from e
+
+    if dots:
+        print(f" {Fore.GREEN}Done. Found {app_count} apps.") # Report count
+    else:
+        console_print(f"{Fore.GREEN}Done fetching Intune apps. Found {app_count} apps.")
+
+def get_intune_apps(token, package_id_filter=None, modified_since=None, select=REPORT_FIELDS):
+    """Retrieves Intune apps as a list (see iter_intune_apps). Returns None on failure."""
+    try:
+        return list(iter_intune_apps(token, package_id_filter=package_id_filter, modified_since=modified_since, select=select))
+    except GraphRequestError:
+        return None
+
+def intune_app_exists(token, app_id):
+    """Return True / False as the mobileApp with app_id exists in the tenant, or None if Graph could not tell."""
+    uri = graph_url(f"/v1.0/deviceAppManagement/mobileApps/{urllib.parse.quote(app_id)}?$select=id")
+    try:
+        with graph_request('GET', uri, headers={"Authorization": f"Bearer {token}", "Accept": "application/json"}, timeout=30) as response:
+            response.read()
+            return True
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return False
+        error_msg(f"Error checking Intune app {app_id} (HTTP {e.code})", e.reason)
+        return None
+    except Exception as e:
+        error_msg(f"Unexpected error checking Intune app {app_id}", e)
+        return None
+
+def find_published_app_id(token, package_id, version, catalog_name=None):
+    """Look up the Intune app of a just published package by display name and version.
+
+    Returns the app id only if exactly one app's name is an exact match for package_id or
+    its catalog Name, decorations aside (see app_index.exact_name_keys / is_exact_name),
+    and its displayVersion equals version; None otherwise.
+    """
+    if not version:
+        return None
+    name_keys = exact_name_keys(package_id, catalog_name)
+    name_filter = package_id.split(".")[-1]
+    if catalog_name and name_filter.lower() not in catalog_name.lower(): # 'Microsoft.VisualStudioCode' is 'Microsoft Visual Studio Code'
+        name_filter = max(name_tokens(catalog_name), key=len, default=name_filter)
+    apps = get_intune_apps(token, package_id_filter=name_filter, select=('id', 'displayName', 'displayVersion'))
+    candidates = [app['id'] for app in apps or []
+                  if is_exact_name(app.get('displayName'), name_keys) and app.get('displayVersion') == version]
+    return candidates[0] if len(candidates) == 1 else None
+
+def format_graph_datetime(moment):
+    """Format a datetime as an OData DateTimeOffset literal (UTC, second precision)."""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+###############################################################################
+## SQLite Store
+###############################################################################
+class InventoryStore:
+    """SQLite-backed copy of the tenant's mobileApps, keyed by app id."""
+
+    def __init__(self, path=DEFAULT_INVENTORY_DB):
+        self.path = str(path)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS apps (
+                                id TEXT PRIMARY KEY,
+                                display_name TEXT,
+                                last_modified TEXT,
+                                data TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS apps_display_name ON apps (display_name COLLATE NOCASE)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the store usable from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_meta(self, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def get_meta_time(self, key):
+        """Return a meta value stored as epoch seconds, or 0.0 if it was never set."""
+        return float(self.get_meta(key, 0) or 0)
+
+    def upsert_apps(self, apps, meta=None, replace_all=False):
+        """Insert or update apps (Graph dicts); replace_all drops every app not in the list.
+
+        apps may be a generator (e.g. iter_intune_apps): rows are written as they arrive,
+        in one transaction that is rolled back if the listing fails part-way.
+        """
+        written = 0
+        def rows():
+            nonlocal written
+            for app in apps:
+                if app.get('id'):
+                    written += 1
+                    yield (app['id'], app.get('displayName'), app.get('lastModifiedDateTime'), json.dumps(app, separators=(',', ':')))
+        with self._connect() as conn:
+            if replace_all:
+                conn.execute("DELETE FROM apps")
+            conn.executemany("INSERT OR REPLACE INTO apps (id, display_name, last_modified, data) VALUES (?, ?, ?, ?)", rows())
+            if meta:
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+        return written
+
+    def delete_missing(self, live_ids, meta=None):
+        """Remove apps whose id is no longer present in the tenant. Returns the number removed."""
+        with self._connect() as conn:
+            stored_ids = {row[0] for row in conn.execute("SELECT id FROM apps")}
+            stale = [(app_id,) for app_id in stored_ids.difference(live_ids)]
+            conn.executemany("DELETE FROM apps WHERE id = ?", stale)
+            if meta:
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+        return len(stale)
+
+    def iter_apps(self, name_contains=None):
+        """Yield stored apps as Graph dicts, optionally only those whose displayName contains name_contains."""
+        conn = self._connect()
+        try:
+            if name_contains:
+                pattern = "%" + name_contains.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                cursor = conn.execute("SELECT data FROM apps WHERE lower(display_name) LIKE ? ESCAPE '\\' ORDER BY display_name COLLATE NOCASE", (pattern,))
+            else:
+                cursor = conn.execute("SELECT data FROM apps ORDER BY display_name COLLATE NOCASE")
+            for row in cursor:
+                yield json.loads(row[0])
+        finally:
+            conn.close()
+
+    def load_apps(self, name_contains=None):
+        """Return stored apps as a list of Graph dicts (see iter_apps)."""
+        return list(self.iter_apps(name_contains=name_contains))
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM apps").fetchone()[0]
+
+###############################################################################
+## Synchronization
+###############################################################################
+def get_inventory_store(config):
+    """Open the inventory store configured in config."""
+    return InventoryStore(config.get('inventory_db', DEFAULT_INVENTORY_DB))
+
+def sync_inventory(config, refresh=False):
+    """Bring the local inventory up to date. Returns the store, or None if Graph could not be reached.
+
+    - no previous full listing, or refresh: full listing (replaces the store)
+    - last sync younger than the TTL: nothing is fetched
+    - otherwise: only apps modified since the last sync, plus an id-only listing
+      to drop deleted apps once the reconcile interval has passed
+    """
+    store = get_inventory_store(config)
+    ttl = float(config.get('inventory_ttl_minutes', DEFAULT_TTL_MINUTES)) * 60
+    reconcile_interval = float(config.get('inventory_reconcile_hours', DEFAULT_RECONCILE_HOURS)) * 3600
+
+    with _sync_lock:
+        if config.get('inventory_refresh') and store.path not in _refreshed_dbs:
+            refresh = True
+        now = time.time()
+        last_full_sync = store.get_meta_time('last_full_sync')
+        last_sync = store.get_meta_time('last_sync')
+        if not refresh and last_full_sync and now - last_sync < ttl:
+            return store # Fresh enough: serve from disk without touching Graph
+
+        token = get_access_token(config)
+        if not token:
+            print(f"{Fore.YELLOW}⚠️ Failed to retrieve access token for inventory sync.")
+            return None
+        sync_started = datetime.now(timezone.utc)
+
+        if refresh or not last_full_sync:
+            print(f"{Fore.CYAN}Seeding local Intune inventory ({store.path})...")
+            try: # Pages are written to the store as they arrive instead of being collected first
+                store.upsert_apps(iter_intune_apps(token), replace_all=True, meta={
+                    'last_full_sync': now, 'last_sync': now, 'last_reconcile': now,
+                    'watermark': format_graph_datetime(sync_started - SYNC_OVERLAP)})
+            except GraphRequestError:
+                return None
+            _refreshed_dbs.add(store.path)
+            return store
+
+        watermark = datetime.strptime(store.get_meta('watermark'), "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        print(f"{Fore.CYAN}Updating local Intune inventory (changes since {format_graph_datetime(watermark)})...")
+        try:
+            store.upsert_apps(iter_intune_apps(token, modified_since=watermark), meta={'last_sync': now, 'watermark': format_graph_datetime(sync_started - SYNC_OVERLAP)})
+        except GraphRequestError:
+            return None
+
+        if now - store.get_meta_time('last_reconcile') >= reconcile_interval:
+            try:
+                removed = store.delete_missing((app['id'] for app in iter_intune_apps(token, select=('id',)) if app.get('id')), meta={'last_reconcile': now})
+                if removed:
+                    print(f"{Fore.BLUE}Removed {removed} app(s) deleted from Intune since the last reconciliation.")
+            except GraphRequestError:
+                pass # Keep the (possibly stale) rows; reconciliation is retried on the next sync
+        return store
+
+def iter_inventory_apps(config, package_id_filter=None, refresh=False):
+    """Return an iterator over Intune apps (Graph dicts) from the synced local inventory, or None if the sync failed."""
+    store = sync_inventory(config, refresh=refresh)
+    if store is None:
+        return None
+    return store.iter_apps(name_contains=package_id_filter)
+
+def load_inventory_apps(config, package_id_filter=None, refresh=False):
+    """Return Intune apps (Graph dicts) from the synced local inventory as a list, or None if the sync failed."""
+    apps = iter_inventory_apps(config, package_id_filter=package_id_filter, refresh=refresh)
+    return list(apps) if apps is not None else None
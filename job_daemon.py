@@ -0,0 +1,653 @@
+##
+## Long-running worker daemon: one warm process serving package / publish / report jobs.
+##
+## 'python job_daemon.py serve' (or 'automattuner daemon serve') loads the config once and
+## keeps warm what every script invocation otherwise rebuilds from scratch:
+##   - the Graph token of every configured tenant (renewed in the background by the token provider)
+##   - the local Intune inventory of every tenant (synced every daemon_refresh_minutes, so jobs never list a tenant)
+##   - the compiled catalog index and its typo-tolerant search (used to check submitted App IDs)
+##
+## Jobs are submitted over a loopback HTTP API and stored in a SQLite queue, so queued
+## jobs survive a restart; a job that was running when the daemon stopped is queued
+## again and continues from its run journal. A bounded pool of daemon_workers threads
+## runs the jobs in submission order, never two jobs with a common App ID at the same time.
+## With several tenants configured, package / publish jobs are packaged once and published
+## to all tenants (or the job's "tenants"), like publish_installer.py. Several architectures or
+## installer contexts ("architecture": ["x64", "arm64"]) make a matrix job: every variant is
+## packaged and the set is published together (to a single tenant).
+## Daemon jobs never prompt: an app entry without a check / publish policy gets the job's
+## (default: no check, publish always), and a stored job that would still ask is failed.
+##
+##   POST   /jobs               {"type": "publish", "ids": ["Mozilla.Firefox"], "publish": "if-absent", "check": true}
+##                              {"type": "package", "apps": [<manifest app entries>], "architecture": "arm64"}
+##                              {"type": "report", "format": "csv", "filter": "zoom", "tenant": "contoso"}
+##   GET    /jobs[?status=queued]
+##   GET    /jobs/<id>          status and, once finished, the batch results document
+##   GET    /jobs/<id>/output   report file of a finished report job
+##   DELETE /jobs/<id>          cancel a queued job
+##   GET    /health             warm state, workers and queue depth
+##
+## Client: python job_daemon.py submit publish Mozilla.Firefox Zoom.Zoom --publish if-absent --wait
+##         python job_daemon.py status [JOB] | cancel JOB
+##
+## Config keys: "daemon_host" (default 127.0.0.1), "daemon_port" (8765), "daemon_workers" (2),
+## "daemon_db" (daemon_jobs.db), "daemon_output_dir" (daemon_output), "daemon_refresh_minutes" (5)
+## and "daemon_api_token" (shared secret sent as 'Authorization: Bearer <token>'; required
+## to listen on anything but a loopback address).
+##
+
+import argparse
+import hmac
+import ipaddress
+import json
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from colorama import Fore
+from console import console_print, error_msg
+
+SCRIPT_DIRECTORY = Path(__file__).resolve().parent
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_JOBS_DB = "daemon_jobs.db"
+DEFAULT_OUTPUT_DIR = "daemon_output"
+DEFAULT_REFRESH_MINUTES = 5
+JOB_TYPES = ('package', 'publish', 'report')
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+REPORT_SUFFIXES = {'csv': ".csv", 'jsonl': ".jsonl", 'table': ".txt"}
+MAX_REQUEST_BYTES = 1 << 20
+
+###############################################################################
+## Persistent Job Queue
+###############################################################################
+class JobQueue:
+    """SQLite table of daemon jobs (queued -> running -> succeeded / failed, or cancelled)."""
+
+    def __init__(self, path=DEFAULT_JOBS_DB):
+        self.path = str(path)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                id TEXT PRIMARY KEY,
+                                type TEXT NOT NULL,
+                                status TEXT NOT NULL,
+                                request TEXT NOT NULL,
+                                submitted_at REAL,
+                                started_at REAL,
+                                finished_at REAL,
+                                journal TEXT,
+                                result TEXT,
+                                error TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at)")
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the queue usable from any worker / request thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job['request'] = json.loads(job['request'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _select(self, query, params=()):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [self._job(row) for row in conn.execute(query, params)]
+
+    def submit(self, job_type, request):
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, type, status, request, submitted_at) VALUES (?, ?, 'queued', ?, ?)",
+                         (job_id, job_type, json.dumps(request, separators=(',', ':')), time.time()))
+        return job_id
+
+    def get(self, job_id):
+        jobs = self._select("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_jobs(self, status=None, limit=100):
+        """Jobs, newest first (optionally only those with a status)."""
+        if status:
+            return self._select("SELECT * FROM jobs WHERE status = ? ORDER BY submitted_at DESC LIMIT ?", (status, limit))
+        return self._select("SELECT * FROM jobs ORDER BY submitted_at DESC LIMIT ?", (limit,))
+
+    def queued(self):
+        """Queued jobs in submission order."""
+        return self._select("SELECT * FROM jobs WHERE status = 'queued' ORDER BY submitted_at")
+
+    def count(self, status):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def transition(self, job_id, from_status, to_status, **fields):
+        """Move a job from one status to another (plus column updates). False if it was not in from_status."""
+        fields = {key: json.dumps(value) if key == 'result' and value is not None else value for key, value in fields.items()}
+        assignments = "".join(f", {column} = ?" for column in fields)
+        with self._connect() as conn:
+            cursor = conn.execute(f"UPDATE jobs SET status = ?{assignments} WHERE id = ? AND status = ?",
+                                  (to_status, *fields.values(), job_id, from_status))
+            return cursor.rowcount == 1
+
+    def set_journal(self, job_id, journal_path):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET journal = ? WHERE id = ?", (str(journal_path), job_id))
+
+    def requeue_running(self):
+        """Queue the jobs a stopped daemon left running again. Returns their number."""
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+
+def job_app_ids(job):
+    """Case-folded App IDs a batch job packages / publishes (empty for report jobs)."""
+    return {app['id'].lower() for app in job['request'].get('jobs', [])}
+
+###############################################################################
+## Worker Pool and Warm State
+###############################################################################
+class JobDaemon:
+    """Validates and queues jobs, runs them on worker threads and keeps the shared state warm."""
+
+    def __init__(self, config):
+        self.config = config
+        self.queue = JobQueue(config.get('daemon_db', DEFAULT_JOBS_DB))
+        self.output_dir = Path(config.get('daemon_output_dir', DEFAULT_OUTPUT_DIR))
+        self.workers = max(1, int(config.get('daemon_workers', DEFAULT_WORKERS)))
+        self.refresh_interval = float(config.get('daemon_refresh_minutes', DEFAULT_REFRESH_MINUTES)) * 60
+        self.started_at = time.time()
+        self.warmed_at = {"token": None, "inventory": None, "catalog": None} # Last successful warm-up per resource
+        self._wakeup = threading.Condition()
+        self._running = {} # job id -> App IDs of the running job (guarded by _wakeup)
+        self._stopping = threading.Event()
+
+    def start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"{Fore.YELLOW}Requeued {requeued} job(s) interrupted by the last shutdown; they continue from their run journals.")
+        threading.Thread(target=self._keep_warm, name="daemon-warm", daemon=True).start()
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f"daemon-worker-{number + 1}", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+            running = len(self._running)
+        if running:
+            print(f"{Fore.YELLOW}{running} running job(s) will continue from their run journals on the next start.")
+
+    # --- Warm state ---
+    def warm_up(self):
+        """Renew the tokens, sync the inventories (every tenant) and (re)build the catalog search if needed."""
+        from graph_auth import get_access_token
+        from intune_inventory import sync_inventory
+        from catalog_search import get_catalog_search
+        from tenants import get_tenant_configs
+        tenant_configs = get_tenant_configs(self.config)
+        if all([get_access_token(tenant_config) for tenant_config in tenant_configs]):
+            self.warmed_at["token"] = time.time()
+        # TTL 0: an incremental sync on every round, so jobs always find the store fresh and never sync themselves
+        if all([sync_inventory(dict(tenant_config, inventory_ttl_minutes=0)) is not None for tenant_config in tenant_configs]):
+            self.warmed_at["inventory"] = time.time()
+        try:
+            get_catalog_search(self.config)
+            self.warmed_at["catalog"] = time.time()
+        except (OSError, ValueError) as e:
+            error_msg("Loading the winget catalog", str(e))
+
+    def _keep_warm(self):
+        while not self._stopping.is_set():
+            try:
+                self.warm_up()
+            except Exception as e: # The daemon keeps serving with whatever is still warm
+                error_msg("Refreshing daemon state", str(e))
+            self._stopping.wait(self.refresh_interval)
+
+    # --- Submission ---
+    def submit(self, payload):
+        """Validate a job request, queue it and wake a worker. Returns the queued job. Raises ValueError."""
+        if not isinstance(payload, dict):
+            raise ValueError("The job request must be a JSON object.")
+        job_type = payload.get('type')
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"'type' must be one of {', '.join(JOB_TYPES)}")
+        if job_type == 'report':
+            fmt = payload.get('format', 'csv')
+            if fmt not in REPORT_SUFFIXES:
+                raise ValueError(f"'format' must be one of {', '.join(REPORT_SUFFIXES)}")
+            from tenants import get_tenant_configs
+            tenant_name = payload.get('tenant') or None
+            if tenant_name:
+                get_tenant_configs(self.config, [tenant_name]) # Raises ValueError for an unknown tenant
+            request = {"format": fmt, "filter": payload.get('filter') or None, "refresh": bool(payload.get('refresh')), "tenant": tenant_name}
+        else:
+            request = self._batch_request(job_type, payload)
+        job_id = self.queue.submit(job_type, request)
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.queue.get(job_id)
+
+    def _batch_request(self, job_type, payload):
+        """Pipeline jobs of a package / publish request: validated like a manifest, App IDs checked against the catalog."""
+        from publish_installer import check_app_jobs, is_matrix_batch, validate_job
+        from tenants import get_tenant_configs
+        tenant_names = payload.get('tenants') or None
+        if tenant_names is not None:
+            if not isinstance(tenant_names, list):
+                raise ValueError("'tenants' must be a list of tenant names.")
+            get_tenant_configs(self.config, tenant_names) # Unknown names are rejected at submission, not when the job runs
+        defaults = {"architecture": 'x64', "installer_context": 'system', "check": False, "publish": 'always', "version": None, "assignments": []}
+        defaults.update({key: payload[key] for key in defaults if payload.get(key) is not None})
+        apps = payload.get('apps') or payload.get('ids') or []
+        if isinstance(apps, str):
+            apps = apps.split(',')
+        app_jobs = []
+        for app in apps:
+            if not isinstance(app, (str, dict)):
+                raise ValueError(f"Invalid app entry: {app!r}")
+            if isinstance(app, str) and not app.strip():
+                continue
+            # A null policy in an app entry means the job's policy, never "ask": nobody answers prompts in a worker
+            entry = {"id": app} if isinstance(app, str) else {key: value for key, value in app.items() if value is not None}
+            job = validate_job(dict(defaults, **entry))
+            app_jobs.append(dict(job, check=False, publish='never') if job_type == 'package' else job)
+        app_jobs, unresolved = check_app_jobs(app_jobs, self.config)
+        if unresolved and payload.get('strict_ids'):
+            raise ValueError(f"Not in the winget catalog: {', '.join(unresolved)}")
+        if not app_jobs:
+            raise ValueError("No App IDs given.")
+        if job_type == 'publish' and is_matrix_batch(app_jobs) and len(get_tenant_configs(self.config, tenant_names)) > 1:
+            raise ValueError("A matrix batch is published to one tenant at a time: name it in 'tenants'.")
+        return {"jobs": app_jobs, "unresolved_ids": unresolved, "force_publish": bool(payload.get('force_publish')), "tenants": tenant_names}
+
+    def cancel(self, job_id):
+        """Cancel a queued job. False if it is already running or finished."""
+        return self.queue.transition(job_id, 'queued', 'cancelled', finished_at=time.time())
+
+    def health(self):
+        now = time.time()
+        with self._wakeup:
+            running = sorted(self._running)
+        return {"status": "ok", "uptime_s": round(now - self.started_at), "workers": self.workers, "running": running,
+                "queued": self.queue.count('queued'),
+                "warm_age_s": {name: round(now - warmed) if warmed else None for name, warmed in self.warmed_at.items()}}
+
+    # --- Workers ---
+    def _claim(self):
+        """Mark the oldest runnable queued job as running (caller holds _wakeup). None if there is none."""
+        for job in self.queue.queued():
+            app_ids = job_app_ids(job)
+            if any(app_ids & running_ids for running_ids in self._running.values()):
+                continue # Another job is packaging / publishing one of these apps; keep the order for those
+            if self.queue.transition(job['id'], 'queued', 'running', started_at=time.time()):
+                self._running[job['id']] = app_ids
+                return job
+        return None
+
+    def _work(self):
+        while not self._stopping.is_set():
+            with self._wakeup:
+                job = self._claim()
+                while job is None and not self._stopping.is_set():
+                    self._wakeup.wait(timeout=30) # Woken by submit / finished jobs; the timeout covers other daemons on the same queue
+                    job = self._claim()
+            if job is None:
+                return
+            try:
+                self.run_job(job)
+            finally:
+                with self._wakeup:
+                    self._running.pop(job['id'], None)
+                    self._wakeup.notify_all() # Jobs held back by an App ID conflict may run now
+
+    def run_job(self, job):
+        """Run one claimed job and store its outcome."""
+        from telemetry import flush as flush_telemetry, span
+        console_print(f"{Fore.CYAN}▶️ Job {job['id']} ({job['type']}) started.")
+        try:
+            with span("daemon.job", job=job['id'], type=job['type']) as stage:
+                status, result = self._run_report(job) if job['type'] == 'report' else self._run_batch(job)
+                if status != 'succeeded':
+                    stage.error(status)
+        except Exception as e:
+            error_msg(f"job {job['id']}", str(e))
+            status, result = 'failed', None
+            self.queue.transition(job['id'], 'running', status, finished_at=time.time(), error=str(e))
+        else:
+            self.queue.transition(job['id'], 'running', status, finished_at=time.time(), result=result)
+        flush_telemetry() # The metrics file follows the daemon job by job, not only at exit
+        color = Fore.GREEN if status == 'succeeded' else Fore.RED
+        console_print(f"{color}⏹️ Job {job['id']} ({job['type']}) {status}.")
+
+    def _run_batch(self, job):
+        from publish_installer import (build_matrix_results_document, build_results_document, build_tenant_results_document, has_failures,
+                                       is_matrix_batch, print_batch_summary, print_matrix_summary, print_tenant_summary, run_batch_pipeline,
+                                       run_matrix_pipeline, run_multi_tenant_pipeline)
+        from run_journal import RunJournal, get_journal_dir, read_journal
+        from tenants import get_tenant_configs, is_multi_tenant
+        request = job['request']
+        app_jobs = request['jobs']
+        interactive = [app_job['id'] for app_job in app_jobs if app_job.get('check') is None or app_job.get('publish') is None]
+        if interactive: # Queued by an older daemon: run_batch_pipeline would wait for input() on a worker thread
+            raise ValueError(f"No check / publish policy for {', '.join(interactive)}; daemon jobs cannot prompt.")
+        config = dict(self.config, force_publish=request.get('force_publish', False))
+        started = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        if is_matrix_batch(app_jobs):
+            if is_multi_tenant(config) and job['type'] == 'publish':
+                config = get_tenant_configs(config, request.get('tenants'))[0] # One tenant, checked at submission
+            # Journals daemon-<job id>-<variant>.jsonl: a requeued job continues them
+            variant_results = run_matrix_pipeline(app_jobs, config, run_id=f"daemon-{job['id']}")
+            print_matrix_summary(app_jobs, variant_results)
+            failed = any(has_failures(batch_results) for batch_results in variant_results.values())
+            return ('failed' if failed else 'succeeded'), build_matrix_results_document(app_jobs, variant_results, started)
+        if is_multi_tenant(config) and job['type'] == 'publish': # Package jobs need no tenant
+            # Journals daemon-<job id>-<tenant>.jsonl: a requeued job continues them
+            tenant_results = run_multi_tenant_pipeline(app_jobs, config, get_tenant_configs(config, request.get('tenants')), run_id=f"daemon-{job['id']}")
+            print_tenant_summary(tenant_results)
+            failed = any(has_failures(batch_results) for batch_results in tenant_results.values())
+            return ('failed' if failed else 'succeeded'), build_tenant_results_document(app_jobs, tenant_results, started)
+        resume_state = None
+        if job.get('journal') and Path(job['journal']).exists():
+            resume_state = read_journal(job['journal'])["apps"]
+            journal = RunJournal(job['journal'])
+            journal.append("run_resumed")
+            console_print(f"{Fore.CYAN}Job {job['id']}: resuming from {job['journal']}.")
+        else:
+            # daemon-<job id>: one journal per job, never picked up by 'publish_installer.py --resume'
+            journal = RunJournal.create(get_journal_dir(config), app_jobs, run_id=f"daemon-{job['id']}")
+            self.queue.set_journal(job['id'], journal.path)
+        batch_results = run_batch_pipeline(app_jobs, config, journal=journal, resume_state=resume_state)
+        print_batch_summary(batch_results)
+        return ('failed' if has_failures(batch_results) else 'succeeded'), build_results_document(app_jobs, batch_results, started)
+
+    def _run_report(self, job):
+        from publish_installer import export_intune_app_report
+        from tenants import get_tenant_configs
+        request = job['request']
+        tenant_name = request.get('tenant')
+        report_config = get_tenant_configs(self.config, [tenant_name] if tenant_name else None)[0] # Default: the first tenant
+        output_path = self.output_dir / f"{job['id']}{REPORT_SUFFIXES[request['format']]}"
+        rows = export_intune_app_report(report_config, request['format'], output=str(output_path),
+                                        package_id_filter=request['filter'], refresh=request['refresh'])
+        if rows is None:
+            raise RuntimeError("The Intune inventory could not be synchronized.")
+        return 'succeeded', {"rows": rows, "format": request['format'], "output": str(output_path)}
+
+###############################################################################
+## Loopback HTTP API
+###############################################################################
+def job_summary(job):
+    """A job without its full results document (for job lists)."""
+    summary = {key: value for key, value in job.items() if key != 'result'}
+    if job.get('result'):
+        summary['summary'] = job['result'].get('summary') or {"rows": job['result'].get('rows')}
+    return summary
+
+class DaemonHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, job_daemon, api_token=None):
+        super().__init__(address, DaemonRequestHandler)
+        self.job_daemon = job_daemon
+        self.api_token = api_token
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    server_version = "automattuner-daemon"
+
+    def log_message(self, *args):
+        pass # Workers print job progress; requests are not logged
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, indent=2, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path):
+        content_type = {".csv": "text/csv", ".jsonl": "application/x-ndjson"}.get(path.suffix, "text/plain")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(path.stat().st_size))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def authorized(self):
+        api_token = self.server.api_token
+        if not api_token:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", "").encode('utf-8'), f"Bearer {api_token}".encode('utf-8'))
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            raise ValueError("Request body too large.")
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise ValueError(f"Request body is not valid JSON: {e}") from e
+
+    def route(self, method):
+        if not self.authorized():
+            return self.send_json(401, {"error": "Missing or wrong 'Authorization: Bearer' token."})
+        url = urllib.parse.urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        job_daemon = self.server.job_daemon
+        try:
+            if parts == ['health'] and method == 'GET':
+                return self.send_json(200, job_daemon.health())
+            if parts == ['jobs'] and method == 'GET':
+                status = urllib.parse.parse_qs(url.query).get('status', [None])[0]
+                return self.send_json(200, {"jobs": [job_summary(job) for job in job_daemon.queue.list_jobs(status)]})
+            if parts == ['jobs'] and method == 'POST':
+                return self.send_json(202, job_daemon.submit(self.read_json()))
+            if len(parts) in (2, 3) and parts[0] == 'jobs':
+                job = job_daemon.queue.get(parts[1])
+                if job is None:
+                    return self.send_json(404, {"error": f"No job '{parts[1]}'."})
+                if len(parts) == 2 and method == 'GET':
+                    return self.send_json(200, job)
+                if len(parts) == 2 and method == 'DELETE':
+                    if not job_daemon.cancel(job['id']):
+                        return self.send_json(409, {"error": f"Job {job['id']} is {job['status']}; only queued jobs can be cancelled."})
+                    return self.send_json(200, job_daemon.queue.get(job['id']))
+                if parts[2:] == ['output'] and method == 'GET':
+                    output = (job.get('result') or {}).get('output')
+                    if job['type'] != 'report' or job['status'] != 'succeeded' or not output or not Path(output).exists():
+                        return self.send_json(409, {"error": f"Job {job['id']} has no report output (status: {job['status']})."})
+                    return self.send_file(Path(output))
+            return self.send_json(404, {"error": f"No route for {method} {url.path}"})
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+def serve(config):
+    """Run the daemon until Ctrl+C. Returns the process exit code."""
+    host = config.get('daemon_host', DEFAULT_HOST)
+    port = int(config.get('daemon_port', DEFAULT_PORT))
+    api_token = config.get('daemon_api_token')
+    if not is_loopback(host) and not api_token:
+        error_msg("starting the daemon", f"Refusing to listen on {host} without a 'daemon_api_token' in the config.")
+        return 2
+    job_daemon = JobDaemon(config)
+    try:
+        server = DaemonHTTPServer((host, port), job_daemon, api_token)
+    except OSError as e:
+        error_msg("starting the daemon", f"Cannot listen on {host}:{port}: {e}")
+        return 1
+    job_daemon.start()
+    print(f"{Fore.GREEN}✅ Worker daemon listening on http://{host}:{server.server_port} ({job_daemon.workers} worker(s), queue {job_daemon.queue.path}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{Fore.YELLOW}Stopping the worker daemon...")
+    finally:
+        server.server_close()
+        job_daemon.stop()
+    return 0
+
+###############################################################################
+## Command Line Client
+###############################################################################
+def read_client_config():
+    """Daemon settings from config.json next to this script (the client needs no tenant credentials)."""
+    try:
+        with open(SCRIPT_DIRECTORY / "config.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def call_daemon(config, method, path, payload=None):
+    """One API request. Returns (HTTP status, parsed JSON body). Raises OSError if the daemon is unreachable."""
+    host = config.get('daemon_host', DEFAULT_HOST)
+    host = DEFAULT_HOST if host in ("0.0.0.0", "::", "") else host
+    url = f"http://{host}:{int(config.get('daemon_port', DEFAULT_PORT))}{path}"
+    request = urllib.request.Request(url, method=method, data=json.dumps(payload).encode('utf-8') if payload is not None else None)
+    request.add_header("Content-Type", "application/json")
+    if config.get('daemon_api_token'):
+        request.add_header("Authorization", f"Bearer {config['daemon_api_token']}")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {"error": e.reason}
+
+def print_job(job):
+    app_ids = ", ".join(app['id'] for app in job['request'].get('jobs', [])) or job['request'].get('filter') or "-"
+    submitted = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job['submitted_at']))
+    counts = job.get('summary') or (job.get('result') or {}).get('summary') or {}
+    counts_text = " ".join(f"{key}={value}" for key, value in counts.items() if value)
+    print(f"{job['id']}  {job['type']:<8} {job['status']:<10} {submitted}  {app_ids[:60]:<60} {counts_text}")
+    if job.get('error'):
+        print(f"  {Fore.RED}{job['error']}")
+
+def wait_for_job(config, job_id, poll_seconds=2.0):
+    """Poll until the job is finished. Returns the final job."""
+    while True:
+        status, job = call_daemon(config, 'GET', f"/jobs/{job_id}")
+        if status != 200 or job['status'] in FINAL_STATUSES:
+            return job
+        time.sleep(poll_seconds)
+
+def submit_payload(args):
+    """Job request of the 'submit' command: manifest defaults and apps, overridden by the options given."""
+    payload = {"type": args.type}
+    if args.manifest:
+        with open(args.manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest = {"apps": manifest} if isinstance(manifest, list) else manifest
+        payload.update(manifest.get('defaults', {}), apps=manifest.get('apps', []))
+    if args.ids:
+        payload['apps'] = [item.strip() for value in args.ids for item in value.split(',') if item.strip()]
+    options = {"version": args.version, "architecture": args.architecture, "installer_context": args.installer_context,
+               "check": args.check, "publish": args.publish, "assignments": args.assign, "format": args.format,
+               "filter": args.filter, "refresh": args.refresh or None, "strict_ids": args.strict_ids or None,
+               "force_publish": args.force_publish or None}
+    if args.tenant:
+        payload.update({"tenant": args.tenant[0]} if args.type == 'report' else {"tenants": args.tenant})
+    payload.update({key: value for key, value in options.items() if value is not None})
+    return payload
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker daemon keeping token, inventory and catalog warm for queued package / publish / report jobs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("serve", help="Run the daemon (loopback HTTP API, see the header of job_daemon.py).")
+    submit = subparsers.add_parser("submit", help="Queue a job with the running daemon.")
+    submit.add_argument("type", choices=JOB_TYPES)
+    submit.add_argument("ids", nargs='*', metavar="APP_ID", help="App IDs (package / publish).")
+    submit.add_argument("--manifest", help="Batch manifest (same format as publish_installer.py --manifest).")
+    submit.add_argument("--version")
+    submit.add_argument("--architecture", help="x64, x86 or arm64; several, comma-separated, package a matrix of variants.")
+    submit.add_argument("--installer-context", help="user or system; both, comma-separated, package a matrix of variants.")
+    submit.add_argument("--check", action=argparse.BooleanOptionalAction, default=None, help="Check Intune for existing apps (publish jobs).")
+    submit.add_argument("--publish", choices=('always', 'never', 'if-absent'), help="Publish policy of publish jobs (default: always).")
+    submit.add_argument("--assign", action="append", metavar="INTENT:TARGET", help="Assignment for every published app (repeatable).")
+    submit.add_argument("--strict-ids", action="store_true", help="Reject the job if an App ID is not in the winget catalog.")
+    submit.add_argument("--force-publish", action="store_true", help="Upload even if the publish ledger has this exact package.")
+    submit.add_argument("--tenant", action="append", metavar="NAME", help="Publish only to this configured tenant (repeatable; default: all tenants). Report jobs: the tenant to report on (default: the first).")
+    submit.add_argument("--format", choices=tuple(REPORT_SUFFIXES), help="Report format (report jobs, default csv).")
+    submit.add_argument("--filter", help="Only apps whose name contains this text (report jobs).")
+    submit.add_argument("--refresh", action="store_true", help="Re-list all Intune apps first (report jobs).")
+    submit.add_argument("--wait", action="store_true", help="Wait for the job to finish; exit 1 if it failed.")
+    status = subparsers.add_parser("status", help="Daemon health and recent jobs, or one job's status and results.")
+    status.add_argument("job_id", nargs='?')
+    status.add_argument("--status", dest="filter_status", choices=('queued', 'running') + FINAL_STATUSES, help="Only jobs with this status.")
+    status.add_argument("--wait", action="store_true", help="With JOB: wait for it to finish.")
+    subparsers.add_parser("cancel", help="Cancel a queued job.").add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        from publish_installer import load_config # Configures the HTTP client, throttling and telemetry
+        config = load_config()
+        return serve(config) if config else 1
+
+    config = read_client_config()
+    try:
+        if args.command == "submit":
+            code, job = call_daemon(config, 'POST', "/jobs", submit_payload(args))
+            if code != 202:
+                error_msg("submitting the job", job.get('error', f"HTTP {code}"))
+                return 2
+            if job['request'].get('unresolved_ids'):
+                print(f"{Fore.YELLOW}⚠️ Not in the winget catalog (tried as typed): {', '.join(job['request']['unresolved_ids'])}")
+            print(f"{Fore.GREEN}Queued job {job['id']}.")
+            if not args.wait:
+                return 0
+            job = wait_for_job(config, job['id'])
+            print(json.dumps(job.get('result') or {"error": job.get('error')}, indent=2))
+            return 0 if job['status'] == 'succeeded' else 1
+        if args.command == "cancel":
+            code, job = call_daemon(config, 'DELETE', f"/jobs/{args.job_id}")
+            if code != 200:
+                error_msg("cancelling the job", job.get('error', f"HTTP {code}"))
+                return 1
+            print(f"{Fore.GREEN}Cancelled job {job['id']}.")
+            return 0
+        if args.job_id:
+            job = wait_for_job(config, args.job_id) if args.wait else call_daemon(config, 'GET', f"/jobs/{args.job_id}")[1]
+            print(json.dumps(job, indent=2))
+            return 1 if job.get('error') and 'status' not in job else 0
+        _, health = call_daemon(config, 'GET', "/health")
+        warm = ", ".join(f"{name} {age}s ago" if age is not None else f"{name} not yet" for name, age in health.get('warm_age_s', {}).items())
+        print(f"{Fore.CYAN}Daemon up {health.get('uptime_s')}s, {health.get('workers')} worker(s), "
+              f"{len(health.get('running', []))} running, {health.get('queued')} queued; warmed: {warm}")
+        _, listing = call_daemon(config, 'GET', "/jobs" + (f"?status={args.filter_status}" if args.filter_status else ""))
+        for job in listing.get('jobs', []):
+            print_job(job)
+        return 0
+    except OSError as e:
+        error_msg("contacting the worker daemon", f"{e} (is 'job_daemon.py serve' running?)")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
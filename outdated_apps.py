@@ -0,0 +1,89 @@
+##
+## Tenant-vs-catalog diff: which deployed Intune apps have a newer winget version?
+##
+## Intune report records (generate_report_output) are hash-joined with the bundled winget
+## catalog on the normalized app name, disambiguated by publisher when several catalog
+## packages share a name. For every matched package the newest deployed displayVersion
+## is compared with the catalog version using winget ordering; packages where the
+## catalog is newer form the work queue for the batch pipeline.
+##
+
+from app_index import name_join_keys, name_tokens, normalize_name
+from winget_version import parse_version, compare_parsed_versions
+
+def build_catalog_join_table(catalog):
+    """Hash table of normalized catalog Name (and PackageId) -> [(PackageId, Name, Version)]."""
+    table = {}
+    for position in range(len(catalog)):
+        entry = catalog.entry(position)
+        row = (entry['PackageId'], entry['Name'], entry['Version'])
+        for key in {normalize_name(entry['Name']), normalize_name(entry['PackageId'])}:
+            if key:
+                table.setdefault(key, []).append(row)
+    return table
+
+def _pick_candidate(candidates, publisher):
+    """Choose among catalog packages sharing a name, preferring the app's publisher namespace."""
+    if len(candidates) == 1:
+        return candidates[0]
+    publisher_tokens = name_tokens(publisher)
+    if publisher_tokens:
+        for candidate in candidates:
+            if normalize_name(candidate[0].split(".")[0]) == publisher_tokens[0]:
+                return candidate
+    return None # Ambiguous: never queue an app we cannot attribute to one package
+
+def find_outdated_apps(report_data, catalog, join_table=None):
+    """Return the apps whose catalog version is newer than the newest deployed version.
+
+    report_data are records from generate_report_output; catalog is a CatalogIndex. The
+    result is a list of dicts sorted by PackageId:
+      PackageId, Name, deployedVersion, catalogVersion, intuneAppIds
+    """
+    if join_table is None:
+        join_table = build_catalog_join_table(catalog)
+
+    deployed = {} # PackageId -> [catalog row, newest deployed parts, newest deployed text, app ids]
+    resolved = {} # (display name, publisher) -> catalog row; tenants repeat names across versions
+    for app_info in report_data:
+        if not app_info.get('platform', '').startswith('Win'):
+            continue # The winget catalog only describes Windows apps
+        version = app_info.get('displayVersion')
+        if not version or version == 'N/A':
+            continue
+        display_name = app_info.get('originalDisplayName') or app_info.get('displayName')
+        resolve_key = (display_name, app_info.get('publisher'))
+        if resolve_key in resolved:
+            candidate = resolved[resolve_key]
+        else:
+            candidate = None
+            for key in name_join_keys(display_name):
+                candidates = join_table.get(key)
+                if candidates:
+                    candidate = _pick_candidate(candidates, resolve_key[1])
+                    break
+            resolved[resolve_key] = candidate
+        if candidate is None:
+            continue
+
+        parts = parse_version(version)
+        state = deployed.get(candidate[0])
+        if state is None:
+            deployed[candidate[0]] = [candidate, parts, version, [app_info.get('id')]]
+        else:
+            state[3].append(app_info.get('id'))
+            if compare_parsed_versions(parts, state[1]) > 0:
+                state[1], state[2] = parts, version
+
+    outdated = []
+    for package_id, (candidate, deployed_parts, deployed_version, app_ids) in deployed.items():
+        if compare_parsed_versions(parse_version(candidate[2]), deployed_parts) > 0:
+            outdated.append({
+                "PackageId": package_id,
+                "Name": candidate[1],
+                "deployedVersion": deployed_version,
+                "catalogVersion": candidate[2],
+                "intuneAppIds": app_ids
+            })
+    outdated.sort(key=lambda item: item['PackageId'].lower())
+    return outdated
@@ -0,0 +1,441 @@
+##
+## Content-addressed cache for the wintuner package folders.
+##
+## wintuner packages into <wintuner_download_dir>/<PackageId>/<Version>/. This module
+## keeps that layout (wintuner publish reads it) and adds, under <download dir>/.cache/:
+##   manifests/<PackageId>/<Version>.json  sha256 + size + mtime of every file of a
+##                                         finished package, plus created / last_used
+##   blobs/<aa>/<sha256>                   one copy of every distinct file content
+## A package folder only counts as a cache hit when its manifest exists and the folder
+## still matches it, so a half-written folder from a killed run is never reused.
+## Identical files (the same installer packaged for x64 and arm64, unchanged support
+## files across versions) are hardlinked to a single blob. When the cache grows past
+## package_cache_max_gb, the least recently used packages are evicted and blobs no
+## package links to anymore are deleted.
+##
+## wintuner's folder has no room for the architecture or installer context, so a
+## matrix run (several variants of one app) packages each variant into its own download
+## folder, <download dir>/.variants/<architecture>-<context>/, with its own manifests.
+## All variants share the blob store of the main folder: an installer that is the same
+## for x64 and arm64, or for user and system, is kept on disk once. The disk budget
+## applies to each folder separately.
+##
+## gc only removes unsealed folders that were not written to for a grace period: a folder
+## wintuner is packaging into right now has no manifest yet either.
+##
+## Config keys: "package_cache_max_gb" (disk budget, default unlimited),
+## "package_cache_verify" ("full" = re-hash on reuse (default), "quick" = size + mtime) and
+## "package_cache_gc_grace_minutes" (age of an unsealed folder before gc removes it, default 60).
+##
+## Usage: python package_cache.py stats | gc [--max-gb N] [--grace-minutes N] | verify
+##
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR_NAME = ".cache"
+VARIANTS_DIR_NAME = ".variants"
+HASH_CHUNK_SIZE = 1 << 20
+DEFAULT_GC_GRACE_MINUTES = 60
+
+def hash_path(path):
+    """SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+class PackageCache:
+    """Manifests, blob store and LRU eviction for one wintuner download directory. Thread-safe."""
+
+    def __init__(self, download_dir, max_bytes=None, verify="full", blob_dir=None, gc_grace_seconds=DEFAULT_GC_GRACE_MINUTES * 60):
+        self.download_dir = Path(download_dir)
+        self.cache_dir = self.download_dir / CACHE_DIR_NAME
+        self.manifest_dir = self.cache_dir / "manifests"
+        self.blob_dir = Path(blob_dir) if blob_dir else self.cache_dir / "blobs" # Variant folders share the main folder's blobs
+        self.max_bytes = max_bytes
+        self.verify_mode = verify
+        self.gc_grace_seconds = gc_grace_seconds
+        self._lock = threading.RLock()
+        self._verified = {} # package dir -> manifest mtime it was verified against (once per process)
+        self.pinned = set() # (PackageId, Version) used by this run: never evicted
+
+    def _manifest_path(self, package_id, version):
+        return self.manifest_dir / package_id / f"{version}.json"
+
+    def _blob_path(self, digest):
+        return self.blob_dir / digest[:2] / digest
+
+    def read_manifest(self, package_id, version):
+        try:
+            with open(self._manifest_path(package_id, version), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, package_id, version, manifest):
+        path = self._manifest_path(package_id, version)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, path) # A manifest is either complete or absent
+
+    ###########################################################################
+    ## Sealing / Verification
+    ###########################################################################
+    def seal(self, package_id, version):
+        """Record the manifest of a freshly packaged folder and deduplicate its files. Returns the manifest."""
+        package_dir = self.download_dir / package_id / version
+        # Hash outside the lock so parallel workers do not wait for each other's installers
+        hashed = [(path, hash_path(path)) for path in sorted(p for p in package_dir.rglob("*") if p.is_file())]
+        with self._lock:
+            files = {}
+            for path, digest in hashed:
+                self._link_blob(path, digest)
+                stat = path.stat()
+                files[path.relative_to(package_dir).as_posix()] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            now = time.time()
+            manifest = {"package_id": package_id, "version": version, "created": now, "last_used": now, "files": files}
+            self._write_manifest(package_id, version, manifest)
+            self._verified.pop(package_dir, None)
+            return manifest
+
+    def _link_blob(self, path, digest):
+        """Make path and the blob of its content the same file (hardlink); no-op where hardlinks are unsupported."""
+        blob = self._blob_path(digest)
+        try:
+            if blob.exists():
+                if os.path.samefile(blob, path):
+                    return
+                temp_path = path.with_name(path.name + ".dedup")
+                os.link(blob, temp_path)
+                os.replace(temp_path, path) # Replace the duplicate by a link to the existing blob
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except FileExistsError: # A variant folder sharing the blob store stored the same content first
+                    self._link_blob(path, digest)
+        except OSError:
+            pass # Different file system or no hardlink support: keep the plain copy
+
+    def is_sealed(self, package_id, version):
+        """True if the package was recorded as complete (its contents are checked by verify())."""
+        return self._manifest_path(package_id, version).is_file()
+
+    def pin(self, package_id, version):
+        """Protect a package from eviction for the rest of this process (e.g. it is about to be published)."""
+        with self._lock:
+            self.pinned.add((package_id, version))
+
+    def verify(self, package_id, version):
+        """True if the package folder is complete and unmodified according to its manifest."""
+        package_dir = self.download_dir / package_id / version
+        manifest_path = self._manifest_path(package_id, version)
+        try:
+            manifest_mtime = manifest_path.stat().st_mtime_ns
+        except OSError:
+            return False # Never sealed: interrupted or pre-cache package
+        with self._lock:
+            if self._verified.get(package_dir) == manifest_mtime:
+                return True
+        manifest = self.read_manifest(package_id, version)
+        if not manifest or not package_dir.is_dir():
+            return False
+        present = {p.relative_to(package_dir).as_posix() for p in package_dir.rglob("*") if p.is_file()}
+        if present != set(manifest['files']):
+            return False
+        for relative_path, expected in manifest['files'].items():
+            stat = (package_dir / relative_path).stat()
+            if stat.st_size != expected['size']:
+                return False
+            if self.verify_mode == "quick":
+                if stat.st_mtime_ns != expected['mtime_ns']:
+                    return False
+            elif hash_path(package_dir / relative_path) != expected['sha256']:
+                return False
+        with self._lock:
+            self._verified[package_dir] = manifest_mtime
+        return True
+
+    def touch(self, package_id, version):
+        """Mark a package as just used (LRU order)."""
+        with self._lock:
+            manifest = self.read_manifest(package_id, version)
+            if manifest:
+                manifest['last_used'] = time.time()
+                self._write_manifest(package_id, version, manifest)
+                package_dir = self.download_dir / package_id / version
+                if package_dir in self._verified: # Keep the verification valid for the rewritten manifest
+                    self._verified[package_dir] = self._manifest_path(package_id, version).stat().st_mtime_ns
+
+    def discard(self, package_id, version):
+        """Remove a package folder and its manifest (e.g. an incomplete folder before repackaging)."""
+        with self._lock:
+            shutil.rmtree(self.download_dir / package_id / version, ignore_errors=True)
+            try:
+                self._manifest_path(package_id, version).unlink()
+            except OSError:
+                pass
+            self._verified.pop(self.download_dir / package_id / version, None)
+
+    ###########################################################################
+    ## Inventory / Eviction
+    ###########################################################################
+    def entries(self):
+        """All sealed packages: list of manifests (without the file lists' content checked)."""
+        manifests = []
+        if not self.manifest_dir.is_dir():
+            return manifests
+        for path in self.manifest_dir.glob("*/*.json"):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return manifests
+
+    def unsealed_dirs(self):
+        """Package folders without a manifest (interrupted runs or packaged before the cache existed)."""
+        folders = []
+        if not self.download_dir.is_dir():
+            return folders
+        for app_dir in self.download_dir.iterdir():
+            if app_dir.name in (CACHE_DIR_NAME, VARIANTS_DIR_NAME) or not app_dir.is_dir():
+                continue
+            for version_dir in app_dir.iterdir():
+                if version_dir.is_dir() and not self._manifest_path(app_dir.name, version_dir.name).exists():
+                    folders.append(version_dir)
+        return folders
+
+    @staticmethod
+    def last_write(folder):
+        """Newest modification time of a folder or anything in it (0 if it is gone)."""
+        newest = 0
+        for root, dirs, names in os.walk(folder):
+            for path in [root] + [os.path.join(root, name) for name in names]:
+                try:
+                    newest = max(newest, os.stat(path).st_mtime)
+                except OSError:
+                    continue
+        return newest
+
+    def disk_usage(self, include_variants=False):
+        """Bytes actually used: every distinct file (inode) under the download dir counted once.
+
+        Variant folders have their own budget and are only counted with include_variants.
+        """
+        seen = set()
+        total = 0
+        for root, dirs, names in os.walk(self.download_dir):
+            if not include_variants and Path(root) == self.download_dir and VARIANTS_DIR_NAME in dirs:
+                dirs.remove(VARIANTS_DIR_NAME)
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    total += stat.st_size
+        return total
+
+    def remove_orphan_blobs(self):
+        """Delete blobs no package folder links to anymore. Returns the bytes freed."""
+        freed = 0
+        if not self.blob_dir.is_dir():
+            return freed
+        for blob in self.blob_dir.glob("*/*"):
+            stat = blob.stat()
+            if stat.st_nlink <= 1:
+                blob.unlink()
+                freed += stat.st_size
+        for prefix_dir in self.blob_dir.iterdir():
+            if prefix_dir.is_dir() and not any(prefix_dir.iterdir()):
+                prefix_dir.rmdir()
+        return freed
+
+    def _evict_package(self, manifest):
+        """discard() a sealed package and delete the blobs only it linked to. Returns the bytes freed."""
+        package_id, version = manifest['package_id'], manifest['version']
+        package_dir = self.download_dir / package_id / version
+        freed = 0
+        for relative_path in manifest['files']:
+            try:
+                stat = (package_dir / relative_path).stat()
+            except OSError:
+                continue
+            if stat.st_nlink == 1: # Plain copy (no hardlink support): freed with the folder
+                freed += stat.st_size
+        self.discard(package_id, version)
+        for digest in {file_info['sha256'] for file_info in manifest['files'].values()}:
+            blob = self._blob_path(digest)
+            try:
+                stat = blob.stat()
+                if stat.st_nlink <= 1: # No other package (or variant folder) links to it
+                    blob.unlink()
+                    freed += stat.st_size
+            except OSError:
+                continue
+        return freed
+
+    def evict(self, max_bytes=None, protect=()):
+        """Evict least recently used packages until the cache fits max_bytes. Returns the evicted (id, version) pairs.
+
+        protect holds (PackageId, Version) pairs that must stay (e.g. used by the running batch).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        protect = self.pinned | set(protect)
+        evicted = []
+        with self._lock:
+            self.remove_orphan_blobs()
+            if max_bytes is None:
+                return evicted
+            usage = self.disk_usage()
+            for manifest in sorted(self.entries(), key=lambda item: item.get('last_used', 0)):
+                if usage <= max_bytes:
+                    break
+                key = (manifest['package_id'], manifest['version'])
+                if key in protect:
+                    continue
+                usage -= self._evict_package(manifest) # Accounted per package instead of walking the folder again
+                evicted.append(key)
+        return evicted
+
+    def gc(self, max_bytes=None, protect=(), grace_seconds=None):
+        """Remove stale unsealed folders and orphan blobs, then evict down to the budget. Returns a summary dict.
+
+        Unsealed folders written to within grace_seconds (default: the cache's gc grace
+        period) may still be packaging and are kept.
+        """
+        grace_seconds = self.gc_grace_seconds if grace_seconds is None else grace_seconds
+        with self._lock:
+            before = self.disk_usage()
+            cutoff = time.time() - grace_seconds
+            unsealed = [folder for folder in self.unsealed_dirs()
+                        if (folder.parent.name, folder.name) not in self.pinned | set(protect) and self.last_write(folder) < cutoff]
+            for folder in unsealed:
+                shutil.rmtree(folder, ignore_errors=True)
+            evicted = self.evict(max_bytes, protect)
+            for app_dir in self.download_dir.iterdir() if self.download_dir.is_dir() else []:
+                if app_dir.is_dir() and app_dir.name not in (CACHE_DIR_NAME, VARIANTS_DIR_NAME) and not any(app_dir.iterdir()):
+                    app_dir.rmdir()
+            return {"removed_unsealed": len(unsealed), "evicted": evicted, "freed_bytes": before - self.disk_usage()}
+
+    def stats(self):
+        """Summary of the cache: packages, logical vs. on-disk size, dedup savings."""
+        with self._lock:
+            entries = self.entries()
+            logical = sum(item['size'] for manifest in entries for item in manifest['files'].values())
+            usage = self.disk_usage()
+            return {
+                "download_dir": str(self.download_dir),
+                "packages": len(entries),
+                "unsealed_folders": len(self.unsealed_dirs()),
+                "logical_bytes": logical,
+                "disk_bytes": usage,
+                "dedup_saved_bytes": max(0, logical - usage),
+                "max_bytes": self.max_bytes,
+                "oldest_use": min((manifest.get('last_used', 0) for manifest in entries), default=None)
+            }
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def variant_name(architecture, installer_context):
+    """'arm64-user': the folder name of one variant of a matrix run."""
+    return f"{architecture}-{installer_context}"
+
+def variant_download_dir(download_dir, architecture, installer_context):
+    """Download folder of one architecture / installer context variant (see the header)."""
+    return Path(download_dir) / VARIANTS_DIR_NAME / variant_name(architecture, installer_context)
+
+def get_package_cache(config):
+    """Return the shared PackageCache of config['wintuner_download_dir'] (a variant folder shares the main folder's blobs)."""
+    max_gb = config.get('package_cache_max_gb')
+    max_bytes = int(float(max_gb) * 1024 ** 3) if max_gb else None
+    download_dir = Path(config['wintuner_download_dir']).resolve()
+    blob_dir = None
+    if download_dir.parent.name == VARIANTS_DIR_NAME:
+        blob_dir = download_dir.parent.parent / CACHE_DIR_NAME / "blobs"
+    with _caches_lock:
+        cache = _caches.get(download_dir)
+        if cache is None:
+            grace_seconds = float(config.get('package_cache_gc_grace_minutes', DEFAULT_GC_GRACE_MINUTES)) * 60
+            cache = _caches[download_dir] = PackageCache(download_dir, max_bytes, config.get('package_cache_verify', 'full'), blob_dir, grace_seconds)
+        return cache
+
+def get_package_caches(config):
+    """The main PackageCache followed by the caches of the variant folders that exist."""
+    variants_dir = Path(config['wintuner_download_dir']) / VARIANTS_DIR_NAME
+    variant_dirs = sorted(path for path in variants_dir.iterdir() if path.is_dir()) if variants_dir.is_dir() else []
+    return [get_package_cache(config)] + [get_package_cache(dict(config, wintuner_download_dir=str(path))) for path in variant_dirs]
+
+###############################################################################
+## Command Line
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and clean the local wintuner package cache.")
+    parser.add_argument("--config", default=str(Path(__file__).resolve().parent / "config.json"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show package count, disk usage and deduplication savings.")
+    gc_parser = subparsers.add_parser("gc", help="Remove incomplete folders and orphan blobs, evict LRU packages over the budget.")
+    gc_parser.add_argument("--max-gb", type=float, help="Disk budget for this run (default: package_cache_max_gb from config).")
+    gc_parser.add_argument("--grace-minutes", type=float, help="Keep incomplete folders written to more recently (default: package_cache_gc_grace_minutes from config, 60).")
+    subparsers.add_parser("verify", help="Re-hash every cached package and report the ones that no longer match.")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    caches = get_package_caches(dict(config, package_cache_verify="full")) # Main folder, then the matrix variant folders
+
+    if args.command == "stats":
+        for cache in caches:
+            stats = cache.stats()
+            print(f"Cache directory:   {stats['download_dir']}")
+            print(f"Packages:          {stats['packages']} (+{stats['unsealed_folders']} incomplete/unsealed folders)")
+            print(f"Logical size:      {format_size(stats['logical_bytes'])}")
+            print(f"On disk:           {format_size(stats['disk_bytes'])} (saved by dedup: {format_size(stats['dedup_saved_bytes'])})")
+            print(f"Budget:            {format_size(stats['max_bytes']) if stats['max_bytes'] else 'unlimited'}")
+        if len(caches) > 1:
+            logical = sum(item['size'] for cache in caches for manifest in cache.entries() for item in manifest['files'].values())
+            usage = caches[0].disk_usage(include_variants=True)
+            print(f"All folders:       {format_size(usage)} on disk for {format_size(logical)} (saved by dedup: {format_size(max(0, logical - usage))})")
+        return 0
+    if args.command == "gc":
+        max_bytes = int(args.max_gb * 1024 ** 3) if args.max_gb is not None else None
+        for cache in caches:
+            result = cache.gc(max_bytes, grace_seconds=args.grace_minutes * 60 if args.grace_minutes is not None else None)
+            print(f"{cache.download_dir}: removed {result['removed_unsealed']} incomplete folder(s), evicted {len(result['evicted'])} package(s), freed {format_size(result['freed_bytes'])}.")
+            for package_id, version in result['evicted']:
+                print(f"  evicted {package_id} {version}")
+        return 0
+    verified, broken = 0, []
+    for cache in caches:
+        for manifest in cache.entries():
+            if cache.verify(manifest['package_id'], manifest['version']):
+                verified += 1
+            else:
+                broken.append((cache.download_dir, manifest['package_id'], manifest['version']))
+    for download_dir, package_id, version in broken:
+        print(f"MISMATCH {package_id} {version} ({download_dir})")
+    print(f"{verified} package(s) verified, {len(broken)} mismatch(es).")
+    return 1 if broken else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+##
+## Event-driven supervisor for wintuner child processes.
+##
+## Every child's stdout and stderr are read line by line as they arrive (one reader
+## thread per pipe, which also works on Windows where pipes cannot be select()ed) and
+## funneled into a single event queue. The consuming thread turns lines into events:
+##   "line"      a line of output (stream "stdout" / "stderr")
+##   "phase"     wintuner entered a new phase (download, extract, intunewin, upload)
+##   "progress"  a percentage was reported inside the current phase
+##   "exit"      the child finished (returncode set, phases closed)
+## Per-phase start/end times are recorded, so callers can report how long downloading,
+## extracting, building the .intunewin and uploading took. One supervisor can run many
+## children at once; events of all children arrive through the same loop.
+##
+
+import queue
+import re
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+# Phase keywords in wintuner / WingetIntune log lines, checked in order (case-insensitive)
+PHASE_PATTERNS = (
+    ("upload", re.compile(r"upload|publish|commit(ting)? (the )?(file|content)", re.IGNORECASE)),
+    # Not a bare "packaging": the command's header line ("Packaging <id> <version>") comes before the download
+    ("intunewin", re.compile(r"intunewin|intune ?win ?app ?util|creating (the )?package|encrypt", re.IGNORECASE)),
+    ("extract", re.compile(r"extract|unpack|unzip|expand", re.IGNORECASE)),
+    ("download", re.compile(r"download", re.IGNORECASE)),
+)
+# Phases each wintuner command is expected to go through, used to turn phases into overall progress
+COMMAND_PHASES = {
+    "package": ("download", "extract", "intunewin"),
+    "publish": ("upload",),
+}
+_PERCENT_RE = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+
+ProcessEvent = namedtuple("ProcessEvent", "kind process stream line phase progress")
+
+def detect_phase(line):
+    """Return the phase name a wintuner output line announces, or None."""
+    for phase, pattern in PHASE_PATTERNS:
+        if pattern.search(line):
+            return phase
+    return None
+
+def detect_percent(line):
+    """Return a percentage (0-100) found in a line, or None."""
+    match = _PERCENT_RE.search(line)
+    if match:
+        value = float(match.group(1))
+        if 0 <= value <= 100:
+            return value
+    return None
+
+###############################################################################
+## Supervised Child Process
+###############################################################################
+class SupervisedProcess:
+    """State of one child: its output so far, phase timings and the overall progress estimate."""
+
+    def __init__(self, cmd, name=None):
+        self.cmd = [str(item) for item in cmd]
+        self.name = name or self.cmd[0]
+        self.stdout_lines = []
+        self.stderr_lines = []
+        self.returncode = None
+        self.started = None
+        self.ended = None
+        self.phases = [] # [phase, started, ended] in the order they were entered
+        self.progress = 0.0 # Overall estimate 0..1
+        self.expected_phases = COMMAND_PHASES.get(self.cmd[1] if len(self.cmd) > 1 else "", ())
+        self._popen = None
+        self._open_streams = 0
+
+    @property
+    def current_phase(self):
+        return self.phases[-1][0] if self.phases else None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.ended or time.monotonic()) - self.started
+
+    def phase_durations(self):
+        """Seconds spent per phase, e.g. {'download': 4.2, 'intunewin': 7.9}."""
+        now = time.monotonic()
+        durations = {}
+        for phase, started, ended in self.phases:
+            durations[phase] = durations.get(phase, 0.0) + ((ended or now) - started)
+        return durations
+
+    def format_phase_durations(self):
+        return ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in self.phase_durations().items())
+
+    def _enter_phase(self, phase, now):
+        if self.phases:
+            self.phases[-1][2] = now
+        self.phases.append([phase, now, None])
+
+    def _update_progress(self, percent):
+        """Map the current phase (and percentage inside it) onto the command's expected phases."""
+        if self.current_phase not in self.expected_phases:
+            return False
+        index = self.expected_phases.index(self.current_phase)
+        fraction = (percent or 0) / 100
+        progress = (index + fraction) / len(self.expected_phases)
+        if progress > self.progress:
+            self.progress = min(progress, 1.0)
+            return True
+        return False
+
+    def kill(self):
+        if self._popen and self._popen.poll() is None:
+            self._popen.kill()
+
+###############################################################################
+## Supervisor
+###############################################################################
+class ProcessSupervisor:
+    """Runs child processes concurrently and turns their output into ProcessEvents."""
+
+    def __init__(self):
+        self._events = queue.Queue()
+        self._running = set()
+
+    def spawn(self, cmd, name=None, env=None, cwd=None):
+        """Start a child. Raises FileNotFoundError / OSError like subprocess.Popen."""
+        process = SupervisedProcess(cmd, name)
+        process._popen = subprocess.Popen(process.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                                          text=True, encoding='utf-8', errors='replace', bufsize=1, shell=False, env=env, cwd=cwd)
+        process.started = time.monotonic()
+        process._open_streams = 2
+        self._running.add(process)
+        for stream_name, stream in (("stdout", process._popen.stdout), ("stderr", process._popen.stderr)):
+            threading.Thread(target=self._pump, args=(process, stream_name, stream), daemon=True, name=f"{process.name}-{stream_name}").start()
+        return process
+
+    def _pump(self, process, stream_name, stream):
+        """Reader thread: forward every line as soon as it arrives; None marks end of stream."""
+        try:
+            for line in iter(stream.readline, ''):
+                self._events.put((process, stream_name, line.rstrip("\r\n")))
+        finally:
+            stream.close()
+            self._events.put((process, stream_name, None))
+
+    def events(self):
+        """Yield ProcessEvents of all running children until every one of them has exited."""
+        while self._running:
+            process, stream_name, line = self._events.get()
+            now = time.monotonic()
+            if line is None:
+                process._open_streams -= 1
+                if process._open_streams == 0:
+                    process.returncode = process._popen.wait()
+                    process.ended = now
+                    if process.phases:
+                        process.phases[-1][2] = now
+                    if process.returncode == 0:
+                        process.progress = 1.0
+                    self._running.discard(process)
+                    yield ProcessEvent("exit", process, None, None, process.current_phase, process.progress)
+                continue
+            if not line.strip():
+                continue
+            (process.stdout_lines if stream_name == "stdout" else process.stderr_lines).append(line)
+            yield ProcessEvent("line", process, stream_name, line, process.current_phase, process.progress)
+
+            phase = detect_phase(line)
+            if phase and phase != process.current_phase:
+                process._enter_phase(phase, now)
+                process._update_progress(0)
+                yield ProcessEvent("phase", process, stream_name, line, phase, process.progress)
+            percent = detect_percent(line)
+            if percent is not None and process._update_progress(percent):
+                yield ProcessEvent("progress", process, stream_name, line, process.current_phase, process.progress)
+
+    def run(self, on_event=None):
+        """Consume events until all children exited, calling on_event(event) for each one."""
+        for event in self.events():
+            if on_event:
+                on_event(event)
+
+    def kill_all(self):
+        for process in list(self._running):
+            process.kill()
+
+def run_supervised(cmd, on_event=None, name=None):
+    """Run one command to completion under a supervisor and return its SupervisedProcess."""
+    supervisor = ProcessSupervisor()
+    process = supervisor.spawn(cmd, name)
+    try:
+        supervisor.run(on_event)
+    except BaseException:
+        supervisor.kill_all() # Ctrl+C or a failing callback must not leave wintuner running
+        raise
+    return process
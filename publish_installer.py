@@ -23,16 +23,35 @@
 ## (Description and other comments remain the same)
 ##
 
+import argparse
+import itertools
 import json
-import subprocess
+import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import urllib.request
-import urllib.parse # Import urlencode
-import urllib.error
 from colorama import Fore, Style, init
-from alive_progress import alive_bar
+from console import console_input, console_print, error_msg, hold_output
+from graph_auth import get_access_token
+from http_client import configure as configure_http_client
+from graph_throttle import configure as configure_graph_throttle, format_throttle_stats, throttle_stats
+from intune_inventory import find_published_app_id, intune_app_exists, iter_inventory_apps
+from app_index import AppIndex, exact_matches
+from app_inventory import AppInventory, iter_records
+from winget_catalog import get_catalog_name, get_catalog_version, open_catalog
+from catalog_search import resolve_package_id
+from outdated_apps import find_outdated_apps
+from winget_version import compare_versions, newest_version, sort_versions
+from package_cache import get_package_cache, variant_download_dir, variant_name
+from report_export import export_rows, open_output
+from publish_ledger import find_intune_app_ids, get_publish_ledger, package_fingerprint
+from run_journal import TERMINAL_STAGES, RunJournal, find_resumable_journal, get_journal_dir, read_journal
+from process_supervisor import run_supervised
+from app_assignments import assign_apps, format_assignment, parse_assignment_policy
+from telemetry import configure as configure_telemetry, current_span, flush as flush_telemetry, record_span, span
+from tenants import app_label, get_tenant_config, get_tenant_configs, is_multi_tenant
 
 init(autoreset=True)
 
@@ -49,11 +68,15 @@ def load_config(config_file="config.json"):
         # Ensure required directories exist
         Path(config['wintuner_download_dir']).mkdir(parents=True, exist_ok=True)
         Path(config.get('temp_package_dir', 'temp_packages')).mkdir(parents=True, exist_ok=True) # Optional temp dir
+        Path(config.get('log_dir', 'logs')).mkdir(parents=True, exist_ok=True) # Per-app command logs for batch runs
         # Basic validation
         required_keys = ['intune_tenant_id', 'intune_client_id', 'intune_client_secret', 'wintuner_download_dir']
         if not all(key in config for key in required_keys):
              missing = [key for key in required_keys if key not in config]
              raise KeyError(f"Missing required keys in config: {', '.join(missing)}")
+        configure_http_client(config) # Endpoints / timeouts of the shared pooled HTTP client
+        configure_graph_throttle(config) # Rate limits / retries of all Graph and token requests
+        configure_telemetry(config) # Spans / metrics files, off unless trace_file or metrics_file is set
         return config
     except FileNotFoundError:
         error_msg(f"Configuration file '{config_file}' not found", f"Please create it in the script directory: {script_directory}")
@@ -68,331 +91,265 @@ def load_config(config_file="config.json"):
 ###############################################################################
 ## STEP 5: Intune App Check (Report Based)
 ###############################################################################
-def check_intune_app_report_based(package_id, config):
-    """Check if the app exists in Intune by comparing against a generated report."""
-    print(f"\n{Fore.CYAN}Checking Intune for apps matching '{package_id}' using Intune App Report...")
-
-    # Process package_id to get only the part before the first dot (if any) for broader matching
-    processed_package_id_match = package_id
-    if "." in processed_package_id_match:
-        processed_package_id_match = processed_package_id_match.split(".")[0]
-
-    # Generate report filtered by the processed ID part
-    report_output = generate_intune_app_report(config, package_id_filter=processed_package_id_match, print_report=False) # Don't print full report here
-
+def build_app_index(config):
+    """Load the Intune inventory once and index it for duplicate checks. Returns None on failure."""
+    report_output = generate_intune_app_report(config, print_report=False) # Don't print full report here
     if report_output is None: # Handle case where report generation failed (e.g., bad token)
+        return None
+    return AppIndex(report_output)
+
+def check_intune_app_report_based(package_id, config, app_index=None):
+    """Check if the app exists in Intune using the indexed Intune App Report.
+
+    Returns a list of match dicts (report rows with a 'matchType' of "exact" or "prefix"),
+    an empty list if nothing matches, or None if the report could not be retrieved. Only
+    the exact ones (app_index.exact_matches) count as the app being in Intune.
+    Pass app_index to check a whole batch against a single inventory fetch.
+    """
+    if app_index is None:
+        app_index = build_app_index(config)
+        if app_index is None:
+            return None  # Indicate check failure
+    return app_index.match(package_id, get_catalog_name(package_id, config))
+
+def print_intune_matches(package_id, matches):
+    """Print the result of check_intune_app_report_based for one app."""
+    if matches is None:
         print(f"{Fore.YELLOW}⚠️ Could not retrieve Intune App Report to check for existing apps.")
-        return False  # Indicate check failure
-
-    apps_found = []
-    if report_output: # Check if report_output is not empty
-        for app_info in report_output: # Iterate through the returned list of dicts
-            display_name = app_info.get('displayName', 'N/A')
-            # Process display name from report to get only the first part
-            processed_display_name_match = display_name
-            if "." in processed_display_name_match:
-                processed_display_name_match = processed_display_name_match.split(".")[0]
-
-            # Compare processed package_id with processed display_name
-            if processed_package_id_match.lower() in processed_display_name_match.lower():
-                apps_found.append(app_info) # Add matching app info to the list
-
-    if apps_found:
+        return
+    existing = exact_matches(matches)
+    related = [app_info for app_info in matches if app_info not in existing]
+    if existing:
         print(f"{Fore.YELLOW}Found the following matching app(s) in Intune:")
-        for app_info in apps_found:
-            original_display_name = app_info.get('originalDisplayName', 'Unknown App')
-            print(f"  - '{original_display_name}' (Version: {app_info.get('displayVersion', 'N/A')}, ID: {app_info.get('id', 'N/A')})")
-        return True # Indicate that at least one match was found
     else:
-        print(Fore.GREEN + f"No app with name containing '{package_id}' found in Intune based on the report.")
-        return False
+        print(Fore.GREEN + f"No app matching '{package_id}' found in Intune based on the report.")
+    for heading, apps in ((None, existing), ("Other apps of the same publisher (for information, they do not block publishing):", related)):
+        if heading and apps: print(f"{Fore.BLUE}{heading}")
+        for app_info in apps:
+            original_display_name = app_info.get('originalDisplayName', 'Unknown App')
+            print(f"  - [{app_info['matchType']}] '{original_display_name}' (Version: {app_info.get('displayVersion', 'N/A')}, ID: {app_info.get('id', 'N/A')})")
 
 ###############################################################################
 ## STEP 9: Intune App Report Generation (Fixed SyntaxError)
 ###############################################################################
-def get_intune_apps(token, package_id_filter=None):
-    """Retrieves Intune apps using Microsoft Graph API, optionally filters by display name containing package_id_filter."""
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json", # Good practice to include Accept header
-        "ConsistencyLevel": "eventual" # Required for certain filters/counts
-    }
-    # Use urlencode for query parameters
-    base_uri = "https://graph.microsoft.com/v1.0/deviceAppManagement/mobileApps"
-    params = {'$top': '999'} # Fetch maximum allowed per page to reduce requests
-    if package_id_filter:
-        # Add parameters for filtering and counting
-        params['$filter'] = f"contains(tolower(displayName), '{package_id_filter.lower()}')"
-        params['$count'] = 'true' # Required header ConsistencyLevel is set
-
-    # Construct the initial URI with properly encoded parameters
-    uri = base_uri + "?" + urllib.parse.urlencode(params)
-
-    all_apps = []
-    print(f"{Fore.BLUE}Fetching Intune apps... (Filter: {package_id_filter or 'None'})", end='', flush=True)
-    while uri:
-        print(".", end='', flush=True) # Progress indicator
-        try:
-            # Ensure the request uses the potentially updated URI with encoded params
-            req = urllib.request.Request(uri, headers=headers, method='GET') # Explicitly GET
-            with urllib.request.urlopen(req, timeout=45) as response: # Increased timeout slightly
-                if response.status != 200:
-                     error_body = "N/A"
-                     try: # Try to read body
-                         error_body = response.read().decode('utf-8', errors='replace')
-                     except Exception: pass
-                     error_msg("Error fetching apps from Intune", f"HTTP Status: {response.status}, Body: {error_body}")
-                     return None # Indicate failure
-                data = json.loads(response.read().decode('utf-8'))
-                apps = data.get('value', [])
-                all_apps.extend(apps)
-                # IMPORTANT: Use the full URL provided in @odata.nextLink for pagination
-                uri = data.get('@odata.nextLink')
-        except urllib.error.HTTPError as e:
-            # --- FIX: Corrected Syntax Error ---
-            error_body = "N/A"
-            try:
-                error_body = e.read().decode('utf-8', errors='replace') # Try reading the body
-            except Exception:
-                pass # Ignore if reading fails
-            # --- End of FIX ---
-            error_msg(f"Error fetching apps from Intune (HTTP {e.code})", f"Reason: {e.reason} for URL: {repr(uri)}\nResponse: {error_body}")
-            print() # Newline after progress dots
-            return None # Indicate failure
-        except Exception as e:
-            error_msg(f"Unexpected error fetching apps for URL: {repr(uri)}", e)
-            print() # Newline after progress dots
-            return None # Indicate failure
-
-    print(f" {Fore.GREEN}Done. Found {len(all_apps)} apps.") # Report count
-    return all_apps
-
 def generate_report_output(apps):
-    """Generates a formatted report list of Intune apps (list of dictionaries)."""
-    if not apps:
-        return [] # Return empty list if no apps
-
-    report_output_list = []
-    for app in apps:
-        name = app.get('displayName', 'N/A')
-        original_name = name # Store original name
-
-        processed_name = name # Keep processed name logic if needed elsewhere
-        if "." in processed_name:
-            processed_name = processed_name.split(".")[0]
-
-        platform = determine_platform(app.get('@odata.type', ''))
-        version = app.get('displayVersion', 'N/A') or app.get('committedContentVersion', 'N/A') or app.get('appVersion', 'N/A') or 'N/A' # Ensure default
-        # Field name for VPP token might be vppTokenAppleId or similar, adjust if needed based on Graph API output
-        vpp_token_name = app.get('vppTokenAppleId', 'N/A') if platform == "iOS VPP" else 'N/A'
-        assigned = 'Yes' if app.get('isAssigned') else 'No'
-        developer = app.get('publisher', 'N/A')
-
-        app_info = {
-            "displayName": processed_name,
-            "originalDisplayName": original_name, # Keep the original full name
-            "platform": platform,
-            "displayVersion": version,
-            "vppTokenName": vpp_token_name, # Include VPP Token Name in data
-            "isAssigned": assigned,
-            "publisher": developer,
-            "id": app.get('id', 'N/A')
-        }
-        report_output_list.append(app_info)
-
-    return report_output_list
+    """Build the report of Intune apps as an AppInventory (compact records, see app_inventory.py)."""
+    return AppInventory.from_apps(apps or [])
+
+def iter_report_output(apps):
+    """Yield one report record per app as the apps arrive (apps may be any iterable, e.g. a Graph stream)."""
+    return iter_records(apps)
+
+REPORT_COLUMNS = [ # (report key, title, width) of the Intune app report table
+    ("originalDisplayName", "Name", 40), # Use original name for display
+    ("platform", "Platform", 13),
+    ("displayVersion", "Version", 15),
+    ("vppTokenName", "VPP Token Name", 20),
+    ("isAssigned", "Assigned", 10),
+    ("publisher", "Developer", 24)
+]
+EXPORT_COLUMNS = REPORT_COLUMNS + [("id", "Id", 36)]
 
 def print_formatted_report(report_data):
-    """Prints the report data list in a formatted table to the console."""
-    if not report_data:
-        print(f"{Fore.YELLOW}No app data to display in the report.")
-        return
+    """Prints the report data (list or stream of dicts) in a fixed-layout table, written in blocks as rows arrive.
 
-    col_widths = {
-        "Name": 40,
-        "Platform": 13, # Slightly wider
-        "Version": 15,
-        "VPP Token Name": 20, # Restored & Wider
-        "Assigned": 10,
-        "Developer": 24
-    }
-    border_line = "+" + "+".join(["-" * (width + 2) for width in col_widths.values()]) + "+"
+    Returns the number of rows printed.
+    """
+    report_rows = iter(report_data or [])
+    first_row = next(report_rows, None)
+    if first_row is None:
+        print(f"{Fore.YELLOW}No app data to display in the report.")
+        return 0
 
     print("\n" + Fore.CYAN + "--- Intune App Report ---")
-    print(border_line)
-    header = "|"
-    for col, width in col_widths.items():
-        header += " " + f"{col:<{width}}" + " |"
-    print(header)
-    print(border_line)
-
-    for app_info in report_data:
-        name = app_info.get('originalDisplayName', 'N/A') # Use original name for display
-        platform = app_info.get('platform', 'N/A')
-        version = app_info.get('displayVersion', 'N/A')
-        vpp_token_name = app_info.get('vppTokenName', 'N/A') # Get VPP token data
-        assigned = app_info.get('isAssigned', 'N/A')
-        developer = app_info.get('publisher', 'N/A')
-
-        # Truncate fields safely before formatting
-        name_disp = (name[:col_widths['Name'] - 1] + '…') if len(name) > col_widths['Name'] else name
-        platform_disp = (platform[:col_widths['Platform'] - 1] + '…') if len(platform) > col_widths['Platform'] else platform
-        version_disp = (version[:col_widths['Version'] - 1] + '…') if len(version) > col_widths['Version'] else version
-        vpp_disp = (vpp_token_name[:col_widths['VPP Token Name'] - 1] + '…') if len(vpp_token_name) > col_widths['VPP Token Name'] else vpp_token_name
-        assigned_disp = (assigned[:col_widths['Assigned'] - 1] + '…') if len(assigned) > col_widths['Assigned'] else assigned
-        dev_disp = (developer[:col_widths['Developer'] - 1] + '…') if len(developer) > col_widths['Developer'] else developer
-
-        row = (
-            f"| {name_disp:<{col_widths['Name']}} | "
-            f"{platform_disp:<{col_widths['Platform']}} | "
-            f"{version_disp:<{col_widths['Version']}} | "
-            f"{vpp_disp:<{col_widths['VPP Token Name']}} | " # Display VPP token
-            f"{assigned_disp:<{col_widths['Assigned']}} | "
-            f"{dev_disp:<{col_widths['Developer']}} |"
-        )
-        print(row)
-
-    print(border_line)
+    row_count = export_rows(itertools.chain((first_row,), report_rows), REPORT_COLUMNS, 'table')
     print(f"{Fore.CYAN}--- End of Report ---")
+    return row_count
 
+def export_intune_app_report(config, fmt='table', output=None, package_id_filter=None, refresh=False):
+    """Stream the Intune app report as table / csv / jsonl to output (default stdout) without collecting it.
 
-def determine_platform(odata_type):
-    """Determine app platform based on @odata.type."""
-    odata_type = odata_type.lower() # Case-insensitive check
-    if not odata_type: return "Unknown Type"
-    if "win32lobapp" in odata_type: return "Windows"
-    if "windowsuniversalappx" in odata_type: return "Windows UWP"
-    if "microsoftstoreforbusinessapp" in odata_type: return "Win Store"
-    if "managedandroidlobapp" in odata_type: return "Android LOB"
-    if "androidstoreapp" in odata_type: return "Android Store"
-    if "ioslobapp" in odata_type: return "iOS LOB"
-    if "iosvppapp" in odata_type: return "iOS VPP"
-    if "macoslobapp" in odata_type: return "macOS LOB"
-    if "macosdmgapp" in odata_type: return "macOS DMG"
-    if "microsoftedge" in odata_type: return "Edge" # MicrosoftEdgeApp
-    if "webapp" in odata_type: return "Web App" # WebApp
-    # Extract simple type if complex one not matched
-    simple_type = odata_type.split('.')[-1]
-    return simple_type.replace('app', '').capitalize() or "Other"
-
-def generate_intune_app_report(config, package_id_filter=None, print_report=True):
-    """Generates Intune app report data, optionally filters, optionally prints."""
+    Returns the number of rows written, or None if the inventory could not be synchronized.
+    """
+    apps = iter_inventory_apps(config, package_id_filter=package_id_filter, refresh=refresh)
+    if apps is None:
+        print(f"{Fore.YELLOW}⚠️ Failed to synchronize the Intune inventory for report generation.")
+        return None
+    if fmt == 'table' and not output:
+        return print_formatted_report(iter_report_output(apps))
+    with open_output(output) as stream:
+        return export_rows(iter_report_output(apps), EXPORT_COLUMNS if fmt != 'table' else REPORT_COLUMNS, fmt, stream=stream)
 
-    print(f"{Fore.CYAN}Generating Intune app report data...")
-    token = get_access_token(config)
-    if not token:
-        print(f"{Fore.YELLOW}⚠️ Failed to retrieve access token for report generation.")
-        return None # Indicate failure
+def generate_intune_app_report(config, package_id_filter=None, print_report=True, refresh=False):
+    """Generates Intune app report data from the local inventory, optionally filters, optionally prints.
 
-    # Fetch apps, potentially filtered (uses the fixed get_intune_apps)
-    apps = get_intune_apps(token, package_id_filter=package_id_filter)
+    Returns the apps as an AppInventory (records with filter / sort / group-by queries), or None.
+    """
+
+    print(f"{Fore.CYAN}Generating Intune app report data...")
+    # Apps come from the synced local inventory (incremental Graph sync, see intune_inventory.py)
+    apps = iter_inventory_apps(config, package_id_filter=package_id_filter, refresh=refresh)
     if apps is None: # Check if fetching failed
+        print(f"{Fore.YELLOW}⚠️ Failed to synchronize the Intune inventory for report generation.")
         return None # Propagate failure
 
-    # Generate the report data (list of dictionaries)
-    report_data = generate_report_output(apps)
-
+    # Generate the report records, printing rows as they are produced
+    report_data = AppInventory()
+    report_rows = iter_report_output(apps)
     if print_report:
-        print_formatted_report(report_data) # Uses the fixed print function
+        print_formatted_report(collect_rows(report_rows, report_data.records))
+    else:
+        report_data.records.extend(report_rows)
 
-    return report_data # Always return the data list
+    return report_data # Always return the data
 
+def collect_rows(rows, sink):
+    """Pass rows through unchanged while appending each one to sink."""
+    for row in rows:
+        sink.append(row)
+        yield row
 
-###############################################################################
-## STEP 6: Microsoft Graph API Access Token Retrieval (Fixed SyntaxError)
-###############################################################################
-def get_access_token(config):
-    """Get access token for Microsoft Graph API using client credentials via urllib."""
-    try:
-        tenant_id = config['intune_tenant_id']
-        client_id = config['intune_client_id']
-        client_secret = config['intune_client_secret'] # Ensure this is handled securely
-
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        url = f"{authority}/oauth2/v2.0/token"
-        data = urllib.parse.urlencode({
-            'grant_type': 'client_credentials',
-            'client_id': client_id,
-            'client_secret': client_secret,
-            'scope': 'https://graph.microsoft.com/.default' # Scope for client credentials
-        }).encode('utf-8')
-
-        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"}, method='POST') # Explicitly POST
-
-        with urllib.request.urlopen(req, timeout=30) as response: # Added timeout
-            if response.status == 200:
-                result = json.loads(response.read().decode('utf-8'))
-                if "access_token" in result:
-                    return result['access_token']
-                else:
-                    error_msg("MSAL Authentication Error (Token not found)", result.get("error_description", "No error description provided."))
-                    return None
-            else:
-                 error_body = "N/A"
-                 try: # Try reading body
-                     error_body = response.read().decode('utf-8', errors='replace')
-                 except Exception: pass
-                 error_msg("MSAL Authentication Error", f"HTTP Status {response.status}, Body: {error_body}")
-                 return None
-
-    except urllib.error.HTTPError as e:
-        # --- FIX: Corrected Syntax Error ---
-        error_body = "N/A"
-        try:
-            error_body = e.read().decode('utf-8', errors='replace') # Try reading the body
-        except Exception:
-            pass # Ignore if reading fails
-        # --- End of FIX ---
-        error_msg("MSAL Authentication HTTP Error", f"Code: {e.code}, Reason: {e.reason}\nResponse Body: {error_body}")
-        return None
-    except urllib.error.URLError as e:
-        error_msg("MSAL Authentication Network Error", str(e.reason))
-        return None
-    except Exception as e:
-        error_msg("MSAL Authentication Exception", str(e))
+
+def get_outdated_app_queue(config):
+    """Diff the Intune inventory against the winget catalog and return the outdated PackageIds (None on failure)."""
+    report_data = generate_intune_app_report(config, print_report=False)
+    if report_data is None:
         return None
+    started = time.perf_counter()
+    outdated = find_outdated_apps(report_data, open_catalog(config))
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{Fore.CYAN}--- Outdated Intune Apps ({len(outdated)} of {len(report_data)} apps, diffed in {elapsed * 1000:.0f} ms) ---")
+    for item in outdated:
+        print(f"  {Fore.YELLOW}{item['PackageId']:<45}{Style.RESET_ALL} {item['deployedVersion']:>16} -> {Fore.GREEN}{item['catalogVersion']}")
+    return [item['PackageId'] for item in outdated]
+
+def merge_outdated_queues(tenant_configs):
+    """Outdated PackageIds of all tenants, in first-seen order (None if no tenant could be diffed)."""
+    merged, any_diffed = {}, False
+    for tenant_config in tenant_configs:
+        print(f"\n{Fore.CYAN}{Style.BRIGHT}Tenant {tenant_config['tenant_name']}")
+        queue = get_outdated_app_queue(tenant_config)
+        if queue is not None:
+            any_diffed = True
+            for package_id in queue:
+                merged.setdefault(package_id.lower(), package_id)
+    return list(merged.values()) if any_diffed else None
 
 ###############################################################################
 ## STEP 4: Local Package Check
 ###############################################################################
+def resolve_package_version(package_id, version, config):
+    """Return the concrete version to package: the requested one, else the catalog's latest (None if unknown)."""
+    return version or get_catalog_version(package_id, config)
+
+def get_local_package_dir(package_id, version, config):
+    """Return the local package directory that can be reused for package_id, or None.
+
+    Only complete packages qualify: the folder must have a cache manifest and still
+    match it (package_cache), so folders left behind by an interrupted run are never
+    reused. With an explicit version only that version's folder qualifies. Without
+    one, the newest local version is reused as long as it is not older than the
+    catalog's latest version (or the legacy 'latest' folder if the catalog does not
+    know the package).
+    """
+    cache = get_package_cache(config)
+    app_dir = Path(config['wintuner_download_dir']) / package_id
+    if version:
+        return app_dir / version if cache.verify(package_id, version) else None
+
+    sealed_versions = [entry.name for entry in app_dir.iterdir() if entry.is_dir() and cache.is_sealed(package_id, entry.name)] if app_dir.is_dir() else []
+    catalog_version = get_catalog_version(package_id, config)
+    candidates = sort_versions([name for name in sealed_versions if name != 'latest'], reverse=True)
+    if catalog_version is None and 'latest' in sealed_versions:
+        candidates.insert(0, 'latest')
+    for local_version in candidates:
+        if catalog_version is not None and compare_versions(local_version, catalog_version) < 0:
+            break # Everything from here on is older than the catalog: package again
+        if cache.verify(package_id, local_version):
+            return app_dir / local_version
+    return None
+
 def check_local_package(package_id, version, config):
-    """Check if a local package directory exists for the specific version or latest."""
-    version_folder = version if version else 'latest'
-    package_path = Path(config['wintuner_download_dir']) / package_id / version_folder
-    return package_path.is_dir()
+    """Check if a reusable local package directory exists for the specific version or the current latest."""
+    return get_local_package_dir(package_id, version, config) is not None
 
 ###############################################################################
-## STEP 7: Command Execution with Alive-Progress Bar
+## STEP 4b: Batch App ID Check (Catalog Fuzzy Search)
 ###############################################################################
-def run_command_with_progress(cmd, description):
-    """Execute a command with alive-progress bar and capture output."""
-    stdout_lines = []
-    stderr_lines = []
-    try:
-        # Message is now printed ONLY by alive_bar title and the initial print here
-        print(f"{Fore.CYAN}🚀 {description}...")
-        # Ensure command args are strings
-        cmd_str_list = [str(item) for item in cmd]
-        process = subprocess.Popen(cmd_str_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace', shell=False) # Explicitly shell=False
-
-        with alive_bar(total=None, title=f"{Fore.YELLOW}{description}", theme='smooth', length=30) as bar:
-            while process.poll() is None:
-                time.sleep(0.1)
-                bar()
-
-        stdout, stderr = process.communicate()
-
-        if stdout: stdout_lines = stdout.strip().splitlines()
-        if stderr: stderr_lines = stderr.strip().splitlines()
-
-        if process.returncode != 0:
-            error_msg(f"Error during {description} (Return Code: {process.returncode})", "\n".join(stderr_lines) or "\n".join(stdout_lines) or "No output.")
-            return False, stdout_lines, stderr_lines
-        else:
-            print(f"{Fore.GREEN}✅ {description} completed successfully.")
-            return True, stdout_lines, stderr_lines
+def check_app_id(package_id, config, interactive=False):
+    """Check one App ID against the winget catalog. Returns (App ID to use or None to drop it, in catalog).
+
+    IDs in the catalog take its spelling; a typo with one clear match is corrected
+    (unless config 'catalog_autocorrect' is false). For other IDs the ranked suggestions
+    are printed: interactively the user picks one, keeps the ID as typed or drops it,
+    unattended runs keep it as typed. Raises OSError / ValueError if there is no catalog.
+    """
+    resolved, suggestions = resolve_package_id(package_id, config)
+    if resolved and (not suggestions or config.get('catalog_autocorrect', True)):
+        if resolved != package_id:
+            print(f"{Fore.BLUE}🔧 '{package_id}' -> '{resolved}'{' (closest catalog match)' if suggestions else ''}")
+        return resolved, True
+    if not suggestions:
+        print(f"{Fore.YELLOW}⚠️ '{package_id}' is not in the winget catalog and nothing similar was found.")
+        return package_id, False
+    print(f"{Fore.YELLOW}⚠️ '{package_id}' is not in the winget catalog. Did you mean:")
+    for number, entry in enumerate(suggestions, 1):
+        print(f"  [{number}] {Fore.GREEN}{entry['PackageId']:<40}{Style.RESET_ALL} {entry['Name']} {entry['Version']}")
+    choice = input(f"{Fore.GREEN}👉 Choose a number, ENTER to keep '{package_id}', or 'd' to drop it: ").strip().lower() if interactive else ""
+    if choice == 'd':
+        return None, False
+    if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+        return suggestions[int(choice) - 1]['PackageId'], True
+    return package_id, False
+
+def check_app_jobs(app_jobs, config, interactive=False):
+    """Run check_app_id on the ID of every job before any packaging starts.
+
+    Returns (jobs with checked IDs, duplicates and dropped IDs removed; IDs kept although
+    they are not in the catalog). Without a usable catalog the jobs are returned unchecked.
+    """
+    checked_jobs, unresolved, seen = [], [], set()
+    for job in app_jobs:
+        try:
+            package_id, in_catalog = check_app_id(job['id'], config, interactive)
+        except (OSError, ValueError) as e:
+            print(f"{Fore.YELLOW}⚠️ Winget catalog unavailable, App IDs are not checked: {e}")
+            return app_jobs, []
+        if package_id is None:
+            continue
+        if package_id.lower() in seen:
+            print(f"{Fore.YELLOW}'{package_id}' is already in the batch, ignoring the duplicate.")
+            continue
+        seen.add(package_id.lower())
+        if not in_catalog:
+            unresolved.append(package_id)
+        checked_jobs.append(dict(job, id=package_id))
+    return checked_jobs, unresolved
 
+###############################################################################
+## STEP 7: Supervised Command Execution
+###############################################################################
+def run_command_with_progress(cmd, description, log_file):
+    """Run a wintuner command under process_supervisor and capture its output.
+
+    Output is read line by line while the command runs and streamed to the per-app
+    log_file, so pipeline workers never interleave raw output on the console. The
+    console gets one status line per wintuner phase (download, extract, intunewin,
+    upload) with the overall progress, and the result line with the seconds per phase.
+    Ctrl+C kills the child. Each call is a "command" span (return code, elapsed time,
+    seconds per phase).
+    """
+    with span("command", command=str(cmd[1]) if len(cmd) > 1 else str(cmd[0]), description=description) as command_span:
+        success, stdout_lines, stderr_lines = _run_command(cmd, description, log_file)
+        if not success:
+            command_span.error((stderr_lines or stdout_lines or ["No output."])[-1])
+        return success, stdout_lines, stderr_lines
+
+def _run_command(cmd, description, log_file):
+    """run_command_with_progress without the span."""
+    try:
+        return run_command_logged([str(item) for item in cmd], description, log_file) # Ensure command args are strings
     except FileNotFoundError:
         error_msg(f"Error during {description}", f"Command not found: '{cmd[0]}'. Is wintuner installed and in PATH?")
         return False, [], [f"Command not found: {cmd[0]}"]
@@ -400,130 +357,1040 @@ def run_command_with_progress(cmd, description):
         error_msg(f"An unexpected error occurred during {description}", str(e))
         return False, [], [str(e)]
 
+def run_command_logged(cmd_str_list, description, log_file):
+    """Run a supervised command, streaming its output to a per-app log file. See run_command_with_progress."""
+    # Never write the bearer token passed to 'wintuner publish' into the log
+    logged_cmd = ["***" if i > 0 and cmd_str_list[i - 1] == "--token" else item for i, item in enumerate(cmd_str_list)]
+    console_print(f"{Fore.CYAN}🚀 {description}... (output: {log_file})")
+
+    Path(log_file).parent.mkdir(parents=True, exist_ok=True) # A missing log folder must not look like a missing wintuner
+    with open(log_file, 'a', encoding='utf-8') as log:
+        log.write(f"\n=== {description} ({time.strftime('%Y-%m-%d %H:%M:%S')}) ===\n")
+        log.write(f"$ {' '.join(logged_cmd)}\n")
+        log.flush()
+
+        def on_event(event):
+            if event.kind == "line":
+                log.write(("[stderr] " if event.stream == "stderr" else "") + event.line + "\n")
+                log.flush() # 'tail -f' on the log follows the command live
+            elif event.kind == "phase":
+                console_print(f"{Fore.BLUE}   {description}: {event.phase}... ({event.progress:.0%})")
+        process = run_supervised(cmd_str_list, on_event)
+
+        phase_summary = process.format_phase_durations()
+        if phase_summary:
+            log.write(f"--- phases: {phase_summary} ---\n")
+        log.write(f"=== Return Code: {process.returncode} ({process.elapsed:.1f}s) ===\n")
+
+    stdout_lines, stderr_lines = process.stdout_lines, process.stderr_lines
+    current_span().set(returncode=process.returncode, elapsed=round(process.elapsed, 3), phases=process.phase_durations())
+    if process.returncode != 0:
+        last_line = (stderr_lines or stdout_lines or ["No output."])[-1]
+        console_print(f"{Fore.RED}❌ {description} failed (Return Code: {process.returncode}): {last_line} - see {log_file}")
+        return False, stdout_lines, stderr_lines
+    phase_summary = f"; {phase_summary}" if phase_summary else ""
+    console_print(f"{Fore.GREEN}✅ {description} completed successfully ({process.elapsed:.1f}s{phase_summary}).")
+    return True, stdout_lines, stderr_lines
+
+###############################################################################
+## STEP 9b: Batch Pipeline (Concurrent Packaging / Publishing)
+###############################################################################
+def get_app_log_file(package_id, config):
+    """Path of the per-app log that pipeline workers write command output to."""
+    return Path(config.get('log_dir', 'logs')) / f"{package_id}.log"
+
+def package_app(package_id, version, architecture, installer_context, config):
+    """Pipeline stage 1: reuse or create the local package.
+
+    Returns (success, package_version): the concrete version that was packaged or
+    reused (None if it could not be determined, e.g. package not in the catalog).
+
+    Without an explicit version the catalog's latest version is pinned. The bundled
+    catalog can be older than winget: if packaging that version fails (e.g. it was
+    pulled), the package is made once more without --version, i.e. winget's latest.
+    """
+    cache = get_package_cache(config)
+    local_package_dir = get_local_package_dir(package_id, version, config)
+    if local_package_dir:
+        cache.touch(package_id, local_package_dir.name)
+        cache.pin(package_id, local_package_dir.name)
+        console_print(f"{Fore.YELLOW}✔️ [{package_id}] Local package found: {local_package_dir}")
+        return True, (local_package_dir.name if local_package_dir.name != 'latest' else None)
+
+    # Package an explicit version so the folder name is the real version, never 'latest'
+    package_version = resolve_package_version(package_id, version, config)
+    app_dir = Path(config['wintuner_download_dir']) / package_id
+    if package_version and (app_dir / package_version).exists():
+        console_print(f"{Fore.YELLOW}🧹 [{package_id}] Discarding incomplete or modified package folder {app_dir / package_version}")
+        cache.discard(package_id, package_version)
+    package_cmd = [ "wintuner", "package", package_id, "--package-folder", config['wintuner_download_dir'], "--architecture", architecture, "--installer-context", installer_context ]
+    if package_version: package_cmd.extend(["--version", package_version])
+
+    success, _, _ = run_command_with_progress(package_cmd, f"Packaging {package_id}", log_file=get_app_log_file(package_id, config))
+    if not success and package_version and not version:
+        console_print(f"{Fore.YELLOW}⚠️ [{package_id}] Packaging catalog version {package_version} failed (no longer in winget?), retrying with winget's latest version.")
+        cache.discard(package_id, package_version)
+        package_version = None
+        success, _, _ = run_command_with_progress(package_cmd[:-2], f"Packaging {package_id}", log_file=get_app_log_file(package_id, config))
+    if success:
+        # Without a known version, the folder wintuner just created is the newest unsealed one
+        sealed_version = package_version or newest_version(entry.name for entry in app_dir.iterdir() if entry.is_dir() and not cache.is_sealed(package_id, entry.name))
+        if sealed_version:
+            cache.seal(package_id, sealed_version)
+            cache.pin(package_id, sealed_version)
+            for evicted_id, evicted_version in cache.evict():
+                console_print(f"{Fore.BLUE}♻️ Cache budget: evicted {evicted_id} {evicted_version}")
+        package_dir = app_dir / (sealed_version or '')
+        console_print(f"{Fore.GREEN}✅ [{package_id}] Package created: {package_dir}")
+        return True, sealed_version
+    return False, package_version
+
+def publish_app(package_id, version, config, architecture=None, installer_context=None):
+    """Pipeline stage 3: publish a packaged app to Intune.
+
+    Returns (outcome, intune_app_id): outcome is "published", "unchanged" (this exact
+    package was already published to the tenant and the Intune app still exists, per the
+    publish ledger) or None on failure; intune_app_id is None if it is not known.
+    """
+    label = app_label(package_id, config) # 'Mozilla.Firefox @ contoso' while publishing to several tenants
+    access_token = get_access_token(config) # Shared cached token, renewed in the background for long batches
+    if not access_token:
+        console_print(f"{Fore.RED}❌ [{label}] No access token available for publishing.")
+        return None, None
+
+    tenant_id = config['intune_tenant_id']
+    fingerprint = None
+    manifest = get_package_cache(config).read_manifest(package_id, version) if version else None
+    if manifest:
+        fingerprint = package_fingerprint(manifest, package_id, version, architecture, installer_context)
+        ledger = get_publish_ledger(config)
+        entry = ledger.lookup(tenant_id, fingerprint)
+        if entry and entry['intune_app_id'] and not config.get('force_publish'):
+            exists = intune_app_exists(access_token, entry['intune_app_id'])
+            if exists:
+                console_print(f"{Fore.BLUE}⏭️ [{label}] Identical package already published (Intune app {entry['intune_app_id']}), skipping upload.")
+                return "unchanged", entry['intune_app_id']
+            if exists is False:
+                ledger.forget(tenant_id, fingerprint) # Deleted in Intune since: publish again
+
+    publish_cmd = [ "wintuner", "publish", package_id, "--package-folder", config['wintuner_download_dir'], "--tenant", tenant_id, "--token", access_token ]
+    if version: publish_cmd.extend(["--version", version])
+
+    success, stdout_lines, stderr_lines = run_command_with_progress(publish_cmd, f"Publishing {label}", log_file=get_app_log_file(package_id, config))
+    if not success:
+        return None, None
+    console_print(f"{Fore.GREEN}🎉 [{label}] Successfully published to Intune.")
+    intune_app_id = created_app_id(access_token, package_id, version, stdout_lines + stderr_lines, config)
+    if not intune_app_id:
+        console_print(f"{Fore.YELLOW}⚠️ [{label}] Could not confirm the Intune app id of the upload; it is not recorded in the publish ledger.")
+    if fingerprint and intune_app_id:
+        get_publish_ledger(config).record(tenant_id, fingerprint, package_id, version, architecture, installer_context, intune_app_id)
+    return "published", intune_app_id
+
+MAX_APP_ID_CANDIDATES = 3 # Output GUIDs checked in Graph per upload before falling back to the name lookup
+
+def created_app_id(access_token, package_id, version, output_lines, config):
+    """Intune app id of the app a 'wintuner publish' just created, or None if it cannot be confirmed.
+
+    The first few GUIDs of the output that Graph knows as a mobileApp (publish_ledger.find_intune_app_ids),
+    else the single app in Graph with the package's name and version (find_published_app_id).
+    """
+    candidates = find_intune_app_ids(output_lines, exclude=(config.get('intune_tenant_id'), config.get('intune_client_id')))
+    for app_id in candidates[:MAX_APP_ID_CANDIDATES]:
+        if intune_app_exists(access_token, app_id):
+            return app_id
+    return find_published_app_id(access_token, package_id, version, get_catalog_name(package_id, config))
+
+def package_job(job, config):
+    """Package worker: package_app for one pipeline job, timed as an "app.package" span."""
+    with span("app.package", app=job['id'], architecture=job['architecture']) as stage:
+        packaged, package_version = package_app(job['id'], job['version'], job['architecture'], job['installer_context'], config)
+        stage.set(version=package_version)
+        if not packaged:
+            stage.error("packaging failed")
+        return packaged, package_version
+
+def new_batch_results():
+    """Empty result buckets of a batch (see run_batch_pipeline)."""
+    return {"success": [], "unchanged": [], "failed_pkg": [], "failed_pub": [], "skipped": [], "assigned": [], "failed_assign": [], "details": {}}
+
+def has_failures(batch_results):
+    """True if an app failed packaging, publishing or assigning (exit code 1 of unattended runs)."""
+    return bool(batch_results["failed_pkg"] or batch_results["failed_pub"] or batch_results["failed_assign"])
+
+def make_app_jobs(app_id_list, version, architecture, installer_context, check=None, publish=None, assignments=None):
+    """Build pipeline jobs sharing batch-wide settings. check/publish None means: ask interactively."""
+    return [{"id": package_id, "version": version, "architecture": architecture, "installer_context": installer_context,
+             "check": check, "publish": publish, "assignments": assignments or []} for package_id in app_id_list]
+
+def ask_yes_no(question):
+    """Interactive y/n prompt, default n.
+
+    Output of the package / publish workers is held back until the answer is in
+    (console.hold_output), so it cannot split the question or the typed answer; the
+    workers themselves keep running.
+    """
+    return (console_input(question).strip().lower() or 'n') == 'y'
+
+def run_batch_pipeline(app_jobs, config, journal=None, resume_state=None, packaged_versions=None, shared_packages=None):
+    """Package, check, publish and assign a batch of apps with overlapping stages.
+
+    Each job is a dict with id, version, architecture, installer_context, the
+    check (bool) / publish ("always", "never", "if-absent") policies and the
+    assignments to create once the app is published; a policy of None is asked
+    interactively.
+
+    Packaging runs on a worker pool of config['max_workers'] threads (default 4) for the
+    whole batch up front. Apps are then handled in input order as their package becomes
+    ready: the Intune check / publish decisions run on the main thread and the publish
+    itself is handed to a second pool, so publishing app N overlaps with packaging
+    app N+1 and the prompts for the next app.
+
+    Once every upload has finished, the assignments of all apps that are in Intune
+    (published, unchanged or skipped as present) are created together in Graph $batch
+    requests (assign_published_apps).
+
+    Returns the batch_results buckets plus a "details" dict (package ID -> status,
+    version, Intune matches) for machine-readable reporting.
+
+    Every stage transition is written to a run journal (a new one unless journal is
+    given). resume_state (run_journal.read_journal()["apps"]) continues an interrupted
+    run: apps already published / skipped are only reported, packaged apps reuse the
+    recorded version and recorded publish decisions are not asked again.
+
+    packaged_versions ({PackageId: version}) lists apps packaged beforehand (the variants of
+    run_matrix_pipeline); they skip the packaging stage. shared_packages ({PackageId:
+    Future of package_job's (packaged, version)}) are packages being built once for all
+    tenants of a fan-out (run_multi_tenant_pipeline): each app's packaging stage waits for
+    its own future only, so the app moves on as soon as it is packaged.
+    """
+    batch_results = new_batch_results()
+    results_lock = threading.Lock()
+    max_workers = max(1, int(config.get('max_workers', 4)))
+    app_index = None # Indexed Intune inventory, built on the first Intune check of the batch
+    resume_state = resume_state or {}
+    if journal is None:
+        journal = RunJournal.create(get_journal_dir(config), app_jobs)
+
+    def record(bucket, package_id, label=None, journaled=True, **detail):
+        with results_lock:
+            if (label or package_id) not in batch_results[bucket]: batch_results[bucket].append(label or package_id)
+            batch_results["details"].setdefault(package_id, {}).update(detail, status=bucket)
+        if journaled: journal.stage(package_id, bucket, **detail)
+
+    packaged_versions = packaged_versions or {}
+    shared_packages = shared_packages or {}
+
+    def package_stage(job):
+        if job['id'] in packaged_versions:
+            return True, packaged_versions[job['id']]
+        if job['id'] in shared_packages:
+            return shared_packages[job['id']].result()
+        return package_job(job, config)
+
+    def publish_and_record(job, package_version, matches):
+        """Publish worker: the outcome is recorded (and journaled) as soon as the upload ends."""
+        with span("app.publish", app=job['id'], version=package_version, tenant=config.get('tenant_name')) as stage:
+            try:
+                outcome, intune_app_id = publish_app(job['id'], package_version, config, job['architecture'], job['installer_context'])
+            except Exception as e:
+                error_msg(f"Publishing {job['id']}", str(e))
+                outcome, intune_app_id = None, None
+            stage.set(outcome=outcome)
+            if outcome is None:
+                stage.error("publishing failed")
+        detail = {"version": package_version}
+        if intune_app_id: detail["intune_app_id"] = intune_app_id
+        if matches: detail["matches"] = [match.get('id') for match in matches]
+        record({"published": "success", "unchanged": "unchanged"}.get(outcome, "failed_pub"), job['id'], **detail)
+
+    pending_jobs = []
+    for job in app_jobs:
+        previous = resume_state.get(job['id'], {})
+        if previous.get('stage') in TERMINAL_STAGES: # Finished before the interruption
+            record(previous['stage'], job['id'], journaled=False, **{key: value for key, value in previous.items() if key != 'stage'})
+            continue
+        if previous.get('packaged_version'): # Reuse the package made before the interruption
+            job = dict(job, version=previous['packaged_version'])
+        pending_jobs.append(job)
+    if resume_state:
+        print(f"{Fore.BLUE}Resuming run: {len(app_jobs) - len(pending_jobs)} app(s) already done, {len(pending_jobs)} remaining.")
+
+    batch_started, batch_t0 = time.time(), time.perf_counter()
+    scope = [f"variant {config['variant_name']}"] if config.get('variant_name') else []
+    if config.get('tenant_name'): scope.append(f"tenant {config['tenant_name']}")
+    scope_note = f" for {' of '.join(scope)}" if scope else ""
+    print(f"{Fore.BLUE}Starting pipeline{scope_note} with {max_workers} worker(s). Per-app output: {Path(config.get('log_dir', 'logs')).resolve()}")
+    print(f"{Fore.BLUE}Run journal: {journal.path} (continue an interrupted run with --resume)")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="package") as package_pool, \
+         ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="publish") as publish_pool:
+        package_futures = [(job, package_pool.submit(package_stage, job)) for job in pending_jobs]
+        publish_futures = []
+
+        for index, (job, package_future) in enumerate(package_futures):
+            package_id = job['id']
+            try:
+                packaged, package_version = package_future.result()
+            except Exception as e:
+                error_msg(f"Packaging {package_id}", str(e))
+                packaged, package_version = False, None
+            console_print(f"\n{Fore.MAGENTA}{Style.BRIGHT}--- Processing App: {app_label(package_id, config)} ---{Style.RESET_ALL}")
+            if not packaged:
+                console_print(f"{Fore.RED}❌ Failed to create package for {package_id}. Skipping further steps for this app.")
+                record("failed_pkg", package_id, version=package_version); continue
+            journal.stage(package_id, "packaged", packaged_version=package_version)
+
+            previous = resume_state.get(package_id, {})
+            if previous.get('publish_decision') is not None: # Decided before the interruption: do not ask again
+                console_print(f"{Fore.BLUE}Resuming {package_id}: publish decision from the journal ({'publish' if previous['publish_decision'] else 'skip'}).")
+                if previous['publish_decision']:
+                    publish_futures.append(publish_pool.submit(publish_and_record, job, package_version, None))
+                else:
+                    record("skipped", package_id, version=package_version)
+                continue
+
+            # 2. Intune Check (Optional)
+            check_intune = job['check'] if job['check'] is not None else ask_yes_no(f"\n{Fore.YELLOW}🔎 Check Intune for '{package_id}'? (y/n, default n): ")
+            publish_policy = job['publish']
+            proceed_with_publish = True
+            matches = None
+
+            if check_intune:
+                with span("app.check", app=package_id) as stage: # Prompts below are not part of the check time
+                    if app_index is None: # Fetch and index the inventory once for the whole batch
+                        print(f"\n{Fore.CYAN}Loading Intune App Report to check for existing apps...")
+                        app_index = build_app_index(config)
+                    all_matches = check_intune_app_report_based(package_id, config, app_index=app_index) if app_index else None
+                    matches = exact_matches(all_matches) if all_matches is not None else None # Same-publisher apps do not count
+                    stage.set(matches=len(matches) if matches is not None else None)
+                    if matches is None:
+                        stage.error("check failed")
+                with hold_output(): # The matches stay right above the question about them
+                    print_intune_matches(package_id, all_matches)
+                    declined = bool(matches) and publish_policy is None and not ask_yes_no(f"{Fore.YELLOW}❓ App(s) matching '{package_id}' found. Still try publishing? (y/n, default n): ")
+                if matches:
+                    if publish_policy == "if-absent" or declined:
+                        proceed_with_publish = False
+                        print(f"{Fore.YELLOW}Skipping publishing for {package_id} as requested.")
+                        record("skipped", package_id, version=package_version, matches=[match.get('id') for match in matches])
+                elif matches is None and publish_policy == "if-absent":
+                    proceed_with_publish = False # Never publish blindly when the check itself failed
+                    print(f"{Fore.YELLOW}Skipping publishing for {package_id}: Intune check failed.")
+                    record("skipped", package_id, version=package_version, reason="check failed")
+            else:
+                 print(f"{Fore.BLUE}Skipping Intune check for {package_id}.")
+
+            # 3. Publish to Intune (Optional) - runs in the background while the next app is handled
+            if proceed_with_publish:
+                if publish_policy is None:
+                    publish_now = ask_yes_no(f"\n{Fore.YELLOW}🚀 Publish '{package_id}' to Intune? (y/n, default n): ")
+                else:
+                    publish_now = publish_policy != "never"
+                if publish_now:
+                    if not get_access_token(config): # Cached after the first app of the batch
+                        print(f"{Fore.RED}❌ Failed to obtain access token. Cannot publish {package_id} or subsequent apps.")
+                        record("failed_pub", package_id, label=package_id + " (Token Error)", version=package_version, reason="token error")
+                        for _, pending in package_futures[index + 1:]: pending.cancel()
+                        break
+                    journal.stage(package_id, "checked", publish_decision=True, matches=[match.get('id') for match in matches] if matches else None)
+                    publish_futures.append(publish_pool.submit(publish_and_record, job, package_version, matches))
+                else:
+                    print(f"{Fore.YELLOW}Skipping publishing for {package_id}.")
+                    record("skipped", package_id, version=package_version)
+
+        if publish_futures:
+            print(f"\n{Fore.BLUE}Waiting for {len(publish_futures)} publish job(s) to finish...")
+        for publish_future in publish_futures:
+            publish_future.result()
+
+    assign_published_apps(app_jobs, batch_results, config, journal)
+    record_span("batch", batch_started, time.perf_counter() - batch_t0, apps=len(app_jobs),
+                **{bucket: len(names) for bucket, names in batch_results.items() if bucket != "details"})
+    flush_telemetry()
+    if all(job['id'] in batch_results["details"] for job in app_jobs):
+        journal.finish() # Every app reached a final state: nothing left to resume
+    else:
+        journal.close()
+    return batch_results
+
+def resolve_intune_app_id(job, detail, config):
+    """Intune app id of an app published, unchanged or skipped in this batch, for its assignments.
+
+    Taken from the publish outcome, else from the publish ledger (this exact package),
+    else from the single exact Intune match of the check, else from Graph by name and
+    version. Returns (app id or None, reason it is unknown).
+    """
+    if detail.get('intune_app_id'):
+        return detail['intune_app_id'], None
+    version = detail.get('version')
+    manifest = get_package_cache(config).read_manifest(job['id'], version) if version else None
+    if manifest:
+        fingerprint = package_fingerprint(manifest, job['id'], version, job['architecture'], job['installer_context'])
+        entry = get_publish_ledger(config).lookup(config['intune_tenant_id'], fingerprint)
+        if entry and entry['intune_app_id']:
+            return entry['intune_app_id'], None
+    matches = detail.get('matches') or []
+    if len(matches) > 1:
+        return None, f"{len(matches)} Intune apps match, assign them in Intune"
+    if matches:
+        return matches[0], None
+    access_token = get_access_token(config)
+    intune_app_id = find_published_app_id(access_token, job['id'], version, get_catalog_name(job['id'], config)) if access_token else None
+    return intune_app_id, None if intune_app_id else "app not found in Intune"
+
+def assign_published_apps(app_jobs, batch_results, config, journal):
+    """Post-publish step: create the assignment policy of every app of the batch that is in Intune.
+
+    That is apps published now, apps whose identical package was already published
+    ("unchanged") and apps skipped because they are in Intune already; their app id
+    comes from resolve_intune_app_id. All (app, assignment) writes go out together as
+    Graph $batch requests; only sub-requests that failed transiently are retried.
+    Assignments already created (journaled as "assignments_done", e.g. before an
+    interruption) are not sent again.
+    """
+    pending = {}
+    for job in app_jobs:
+        detail = batch_results["details"].get(job['id'], {})
+        if detail.get('status') not in TERMINAL_STAGES or not job.get('assignments'):
+            continue
+        done = detail.get('assignments_done', [])
+        remaining = [assignment for assignment in job['assignments'] if format_assignment(assignment) not in done]
+        if not remaining:
+            continue
+        intune_app_id, reason = resolve_intune_app_id(job, detail, config)
+        if not intune_app_id:
+            if detail['status'] == "skipped" and not detail.get('matches'): # Not published and not in Intune: nothing to assign
+                console_print(f"{Fore.YELLOW}⚠️ [{app_label(job['id'], config)}] Not in Intune, assignments not created.")
+                continue
+            console_print(f"{Fore.RED}❌ [{app_label(job['id'], config)}] Intune app id unknown ({reason}), cannot assign groups.")
+            batch_results["failed_assign"].append(job['id'])
+            detail["assignment_errors"] = [f"Intune app id unknown ({reason})"]
+            continue
+        detail['intune_app_id'] = intune_app_id
+        pending[job['id']] = (intune_app_id, remaining)
+    if not pending:
+        return
+
+    total = sum(len(assignments) for _, assignments in pending.values())
+    print(f"\n{Fore.CYAN}Assigning {len(pending)} published app(s) ({total} assignment(s), Graph $batch)...")
+    with span("batch.assign", apps=len(pending), items=total):
+        outcomes = assign_apps(config, pending)
+    for package_id, outcome in outcomes.items():
+        detail = batch_results["details"][package_id]
+        detail["assignments_done"] = detail.get('assignments_done', []) + outcome["done"]
+        if outcome["errors"]:
+            detail["assignment_errors"] = outcome["errors"]
+            batch_results["failed_assign"].append(package_id)
+            console_print(f"{Fore.RED}❌ [{app_label(package_id, config)}] Assignment failed: {'; '.join(outcome['errors'])}")
+        else:
+            detail.pop("assignment_errors", None)
+            batch_results["assigned"].append(package_id)
+            console_print(f"{Fore.GREEN}👥 [{app_label(package_id, config)}] Assigned: {', '.join(outcome['done'])}")
+        journal.stage(package_id, detail['status'], intune_app_id=detail['intune_app_id'], assignments_done=detail["assignments_done"])
+
+def print_batch_summary(batch_results):
+    """Print the end-of-batch summary of the batch_results buckets."""
+    print(f"\n{Fore.CYAN}{Style.BRIGHT}--- Batch Processing Summary ---")
+    if batch_results["success"]: print(f"{Fore.GREEN}✅ Published Successfully: {', '.join(batch_results['success'])}")
+    if batch_results["unchanged"]: print(f"{Fore.BLUE}⏭️ Already Published (identical package, upload skipped): {', '.join(batch_results['unchanged'])}")
+    if batch_results["failed_pkg"]: print(f"{Fore.RED}❌ Failed Packaging: {', '.join(batch_results['failed_pkg'])}")
+    if batch_results["failed_pub"]: print(f"{Fore.RED}❌ Failed Publishing: {', '.join(batch_results['failed_pub'])}")
+    if batch_results["skipped"]: print(f"{Fore.YELLOW}🟡 Skipped Publishing (User choice or existing): {', '.join(batch_results['skipped'])}")
+    if batch_results["assigned"]: print(f"{Fore.GREEN}👥 Assigned: {', '.join(batch_results['assigned'])}")
+    if batch_results["failed_assign"]: print(f"{Fore.RED}❌ Failed Assigning: {', '.join(batch_results['failed_assign'])}")
+    for line in format_throttle_stats(): print(f"{Fore.BLUE}🌐 {line}")
+    print(f"{Fore.CYAN}-----------------------------")
+
+###############################################################################
+## STEP 9c: Headless (Manifest-Driven) Batch Mode
+###############################################################################
+ARCHITECTURES = ('x64', 'x86', 'arm64')
+INSTALLER_CONTEXTS = ('user', 'system')
+PUBLISH_POLICIES = ('always', 'never', 'if-absent')
+
+def load_manifest(manifest_path, defaults):
+    """Read a batch manifest and return pipeline jobs. Raises ValueError on invalid content.
+
+    Manifest format (every per-app key is optional and falls back to "defaults",
+    then to the command line values in defaults):
+      {"defaults": {"architecture": "x64", "installer_context": "system", "check": true, "publish": "if-absent",
+                    "assignments": ["required:allDevices"]},
+       "apps": ["Zoom.Zoom", {"id": "Mozilla.Firefox", "version": "136.0", "architecture": "arm64", "publish": "always",
+                              "assignments": ["available:<group id>", {"intent": "required", "target": "<group id>", "exclude": true}]}]}
+    A list of architectures or installer contexts (e.g. "architecture": ["x64", "arm64"])
+    packages every combination of them (run_matrix_pipeline).
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"apps": manifest}
+    batch_defaults = dict(defaults, **manifest.get('defaults', {}))
+    jobs = []
+    for app in manifest.get('apps', []):
+        job = dict(batch_defaults, **({"id": app} if isinstance(app, str) else app))
+        jobs.append(validate_job(job))
+    if not jobs:
+        raise ValueError("Manifest contains no apps.")
+    return jobs
+
+def parse_variant_values(package_id, key, value, choices):
+    """One architecture / installer context, or a list of several (given as a list or comma-separated) for a matrix batch."""
+    values = value if isinstance(value, list) else str(value or '').split(',')
+    values = list(dict.fromkeys(str(item).strip() for item in values if str(item).strip()))
+    if not values or any(item not in choices for item in values):
+        raise ValueError(f"{package_id}: {key} must be one or more of {', '.join(choices)}")
+    return values[0] if len(values) == 1 else values
+
+def validate_job(job):
+    """Normalize and validate one headless job dict. Raises ValueError."""
+    package_id = str(job.get('id') or '').strip()
+    if not package_id:
+        raise ValueError(f"App entry without 'id': {job}")
+    architecture = parse_variant_values(package_id, 'architecture', job.get('architecture'), ARCHITECTURES)
+    installer_context = parse_variant_values(package_id, 'installer_context', job.get('installer_context'), INSTALLER_CONTEXTS)
+    if job.get('publish') not in PUBLISH_POLICIES:
+        raise ValueError(f"{package_id}: publish must be one of {', '.join(PUBLISH_POLICIES)}")
+    try:
+        assignments = parse_assignment_policy(job.get('assignments'))
+    except ValueError as e:
+        raise ValueError(f"{package_id}: {e}") from e
+    return {"id": package_id, "version": job.get('version') or None, "architecture": architecture,
+            "installer_context": installer_context, "check": bool(job.get('check')), "publish": job['publish'],
+            "assignments": assignments}
+
+def build_results_document(app_jobs, batch_results, started):
+    """Machine-readable run result: one entry per app plus bucket counts."""
+    apps = []
+    for job in app_jobs:
+        detail = batch_results["details"].get(job['id'], {"status": "not_processed"})
+        apps.append(dict(detail, id=job['id'], architecture=job['architecture'], installer_context=job['installer_context']))
+    return {
+        "started": started,
+        "finished": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "summary": {bucket: len(batch_results[bucket]) for bucket in ("success", "unchanged", "failed_pkg", "failed_pub", "skipped", "assigned", "failed_assign")},
+        "graph_requests": throttle_stats(),
+        "apps": apps
+    }
+
+def run_headless(args, config, tenant_configs=None):
+    """Run one batch from --manifest / --ids without any prompt. Returns the process exit code.
+
+    With tenant_configs (tenants.py) the batch is packaged once and published to every tenant.
+    Apps with several architectures or installer contexts make it a matrix batch (run_matrix_pipeline),
+    published to a single tenant.
+    Exit codes: 0 = every app published (and assigned), already published or skipped by policy,
+    1 = at least one packaging/publishing/assignment failure, 2 = invalid manifest or arguments.
+    """
+    defaults = {"architecture": args.architecture, "installer_context": args.installer_context,
+                "check": args.check, "publish": args.publish, "version": args.version, "assignments": args.assign}
+    try:
+        if args.manifest:
+            app_jobs = load_manifest(args.manifest, defaults)
+        else:
+            app_jobs = [validate_job(dict(defaults, id=package_id)) for package_id in args.ids.split(',') if package_id.strip()]
+    except (OSError, ValueError) as e: # json.JSONDecodeError is a ValueError
+        error_msg("Reading batch definition", str(e))
+        return 2
+    app_jobs, unresolved = check_app_jobs(app_jobs, config)
+    if unresolved and args.strict_ids:
+        error_msg("Checking App IDs", f"Not in the winget catalog: {', '.join(unresolved)}")
+        return 2
+    if not app_jobs:
+        error_msg("Reading batch definition", "No App IDs given.")
+        return 2
+
+    started = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    print(f"\n{Fore.CYAN}Processing unattended batch of {len(app_jobs)} app(s): {', '.join(job['id'] for job in app_jobs)}")
+    if is_matrix_batch(app_jobs):
+        if tenant_configs and len(tenant_configs) > 1:
+            error_msg("Reading batch definition", "A matrix batch is published to one tenant at a time: choose it with --tenant NAME.")
+            return 2
+        variant_results = run_matrix_pipeline(app_jobs, tenant_configs[0] if tenant_configs else config)
+        print_matrix_summary(app_jobs, variant_results)
+        results_document = json.dumps(build_matrix_results_document(app_jobs, variant_results, started), indent=2)
+        failed = any(has_failures(batch_results) for batch_results in variant_results.values())
+    elif tenant_configs:
+        tenant_results = run_multi_tenant_pipeline(app_jobs, config, tenant_configs)
+        print_tenant_summary(tenant_results)
+        results_document = json.dumps(build_tenant_results_document(app_jobs, tenant_results, started), indent=2)
+        failed = any(has_failures(batch_results) for batch_results in tenant_results.values())
+    else:
+        batch_results = run_batch_pipeline(app_jobs, config)
+        print_batch_summary(batch_results)
+        results_document = json.dumps(build_results_document(app_jobs, batch_results, started), indent=2)
+        failed = has_failures(batch_results)
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            f.write(results_document)
+        print(f"{Fore.BLUE}Results written to {args.results}")
+    else:
+        print(results_document)
+    return 1 if failed else 0
+
+def resume_run(journal_path, config):
+    """Continue an interrupted batch from its run journal. Returns the process exit code (as run_headless)."""
+    journal_path = journal_path or find_resumable_journal(get_journal_dir(config))
+    if not journal_path:
+        print(f"{Fore.YELLOW}No interrupted run found in {get_journal_dir(config).resolve()}.")
+        return 0
+    state = read_journal(journal_path)
+    if state["finished"]:
+        print(f"{Fore.YELLOW}Run {state['run_id']} already finished; nothing to resume.")
+        return 0
+    if not state["jobs"]:
+        error_msg("Resuming run", f"Journal {journal_path} has no job list.")
+        return 2
+    if state["tenant"]: # One tenant of a fan-out: resume with that tenant's credentials
+        try:
+            config = get_tenant_config(config, state["tenant"])
+        except ValueError as e:
+            error_msg("Resuming run", str(e))
+            return 2
+    if state["variant"]: # One variant of a matrix run: continue in its package folder
+        config = get_variant_config(config, state["jobs"][0]['architecture'], state["jobs"][0]['installer_context'])
+    print(f"\n{Fore.CYAN}Resuming {state['run_id']}: {len(state['jobs'])} app(s) in the batch.")
+    journal = RunJournal(journal_path)
+    journal.append("run_resumed")
+    batch_results = run_batch_pipeline(state["jobs"], config, journal=journal, resume_state=state["apps"])
+    print_batch_summary(batch_results)
+    return 1 if has_failures(batch_results) else 0
+
+###############################################################################
+## STEP 9d: Multi-Tenant Fan-Out (Package Once, Publish to Every Tenant)
+###############################################################################
+TENANT_SUMMARY_BUCKETS = (("success", "published"), ("unchanged", "already published"), ("skipped", "skipped"), ("assigned", "assigned"),
+                          ("failed_pkg", "failed packaging"), ("failed_pub", "failed publishing"), ("failed_assign", "failed assigning"))
+
+def run_multi_tenant_pipeline(app_jobs, config, tenant_configs, run_id=None):
+    """Package every app of the batch once and run the check / publish / assign stages for all tenants at once.
+
+    Each tenant (tenants.get_tenant_configs) runs run_batch_pipeline on its own thread
+    with its own token, inventory, Graph rate limiters and run journal
+    (<run_id>-<tenant>.jsonl; a journal left by an earlier run with the same run_id is
+    continued). The packages are built on one shared pool and every tenant's pipeline
+    picks each app up as soon as its package is ready, so uploads start while the rest
+    of the batch is still being packaged. Policies must be decided (no None): tenants
+    are not prompted. Apps whose packaging failed are reported as failed_pkg for every tenant.
+
+    Returns {tenant name: batch_results}.
+    """
+    if any(job['check'] is None or job['publish'] is None for job in app_jobs):
+        raise ValueError("A multi-tenant batch needs check and publish policies for every app.")
+    run_id = run_id or f"run-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    max_workers = max(1, int(config.get('max_workers', 4)))
+    started, t0 = time.time(), time.perf_counter()
+    tenant_names = [tenant_config['tenant_name'] for tenant_config in tenant_configs]
+
+    print(f"{Fore.BLUE}Packaging {len(app_jobs)} app(s) once for {len(tenant_configs)} tenant(s): {', '.join(tenant_names)}")
+
+    def package_once(job):
+        """Shared packaging stage: an error is reported here once, the tenants only see the failed package."""
+        try:
+            return package_job(job, config)
+        except Exception as e:
+            error_msg(f"Packaging {job['id']}", str(e))
+            return False, None
+
+    def publish_to_tenant(tenant_config, shared_packages):
+        name = tenant_config['tenant_name']
+        Path(tenant_config['log_dir']).mkdir(parents=True, exist_ok=True)
+        jobs = app_jobs
+        if 'assignments' in tenant_config: # Group ids are tenant-specific: the tenant's own policy replaces the batch's
+            jobs = [dict(job, assignments=tenant_config['assignments']) for job in app_jobs]
+        journal_dir = get_journal_dir(tenant_config)
+        journal_path = journal_dir / f"{run_id}-{name}.jsonl"
+        resume_state = None
+        if journal_path.exists():
+            resume_state = read_journal(journal_path)["apps"]
+            journal = RunJournal(journal_path)
+            journal.append("run_resumed")
+        else:
+            journal = RunJournal.create(journal_dir, jobs, run_id=f"{run_id}-{name}", tenant=name)
+        return run_batch_pipeline(jobs, tenant_config, journal=journal, resume_state=resume_state, shared_packages=shared_packages)
+
+    tenant_results = {}
+    tenant_workers = max(1, int(config.get('tenant_workers', len(tenant_configs))))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="package") as package_pool, \
+         ThreadPoolExecutor(max_workers=tenant_workers, thread_name_prefix="tenant") as tenant_pool:
+        shared_packages = {job['id']: package_pool.submit(package_once, job) for job in app_jobs}
+        tenant_futures = [(tenant_config['tenant_name'], tenant_pool.submit(publish_to_tenant, tenant_config, shared_packages)) for tenant_config in tenant_configs]
+        for name, tenant_future in tenant_futures:
+            try:
+                tenant_results[name] = tenant_future.result()
+            except Exception as e:
+                error_msg(f"Publishing to tenant {name}", str(e))
+                batch_results = tenant_results[name] = new_batch_results()
+                for job in app_jobs:
+                    batch_results["failed_pub"].append(job['id'])
+                    batch_results["details"][job['id']] = {"status": "failed_pub", "reason": str(e)}
+    elapsed = time.perf_counter() - t0
+    record_span("batch.tenants", started, elapsed, apps=len(app_jobs), tenants=len(tenant_configs),
+                status="error" if any(has_failures(batch_results) for batch_results in tenant_results.values()) else "ok")
+    print(f"{Fore.BLUE}Multi-tenant batch finished in {elapsed:.1f}s.")
+    return tenant_results
+
+def print_tenant_summary(tenant_results):
+    """Print one result line per tenant of a fan-out, then the Graph counters (per tenant)."""
+    print(f"\n{Fore.CYAN}{Style.BRIGHT}--- Multi-Tenant Summary ---")
+    for name, batch_results in tenant_results.items():
+        counts = ", ".join(f"{len(batch_results[bucket])} {label}" for bucket, label in TENANT_SUMMARY_BUCKETS if batch_results[bucket])
+        if has_failures(batch_results):
+            failed = batch_results["failed_pkg"] + batch_results["failed_pub"] + batch_results["failed_assign"]
+            print(f"{Fore.RED}❌ {name}: {counts} ({', '.join(failed)})")
+        else:
+            print(f"{Fore.GREEN}✅ {name}: {counts or 'nothing to do'}")
+    for line in format_throttle_stats(): print(f"{Fore.BLUE}🌐 {line}")
+    print(f"{Fore.CYAN}-----------------------------")
+
+def build_tenant_results_document(app_jobs, tenant_results, started):
+    """Machine-readable fan-out result: bucket counts over all tenants plus the apps of each tenant."""
+    documents = {name: build_results_document(app_jobs, batch_results, started) for name, batch_results in tenant_results.items()}
+    buckets = ("success", "unchanged", "failed_pkg", "failed_pub", "skipped", "assigned", "failed_assign")
+    return {
+        "started": started,
+        "finished": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "summary": {bucket: sum(document["summary"][bucket] for document in documents.values()) for bucket in buckets},
+        "graph_requests": throttle_stats(),
+        "tenants": {name: {"summary": document["summary"], "apps": document["apps"]} for name, document in documents.items()}
+    }
+
 ###############################################################################
-## STEP 8: Error Message Handling
+## STEP 9e: Architecture / Installer Context Matrix
 ###############################################################################
-def error_msg(step, error):
-    """Print a formatted error message."""
-    print(f"\n{Fore.RED}{Style.BRIGHT}❌ Error during {step}:{Style.RESET_ALL}")
-    error_lines = str(error).splitlines()
-    for line in error_lines:
-        print(f"  {Fore.YELLOW}{line}")
+def is_matrix_batch(app_jobs):
+    """True if an app of the batch asks for several architectures or installer contexts (see parse_variant_values)."""
+    return any(isinstance(job['architecture'], list) or isinstance(job['installer_context'], list) for job in app_jobs)
+
+def expand_variants(job):
+    """The single-variant jobs of a job: one per combination of its architectures and installer contexts."""
+    architectures = job['architecture'] if isinstance(job['architecture'], list) else [job['architecture']]
+    installer_contexts = job['installer_context'] if isinstance(job['installer_context'], list) else [job['installer_context']]
+    return [dict(job, architecture=architecture, installer_context=installer_context)
+            for architecture, installer_context in itertools.product(architectures, installer_contexts)]
+
+def get_variant_config(config, architecture, installer_context):
+    """Config of one matrix variant: its own package folder (package_cache.py) and log directory."""
+    name = variant_name(architecture, installer_context)
+    return dict(config, variant_name=name, wintuner_download_dir=str(variant_download_dir(config['wintuner_download_dir'], architecture, installer_context)),
+                log_dir=str(Path(config.get('log_dir', 'logs')) / name))
+
+def get_variant_status(detail):
+    """Final state of one variant of an app (its batch_results detail): a bucket name or "not_processed"."""
+    return "failed_assign" if detail.get('assignment_errors') else detail['status']
+
+def run_matrix_pipeline(app_jobs, config, run_id=None):
+    """Package every architecture / installer context variant of the batch in parallel, then publish each app's variants as one set.
+
+    All (app, variant) packages are built on one pool of config['max_workers'] threads, each
+    variant in its own package folder; installers that are identical across variants are
+    stored once (package_cache.py). Every app is then checked in Intune once for all its
+    variants, so an if-absent policy decides for the whole set. If a variant failed
+    packaging, the app's other variants are not published either (unless config
+    'matrix_publish_partial' is true): Intune never gets an incomplete set. The variants
+    then publish concurrently, each through run_batch_pipeline with its own run journal
+    (<run_id>-<variant>.jsonl; continued if it exists). Policies must be decided (no None):
+    variants are not prompted.
+
+    Returns {variant name: batch_results}.
+    """
+    if any(job['check'] is None or job['publish'] is None for job in app_jobs):
+        raise ValueError("A matrix batch needs check and publish policies for every app.")
+    run_id = run_id or f"run-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    max_workers = max(1, int(config.get('max_workers', 4)))
+    started, t0 = time.time(), time.perf_counter()
+    variants = {} # variant name -> (variant config, its single-variant jobs), in batch order
+    for job in app_jobs:
+        for variant_job in expand_variants(job):
+            name = variant_name(variant_job['architecture'], variant_job['installer_context'])
+            if name not in variants:
+                variants[name] = (get_variant_config(config, variant_job['architecture'], variant_job['installer_context']), [])
+                Path(variants[name][0]['log_dir']).mkdir(parents=True, exist_ok=True)
+            variants[name][1].append(variant_job)
+
+    package_count = sum(len(jobs) for _, jobs in variants.values())
+    print(f"{Fore.BLUE}Packaging {len(app_jobs)} app(s) as {package_count} package(s) in {len(variants)} variant(s): {', '.join(variants)}")
+    packaged_versions = {name: {} for name in variants} # variant name -> {PackageId: version}
+    failed_packaging = {} # PackageId -> variant names
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="package") as package_pool:
+        package_futures = [(name, job, package_pool.submit(package_job, job, variant_config))
+                           for name, (variant_config, jobs) in variants.items() for job in jobs]
+        for name, job, package_future in package_futures:
+            try:
+                packaged, package_version = package_future.result()
+            except Exception as e:
+                error_msg(f"Packaging {job['id']} [{name}]", str(e))
+                packaged, package_version = False, None
+            if packaged:
+                packaged_versions[name][job['id']] = package_version
+            else:
+                failed_packaging.setdefault(job['id'], []).append(name)
+
+    held_back = {} # PackageId -> detail of an app whose packaged variants are not published
+    for job in app_jobs:
+        failed = failed_packaging.get(job['id'])
+        if failed and job['publish'] != 'never' and not config.get('matrix_publish_partial') and len(failed) < len(expand_variants(job)):
+            console_print(f"{Fore.YELLOW}⚠️ [{app_label(job['id'], config)}] Not publishing any variant: packaging failed for {', '.join(failed)}.")
+            held_back[job['id']] = {"reason": "variant set incomplete"}
+
+    matches_by_app = {}
+    check_jobs = [job for job in app_jobs if job['check'] and job['id'] not in held_back and any(job['id'] in versions for versions in packaged_versions.values())]
+    if check_jobs:
+        print(f"\n{Fore.CYAN}Loading Intune App Report to check {len(check_jobs)} app(s) once for all their variants...")
+        with span("batch.check", apps=len(check_jobs)):
+            app_index = build_app_index(config)
+        for job in check_jobs:
+            all_matches = check_intune_app_report_based(job['id'], config, app_index=app_index) if app_index else None
+            matches = matches_by_app[job['id']] = exact_matches(all_matches) if all_matches is not None else None # Same-publisher apps do not count
+            print(f"\n{Fore.MAGENTA}{Style.BRIGHT}--- Intune Check: {app_label(job['id'], config)} ---{Style.RESET_ALL}")
+            print_intune_matches(job['id'], all_matches)
+            if job['publish'] == 'if-absent' and matches:
+                print(f"{Fore.YELLOW}Skipping publishing for all variants of {job['id']}.")
+                held_back[job['id']] = {"matches": [match.get('id') for match in matches]}
+            elif job['publish'] == 'if-absent' and matches is None:
+                print(f"{Fore.YELLOW}Skipping publishing for {job['id']}: Intune check failed.") # Never publish blindly
+                held_back[job['id']] = {"reason": "check failed"}
+
+    def publish_variant(name):
+        variant_config, jobs = variants[name]
+        versions = packaged_versions[name]
+        # Decided above for the whole set: the variant pipelines neither check nor ask
+        publish_jobs = [dict(job, check=False, publish='never' if job['publish'] == 'never' else 'always')
+                        for job in jobs if job['id'] in versions and job['id'] not in held_back]
+        batch_results = new_batch_results()
+        if publish_jobs:
+            journal_dir = get_journal_dir(variant_config)
+            journal_path = journal_dir / f"{run_id}-{name}.jsonl"
+            resume_state = None
+            if journal_path.exists():
+                resume_state = read_journal(journal_path)["apps"]
+                journal = RunJournal(journal_path)
+                journal.append("run_resumed")
+            else:
+                journal = RunJournal.create(journal_dir, publish_jobs, run_id=f"{run_id}-{name}", tenant=config.get('tenant_name'), variant=name)
+            batch_results = run_batch_pipeline(publish_jobs, variant_config, journal=journal, resume_state=resume_state, packaged_versions=versions)
+        for job in jobs:
+            detail = batch_results["details"].get(job['id'])
+            if detail is not None and matches_by_app.get(job['id']):
+                detail.setdefault("matches", [match.get('id') for match in matches_by_app[job['id']]])
+            if job['id'] not in versions:
+                batch_results["failed_pkg"].append(job['id'])
+                batch_results["details"][job['id']] = {"status": "failed_pkg"}
+            elif job['id'] in held_back:
+                batch_results["skipped"].append(job['id'])
+                batch_results["details"][job['id']] = dict(held_back[job['id']], status="skipped", version=versions[job['id']])
+        return batch_results
+
+    variant_results = {}
+    with ThreadPoolExecutor(max_workers=len(variants), thread_name_prefix="variant") as variant_pool:
+        variant_futures = [(name, variant_pool.submit(publish_variant, name)) for name in variants]
+        for name, variant_future in variant_futures:
+            try:
+                variant_results[name] = variant_future.result()
+            except Exception as e:
+                error_msg(f"Publishing variant {name}", str(e))
+                batch_results = variant_results[name] = new_batch_results()
+                for job in variants[name][1]:
+                    batch_results["failed_pub"].append(job['id'])
+                    batch_results["details"][job['id']] = {"status": "failed_pub", "reason": str(e)}
+    elapsed = time.perf_counter() - t0
+    record_span("batch.matrix", started, elapsed, apps=len(app_jobs), variants=len(variants), packages=package_count,
+                status="error" if any(has_failures(batch_results) for batch_results in variant_results.values()) else "ok")
+    print(f"{Fore.BLUE}Matrix batch finished in {elapsed:.1f}s.")
+    return variant_results
+
+MATRIX_STATUS_LABELS = {"success": "published", "unchanged": "already published", "skipped": "skipped", "failed_pkg": "failed packaging",
+                        "failed_pub": "failed publishing", "failed_assign": "failed assigning", "not_processed": "not processed"}
+
+def matrix_app_variants(job, variant_results):
+    """{variant name: batch_results detail} of one app of a matrix run, in the app's variant order."""
+    details = {}
+    for variant_job in expand_variants(job):
+        name = variant_name(variant_job['architecture'], variant_job['installer_context'])
+        details[name] = variant_results.get(name, new_batch_results())["details"].get(job['id'], {"status": "not_processed"})
+    return details
+
+def print_matrix_summary(app_jobs, variant_results):
+    """Print one line per app with the outcome of each of its variants, then the totals and Graph counters."""
+    print(f"\n{Fore.CYAN}{Style.BRIGHT}--- Matrix Summary ---")
+    for job in app_jobs:
+        statuses = {name: get_variant_status(detail) for name, detail in matrix_app_variants(job, variant_results).items()}
+        line = ", ".join(f"{name} {MATRIX_STATUS_LABELS[status]}" for name, status in statuses.items())
+        if any(status.startswith("failed") or status == "not_processed" for status in statuses.values()):
+            print(f"{Fore.RED}❌ {job['id']}: {line}")
+        else:
+            print(f"{Fore.GREEN}✅ {job['id']}: {line}")
+    totals = ", ".join(f"{sum(len(batch_results[bucket]) for batch_results in variant_results.values())} {label}"
+                       for bucket, label in TENANT_SUMMARY_BUCKETS if any(batch_results[bucket] for batch_results in variant_results.values()))
+    print(f"{Fore.BLUE}Packages: {totals or 'nothing to do'}")
+    for line in format_throttle_stats(): print(f"{Fore.BLUE}🌐 {line}")
+    print(f"{Fore.CYAN}-----------------------------")
+
+def build_matrix_results_document(app_jobs, variant_results, started):
+    """Machine-readable matrix result: bucket counts over all variants plus each app with the result of every variant.
+
+    An app's "status" is the status its variants share, or "mixed".
+    """
+    buckets = ("success", "unchanged", "failed_pkg", "failed_pub", "skipped", "assigned", "failed_assign")
+    apps = []
+    for job in app_jobs:
+        variants = matrix_app_variants(job, variant_results)
+        statuses = {detail['status'] for detail in variants.values()}
+        apps.append({"id": job['id'], "status": statuses.pop() if len(statuses) == 1 else "mixed", "variants": variants})
+    return {
+        "started": started,
+        "finished": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "summary": {bucket: sum(len(batch_results[bucket]) for batch_results in variant_results.values()) for bucket in buckets},
+        "graph_requests": throttle_stats(),
+        "apps": apps
+    }
 
 ###############################################################################
 ## STEP 10: Main Application Logic
 ###############################################################################
-def main():
-    """Main function to drive the Intune app packaging and publishing process."""
+def main(argv=None):
+    """Main function to drive the Intune app packaging and publishing process (argv: arguments without the program name)."""
+    parser = argparse.ArgumentParser(description="Package winget apps with WinTuner and publish them to Intune.")
+    parser.add_argument("--refresh", action="store_true", help="Re-list all Intune apps instead of using the local inventory cache.")
+    parser.add_argument("--outdated", action="store_true", help="Start with a batch of all Intune apps that have a newer version in the winget catalog.")
+    parser.add_argument("--force-publish", action="store_true", help="Upload even when the publish ledger shows this exact package is already in Intune.")
+    parser.add_argument("--resume", nargs='?', const='', metavar="JOURNAL", help="Continue the newest interrupted batch (or the given run journal) without repeating finished steps.")
+    parser.add_argument("--trace", metavar="FILE", help="Append timing spans (token, Graph pages, wintuner commands, per-app stages) to this JSON-lines file.")
+    parser.add_argument("--metrics", metavar="FILE", help="Write a Prometheus textfile summary (counts, durations, bytes, retries) to this file.")
+    parser.add_argument("--assign", action="append", metavar="INTENT:TARGET", help="Assign every app published in the batch, e.g. required:allDevices, available:allUsers or uninstall:<group id> (repeatable).")
+    parser.add_argument("--tenant", action="append", metavar="NAME", help="Publish only to this tenant of the config's 'tenants' list (repeatable; default: all of them).")
+    headless = parser.add_argument_group("unattended mode", "Run one batch without any prompt (--manifest or --ids) and exit with 0/1/2.")
+    headless.add_argument("--manifest", help="JSON manifest with per-app version, architecture(s), installer_context(s), check and publish settings.")
+    headless.add_argument("--ids", help="Comma-separated App IDs (uses the settings below for every app).")
+    headless.add_argument("--version", help="Version to package (default: latest from the catalog).")
+    headless.add_argument("--architecture", default='x64', help=f"{', '.join(ARCHITECTURES)} (default: x64). Several, comma-separated, package a matrix of variants.")
+    headless.add_argument("--installer-context", default='system', help=f"{', '.join(INSTALLER_CONTEXTS)} (default: system). Both, comma-separated, package a matrix of variants.")
+    headless.add_argument("--check", action=argparse.BooleanOptionalAction, default=False, help="Check Intune for existing apps (default: no).")
+    headless.add_argument("--publish", choices=PUBLISH_POLICIES, default='never', help="Publish policy (default: never). 'if-absent' publishes only when the check finds no match.")
+    headless.add_argument("--strict-ids", action="store_true", help="Exit with 2 if an App ID is not in the winget catalog and not an unambiguous typo of one (default: warn and try it).")
+    headless.add_argument("--results", help="Write the machine-readable JSON results to this file instead of stdout.")
+    headless.add_argument("--unattended", action="store_true", help="With --outdated: process the outdated apps without prompts.")
+    args = parser.parse_args(argv)
+    if args.unattended and not args.outdated:
+        parser.error("--unattended requires --outdated (or use --manifest / --ids)")
+    try:
+        parse_assignment_policy(args.assign)
+    except ValueError as e:
+        parser.error(f"--assign: {e}")
+
     print(f"{Fore.CYAN}{Style.BRIGHT}🚀 Intune App Packager and Publisher (Multi-App) 🚀{Style.RESET_ALL}")
 
     config = load_config()
     if not config:
         print(f"{Fore.RED}Exiting due to configuration loading errors.")
         sys.exit(1)
+    config['inventory_refresh'] = args.refresh # First inventory sync of this run does a full listing
+    config['force_publish'] = args.force_publish
+    if args.trace or args.metrics:
+        config['trace_file'] = args.trace or config.get('trace_file')
+        config['metrics_file'] = args.metrics or config.get('metrics_file')
+        configure_telemetry(config)
+
+    if args.resume is not None:
+        sys.exit(resume_run(args.resume or None, config))
+
+    tenant_configs = None # Several tenants: package once, publish to all of them (tenants.py)
+    if is_multi_tenant(config) or args.tenant:
+        try:
+            tenant_configs = get_tenant_configs(config, args.tenant)
+        except ValueError as e:
+            error_msg("Reading the tenant list", str(e))
+            sys.exit(2)
+        print(f"{Fore.CYAN}Publishing to {len(tenant_configs)} tenant(s): {', '.join(tenant_config['tenant_name'] for tenant_config in tenant_configs)}")
+
+    queued_app_ids = None # Work queue produced by --outdated, used for the first batch
+    if args.outdated:
+        queued_app_ids = get_outdated_app_queue(config) if not tenant_configs else merge_outdated_queues(tenant_configs)
+        if not queued_app_ids:
+            print(f"{Fore.GREEN}No outdated apps to process.")
+            if args.unattended: sys.exit(0 if queued_app_ids is not None else 1)
+        elif args.unattended:
+            args.ids = ",".join(queued_app_ids)
+
+    if args.manifest or args.ids:
+        sys.exit(run_headless(args, config, tenant_configs))
 
     while True: # Loop for processing batches of apps
         # --- Get Batch Input ---
-        print(f"\n{Fore.GREEN}🆔 Enter App IDs (comma-separated, e.g., Mozilla.Firefox,Zoom.Zoom): ", end="")
-        app_ids_input = input().strip()
-        if not app_ids_input: print(f"{Fore.RED}No App IDs entered."); continue
-        app_id_list = [pid.strip() for pid in app_ids_input.split(',') if pid.strip()]
-        if not app_id_list: print(f"{Fore.RED}No valid App IDs found in the input."); continue
+        if queued_app_ids:
+            app_id_list, queued_app_ids = queued_app_ids, None
+        else:
+            print(f"\n{Fore.GREEN}🆔 Enter App IDs (comma-separated, e.g., Mozilla.Firefox,Zoom.Zoom): ", end="")
+            app_ids_input = input().strip()
+            if not app_ids_input: print(f"{Fore.RED}No App IDs entered."); continue
+            app_id_list = [pid.strip() for pid in app_ids_input.split(',') if pid.strip()]
+            if not app_id_list: print(f"{Fore.RED}No valid App IDs found in the input."); continue
+            checked_jobs, _ = check_app_jobs([{"id": package_id} for package_id in app_id_list], config, interactive=True) # Typos caught before packaging
+            app_id_list = [job['id'] for job in checked_jobs]
+            if not app_id_list: print(f"{Fore.RED}No App IDs left in the batch."); continue
         print(f"\n{Fore.CYAN}Processing batch of {len(app_id_list)} app(s): {', '.join(app_id_list)}")
 
         # --- Get Common Settings for the Batch ---
         print(f"\n{Fore.GREEN}📦 Enter Version (leave empty for latest - applies to ALL apps in batch): ", end="")
         version = input().strip() or None # Use None if empty
 
-        architecture_options = {"1": 'x64', "2": 'x86', "3": 'arm64'}
+        architecture_options = {"1": 'x64', "2": 'x86', "3": 'arm64', "4": list(ARCHITECTURES)} # A list packages every variant (matrix)
         default_architecture = "1" # x64
         print(f"\n{Fore.CYAN}⚙️ Architecture (applies to ALL apps in batch):")
-        for key, value in architecture_options.items(): print(f"  [{key}] {Fore.YELLOW}{value}{' (default)' if key == default_architecture else ''}")
+        for key, value in architecture_options.items(): print(f"  [{key}] {Fore.YELLOW}{', '.join(value) if isinstance(value, list) else value}{' (default)' if key == default_architecture else ''}")
         architecture_choice = input(f"{Fore.GREEN}👉 Choose or ENTER for default: ").strip()
         architecture = architecture_options.get(architecture_choice, architecture_options[default_architecture])
 
-        installer_context_options = {"1": 'user', "2": 'system'}
+        installer_context_options = {"1": 'user', "2": 'system', "3": list(INSTALLER_CONTEXTS)}
         default_installer_context = "2" # system
         print(f"\n{Fore.CYAN}⚙️ Installation Context (applies to ALL apps in batch):")
-        for key, value in installer_context_options.items(): print(f"  [{key}] {Fore.YELLOW}{value}{' (default)' if key == default_installer_context else ''}")
+        for key, value in installer_context_options.items(): print(f"  [{key}] {Fore.YELLOW}{'both' if isinstance(value, list) else value}{' (default)' if key == default_installer_context else ''}")
         installer_context_choice = input(f"{Fore.GREEN}👉 Choose or ENTER for default: ").strip()
         installer_context = installer_context_options.get(installer_context_choice, installer_context_options[default_installer_context])
 
-        # --- Process Each App in the Batch ---
-        batch_results = {"success": [], "failed_pkg": [], "failed_pub": [], "skipped": []}
-        access_token = None # Store token once obtained for the batch
-
-        for package_id in app_id_list:
-            print(f"\n{Fore.MAGENTA}{Style.BRIGHT}--- Processing App: {package_id} ---{Style.RESET_ALL}")
-
-            # 1. Package Creation/Check
-            local_package_exists = check_local_package(package_id, version, config)
-            package_dir = Path(config['wintuner_download_dir']) / package_id / (version or 'latest')
+        assignments = parse_assignment_policy(args.assign)
+        while not args.assign:
+            print(f"\n{Fore.GREEN}👥 Assign published apps (e.g. required:allDevices,available:<group id> - leave empty for none): ", end="")
+            try:
+                assignments = parse_assignment_policy([item.strip() for item in input().split(',') if item.strip()])
+                break
+            except ValueError as e:
+                print(f"{Fore.RED}{e}")
 
-            if local_package_exists:
-                print(f"{Fore.YELLOW}✔️ Local package found: {package_dir}")
+        # --- Process Each App in the Batch ---
+        matrix = isinstance(architecture, list) or isinstance(installer_context, list)
+        if matrix:
+            if tenant_configs and len(tenant_configs) > 1:
+                print(f"{Fore.RED}A matrix batch is published to one tenant at a time: restart with --tenant NAME."); continue
+            # Variants publish concurrently as one set and are never prompted: decide once for the whole batch
+            check = ask_yes_no(f"\n{Fore.YELLOW}🔎 Check Intune for existing apps (once per app, for all its variants)? (y/n, default n): ")
+            if check:
+                publish = 'if-absent' if ask_yes_no(f"{Fore.YELLOW}❓ Publish only apps without a matching app in Intune? (y/n, default n): ") else 'always'
             else:
-                package_cmd = [ "wintuner", "package", package_id, "--package-folder", config['wintuner_download_dir'], "--architecture", architecture, "--installer-context", installer_context ]
-                if version: package_cmd.extend(["--version", version])
-
-                success, _, _ = run_command_with_progress(package_cmd, f"Packaging {package_id}")
-                if success:
-                    print(f"{Fore.GREEN}✅ Package created: {package_dir}")
-                else:
-                    print(f"{Fore.RED}❌ Failed to create package for {package_id}. Skipping further steps for this app.")
-                    batch_results["failed_pkg"].append(package_id); continue
-
-            # 2. Intune Check (Optional)
-            intune_check_choice = input(f"\n{Fore.YELLOW}🔎 Check Intune for '{package_id}'? (y/n, default n): ").strip().lower() or 'n'
-            proceed_with_publish = True
-
-            if intune_check_choice == 'y':
-                app_exists_in_intune = check_intune_app_report_based(package_id, config)
-                if app_exists_in_intune:
-                    publish_anyway_choice = input(f"{Fore.YELLOW}❓ App(s) matching '{package_id}' found. Still try publishing? (y/n, default n): ").strip().lower() or 'n'
-                    if publish_anyway_choice != 'y':
-                        proceed_with_publish = False
-                        print(f"{Fore.YELLOW}Skipping publishing for {package_id} as requested.")
-                        batch_results["skipped"].append(package_id)
+                publish = 'always' if ask_yes_no(f"\n{Fore.YELLOW}🚀 Publish all variants to Intune? (y/n, default n): ") else 'never'
+            app_jobs = make_app_jobs(app_id_list, version, architecture, installer_context, check, publish, assignments)
+            variant_results = run_matrix_pipeline(app_jobs, tenant_configs[0] if tenant_configs else config)
+            print_matrix_summary(app_jobs, variant_results)
+        elif tenant_configs:
+            # Tenants publish concurrently and are never prompted: decide once for the whole fan-out
+            check = ask_yes_no(f"\n{Fore.YELLOW}🔎 Check each tenant for existing apps? (y/n, default n): ")
+            if check:
+                publish = 'if-absent' if ask_yes_no(f"{Fore.YELLOW}❓ Publish only to tenants without a matching app? (y/n, default n): ") else 'always'
             else:
-                 print(f"{Fore.BLUE}Skipping Intune check for {package_id}.")
-
-            # 3. Publish to Intune (Optional)
-            if proceed_with_publish:
-                publish_choice = input(f"\n{Fore.YELLOW}🚀 Publish '{package_id}' to Intune? (y/n, default n): ").strip().lower() or 'n'
-                if publish_choice == 'y':
-                    if not access_token:
-                        print(f"{Fore.BLUE}Obtaining Intune access token...")
-                        access_token = get_access_token(config)
-                        if not access_token:
-                            print(f"{Fore.RED}❌ Failed to obtain access token. Cannot publish {package_id} or subsequent apps.")
-                            batch_results["failed_pub"].append(package_id + " (Token Error)"); break
-
-                    publish_cmd = [ "wintuner", "publish", package_id, "--package-folder", config['wintuner_download_dir'], "--tenant", config['intune_tenant_id'], "--token", access_token ]
-                    if version: publish_cmd.extend(["--version", version])
-
-                    success, _, _ = run_command_with_progress(publish_cmd, f"Publishing {package_id}")
-                    if success:
-                        print(f"{Fore.GREEN}🎉 Successfully published {package_id} to Intune.")
-                        batch_results["success"].append(package_id)
-                    else:
-                        batch_results["failed_pub"].append(package_id)
-                else:
-                    print(f"{Fore.YELLOW}Skipping publishing for {package_id}.")
-                    if package_id not in batch_results["skipped"]: batch_results["skipped"].append(package_id)
+                publish = 'always' if ask_yes_no(f"\n{Fore.YELLOW}🚀 Publish to {len(tenant_configs)} tenant(s)? (y/n, default n): ") else 'never'
+            tenant_results = run_multi_tenant_pipeline(make_app_jobs(app_id_list, version, architecture, installer_context, check, publish, assignments), config, tenant_configs)
+            print_tenant_summary(tenant_results)
+        else:
+            batch_results = run_batch_pipeline(make_app_jobs(app_id_list, version, architecture, installer_context, assignments=assignments), config)
 
-        # --- End of Batch Summary ---
-        print(f"\n{Fore.CYAN}{Style.BRIGHT}--- Batch Processing Summary ---")
-        if batch_results["success"]: print(f"{Fore.GREEN}✅ Published Successfully: {', '.join(batch_results['success'])}")
-        if batch_results["failed_pkg"]: print(f"{Fore.RED}❌ Failed Packaging: {', '.join(batch_results['failed_pkg'])}")
-        if batch_results["failed_pub"]: print(f"{Fore.RED}❌ Failed Publishing: {', '.join(batch_results['failed_pub'])}")
-        if batch_results["skipped"]: print(f"{Fore.YELLOW}🟡 Skipped Publishing (User choice or existing): {', '.join(batch_results['skipped'])}")
-        print(f"{Fore.CYAN}-----------------------------")
+            # --- End of Batch Summary ---
+            print_batch_summary(batch_results)
 
         # --- Optional Full Report After Batch ---
-        report_choice = input(f"\n{Fore.CYAN}📊 Generate a full report of ALL apps in your Intune tenant? (y/n, default n): ").strip().lower() or 'n'
+        report_choice = input(f"\n{Fore.CYAN}📊 Generate a full report of ALL apps in your Intune tenant{'s' if tenant_configs else ''}? (y/n, default n): ").strip().lower() or 'n'
         if report_choice == 'y':
-            generate_intune_app_report(config, print_report=True)
+            for report_config in tenant_configs or [config]:
+                if report_config.get('tenant_name'): print(f"\n{Fore.CYAN}{Style.BRIGHT}Tenant {report_config['tenant_name']}")
+                export_intune_app_report(report_config) # Streamed: the report is never held in memory
 
         # --- Ask to Process Another Batch ---
         another_batch = input(f"\n{Fore.YELLOW}🔄 Process another batch of apps? (y/n, default n): ").strip().lower() or 'n'
@@ -0,0 +1,88 @@
+##
+## Publish fingerprint ledger: remembers which exact packages were already uploaded.
+##
+## A package's fingerprint is the SHA-256 over its PackageId, version, architecture,
+## installer context and the content hashes of its files (from the package cache
+## manifest). After a successful 'wintuner publish' the fingerprint is stored together
+## with the Intune app id of the app it created: a GUID from wintuner's output that Graph
+## confirms is a mobileApp or, failing that, the app found in Graph by name and version
+## (see publish_installer.created_app_id). Publishing the same fingerprint to the same
+## tenant again becomes a no-op as long as that app still exists in Intune.
+##
+## Config keys: "publish_ledger_db" (SQLite file, default publish_ledger.db).
+##
+
+import hashlib
+import re
+import sqlite3
+import time
+
+DEFAULT_LEDGER_DB = "publish_ledger.db"
+_GUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+_GUID_RE = re.compile(_GUID, re.IGNORECASE)
+# Output lines that may name the created app: 'Published Mozilla.Firefox as app <id>',
+# 'Win32LobApp <id> created', '.../mobileApps/<id>'. wintuner's wording is not a contract,
+# so every GUID on such a line is only a candidate, confirmed in Graph before it is used.
+_APP_LINE_RE = re.compile(r"\b(?:apps?|application|win32lobapp|mobileapps?|created|published)\b", re.IGNORECASE)
+
+def package_fingerprint(manifest, package_id, version, architecture, installer_context):
+    """Fingerprint of a sealed package (manifest from package_cache) and the settings it was built with."""
+    digest = hashlib.sha256()
+    digest.update(f"{package_id.lower()}\0{version}\0{architecture}\0{installer_context}\0".encode('utf-8'))
+    for relative_path, file_info in sorted(manifest['files'].items()):
+        digest.update(f"{relative_path}\0{file_info['sha256']}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+def find_intune_app_ids(output_lines, exclude=()):
+    """Candidate app ids in publish output: GUIDs on lines about an app or about something created
+    or published, last line first, without the ids in exclude (tenant, client id)."""
+    exclude = {value.lower() for value in exclude if value}
+    candidates = []
+    for line in reversed(output_lines):
+        if _APP_LINE_RE.search(line):
+            for app_id in _GUID_RE.findall(line):
+                if app_id.lower() not in exclude and app_id.lower() not in candidates:
+                    candidates.append(app_id.lower())
+    return candidates
+
+class PublishLedger:
+    """SQLite table of (tenant, fingerprint) -> Intune app id of the published package."""
+
+    def __init__(self, path=DEFAULT_LEDGER_DB):
+        self.path = str(path)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS publishes (
+                                tenant_id TEXT NOT NULL,
+                                fingerprint TEXT NOT NULL,
+                                package_id TEXT NOT NULL,
+                                version TEXT,
+                                architecture TEXT,
+                                installer_context TEXT,
+                                intune_app_id TEXT,
+                                published_at REAL,
+                                PRIMARY KEY (tenant_id, fingerprint))""")
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the ledger usable from any publish thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, tenant_id, fingerprint):
+        """Return the ledger entry as a dict, or None if this package was never published to the tenant."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM publishes WHERE tenant_id = ? AND fingerprint = ?", (tenant_id, fingerprint)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, tenant_id, fingerprint, package_id, version, architecture, installer_context, intune_app_id):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO publishes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (tenant_id, fingerprint, package_id, version, architecture, installer_context, intune_app_id, time.time()))
+
+    def forget(self, tenant_id, fingerprint):
+        """Drop an entry whose Intune app was deleted."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM publishes WHERE tenant_id = ? AND fingerprint = ?", (tenant_id, fingerprint))
+
+def get_publish_ledger(config):
+    """Open the ledger configured in config."""
+    return PublishLedger(config.get('publish_ledger_db', DEFAULT_LEDGER_DB))
@@ -0,0 +1,149 @@
+##
+## Per-app enrichment for Report.py: assignment targets and install status.
+##
+## The mobileApps listing only says isAssigned yes/no. For every app this fetches
+##   GET /v1.0/deviceAppManagement/mobileApps/{id}/assignments     (intent + target)
+##   GET /beta/deviceAppManagement/mobileApps/{id}/installSummary  (device/user counts)
+## and resolves assignment group ids to display names (once per group). The requests are
+## blocking urllib calls through the shared pooled client and rate limiter, so they run
+## on a plain thread pool of report_concurrency workers (default 16), one app per task;
+## at most a few tasks per worker are queued at a time, so a tenant with tens of thousands
+## of apps does not create all its work items up front. Graph throttling slows the whole
+## run down instead of failing apps. A failure only marks that app's "enrichmentError".
+##
+
+import json
+import threading
+import urllib.error
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from graph_auth import get_access_token
+from graph_throttle import graph_request
+from http_client import graph_url
+
+DEFAULT_CONCURRENCY = 16
+QUEUED_PER_WORKER = 4 # Apps submitted ahead of the workers
+TARGET_NAMES = {
+    "#microsoft.graph.allDevicesAssignmentTarget": "All devices",
+    "#microsoft.graph.allLicensedUsersAssignmentTarget": "All users",
+}
+INSTALL_COUNT_FIELDS = ("installedDeviceCount", "failedDeviceCount", "pendingInstallDeviceCount",
+                        "notInstalledDeviceCount", "notApplicableDeviceCount", "installedUserCount", "failedUserCount")
+
+class GraphFetcher:
+    """Blocking Graph GETs for the enrichment workers, with a per-run cache of group names. Thread-safe."""
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._group_names = {} # group id -> Future, so every group is resolved once
+
+    def get_json(self, url):
+        token = get_access_token(self.config) # Cached; renewed in the background during long runs
+        if not token:
+            raise RuntimeError("No access token available.")
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        with graph_request('GET', url, headers=headers, timeout=45) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def get_collection(self, path):
+        """All items of a Graph collection, following @odata.nextLink."""
+        items = []
+        url = graph_url(path)
+        while url:
+            page = self.get_json(url)
+            items.extend(page.get('value', []))
+            url = page.get('@odata.nextLink')
+        return items
+
+    def group_name(self, group_id):
+        with self._lock:
+            future = self._group_names.get(group_id)
+            fetch = future is None
+            if fetch:
+                future = self._group_names[group_id] = Future()
+        if fetch: # The first worker asking resolves it, the others wait for its result
+            future.set_result(self._fetch_group_name(group_id))
+        return future.result()
+
+    def _fetch_group_name(self, group_id):
+        try:
+            group = self.get_json(graph_url(f"/v1.0/groups/{urllib.parse.quote(group_id)}?$select=displayName"))
+            return group.get('displayName') or group_id
+        except Exception:
+            return group_id # Deleted group or no Group.Read permission: show the id
+
+def fetch_assignments(fetcher, app_id):
+    """Assignments of an app as [{"intent", "target", "excluded"}] with group names resolved."""
+    assignments = fetcher.get_collection(f"/v1.0/deviceAppManagement/mobileApps/{urllib.parse.quote(app_id)}/assignments")
+    result = []
+    for assignment in assignments:
+        target = assignment.get('target') or {}
+        target_type = target.get('@odata.type', '')
+        if target.get('groupId'):
+            target_name = fetcher.group_name(target['groupId'])
+        else:
+            target_name = TARGET_NAMES.get(target_type, target_type.rsplit('.', 1)[-1] or 'unknown')
+        result.append({"intent": assignment.get('intent'), "target": target_name, "excluded": "exclusion" in target_type.lower()})
+    return result
+
+def fetch_install_summary(fetcher, app_id):
+    """Install counts of an app, or None where Intune keeps no summary for the app type."""
+    try:
+        summary = fetcher.get_json(graph_url(f"/beta/deviceAppManagement/mobileApps/{urllib.parse.quote(app_id)}/installSummary"))
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500 and e.code != 429:
+            return None
+        raise
+    return {field: summary.get(field, 0) for field in INSTALL_COUNT_FIELDS}
+
+def enrich_app(fetcher, app):
+    """Return a copy of app with 'assignments', 'installSummary' and, on failure, 'enrichmentError'."""
+    enriched = dict(app)
+    errors = []
+    for key, fetch in (('assignments', fetch_assignments), ('installSummary', fetch_install_summary)):
+        try:
+            enriched[key] = fetch(fetcher, app['id'])
+        except Exception as e:
+            enriched[key] = None
+            errors.append(str(e))
+    if errors:
+        enriched['enrichmentError'] = "; ".join(errors)
+    return enriched
+
+def enrich_apps(apps, config, concurrency=None, on_progress=None):
+    """Enrich a list of Graph app dicts on concurrency worker threads; results keep the input order.
+
+    on_progress() is called on the calling thread once per finished app.
+    """
+    concurrency = max(1, int(concurrency or config.get('report_concurrency', DEFAULT_CONCURRENCY)))
+    apps = list(apps)
+    results = [None] * len(apps)
+    fetcher = GraphFetcher(config)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="enrich") as executor:
+        queued = {}
+        position = 0
+        while position < len(apps) or queued:
+            while position < len(apps) and len(queued) < concurrency * QUEUED_PER_WORKER:
+                queued[executor.submit(enrich_app, fetcher, apps[position])] = position
+                position += 1
+            done, _ = wait(queued, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[queued.pop(future)] = future.result()
+                if on_progress:
+                    on_progress()
+    return results
+
+def format_assignments(assignments):
+    """'required: All devices, available: Sales' style summary ('-' if none, '?' if unknown)."""
+    if assignments is None:
+        return "?"
+    if not assignments:
+        return "-"
+    return ", ".join(f"{'exclude' if item['excluded'] else item['intent']}: {item['target']}" for item in assignments)
+
+def format_install_summary(summary):
+    """'12 ok / 1 failed / 3 pending' device counts ('n/a' if Intune keeps none)."""
+    if not summary:
+        return "n/a"
+    return f"{summary['installedDeviceCount']} ok / {summary['failedDeviceCount']} failed / {summary['pendingInstallDeviceCount']} pending"
@@ -0,0 +1,146 @@
+##
+## Streaming report writers (table / CSV / JSON lines) with flat memory use.
+##
+## Rows are written as they come out of the inventory iterator, so exporting a tenant
+## with tens of thousands of apps never holds more than one flush block of rows. Output
+## is collected into blocks of FLUSH_ROWS rows and written with one call per block
+## instead of one print per row.
+##
+## Tables use a fixed column layout (widths given by the caller) so they can be
+## streamed; fit=True computes the widths from the data in one pass, which needs all
+## rows in memory and is meant for small reports.
+##
+
+import csv
+import io
+import json
+import sys
+from contextlib import contextmanager
+
+FORMATS = ('table', 'csv', 'jsonl')
+FLUSH_ROWS = 500
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+def cell(value):
+    """Text of a report value ('N/A' for missing values)."""
+    return "N/A" if value is None or value == "" else str(value)
+
+def fit(text, width):
+    """Truncate text to a column width."""
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+@contextmanager
+def open_output(path=None):
+    """Text stream for a report: the file at path (large write buffer), or stdout for None / '-'."""
+    if not path or path == "-":
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, 'w', encoding='utf-8', newline='', buffering=OUTPUT_BUFFER_SIZE) as f:
+        yield f
+
+class ReportWriter:
+    """Base writer: columns are (key, title, width) tuples; rows are dicts keyed by column key."""
+
+    def __init__(self, stream, columns):
+        self.stream = stream
+        self.columns = columns
+        self.rows_written = 0
+        self._block = []
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def format_row(self, row):
+        raise NotImplementedError
+
+    def write(self, row):
+        self._block.append(self.format_row(row))
+        self.rows_written += 1
+        if len(self._block) >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self._block:
+            self.stream.write("".join(self._block))
+            self._block = []
+
+    def write_all(self, rows):
+        """Write every row of an iterable, then close the report. Returns the number of rows."""
+        self.begin()
+        for row in rows:
+            self.write(row)
+        self.flush()
+        self.end()
+        return self.rows_written
+
+class TableReportWriter(ReportWriter):
+    """Fixed-width text table. row_borders draws a separator line after every row."""
+
+    def __init__(self, stream, columns, row_borders=False):
+        super().__init__(stream, columns)
+        self.row_borders = row_borders
+        self.border_line = "+" + "+".join("-" * (width + 2) for _, _, width in columns) + "+\n"
+
+    def begin(self):
+        header = "|" + "".join(f" {title:<{width}} |" for _, title, width in self.columns)
+        self.stream.write(self.border_line + header + "\n" + self.border_line)
+
+    def end(self):
+        if not self.row_borders:
+            self.stream.write(self.border_line)
+
+    def format_row(self, row):
+        line = "|" + "".join(f" {fit(cell(row.get(key)), width):<{width}} |" for key, _, width in self.columns) + "\n"
+        return line + self.border_line if self.row_borders else line
+
+class CsvReportWriter(ReportWriter):
+    """RFC 4180 CSV with the column keys as header."""
+
+    def __init__(self, stream, columns):
+        super().__init__(stream, columns)
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line)
+
+    def begin(self):
+        self._csv.writerow([key for key, _, _ in self.columns])
+        self.stream.write(self._line.getvalue())
+
+    def format_row(self, row):
+        self._line.seek(0)
+        self._line.truncate()
+        self._csv.writerow(["" if row.get(key) is None else row.get(key) for key, _, _ in self.columns])
+        return self._line.getvalue()
+
+class JsonlReportWriter(ReportWriter):
+    """One JSON object per line with the column keys."""
+
+    def format_row(self, row):
+        return json.dumps({key: row.get(key) for key, _, _ in self.columns}, ensure_ascii=False) + "\n"
+
+def fit_columns(columns, rows):
+    """Column widths fitted to the data in one pass (header width at least)."""
+    widths = [len(title) for _, title, _ in columns]
+    for row in rows:
+        for position, (key, _, _) in enumerate(columns):
+            widths[position] = max(widths[position], len(cell(row.get(key))))
+    return [(key, title, width) for (key, title, _), width in zip(columns, widths)]
+
+def export_rows(rows, columns, fmt='table', stream=None, fit_widths=False, row_borders=False):
+    """Stream rows to stream (default stdout) in fmt. Returns the number of rows written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    stream = stream or sys.stdout
+    if fmt == 'csv':
+        writer = CsvReportWriter(stream, columns)
+    elif fmt == 'jsonl':
+        writer = JsonlReportWriter(stream, columns)
+    else:
+        if fit_widths:
+            rows = list(rows)
+            columns = fit_columns(columns, rows)
+        writer = TableReportWriter(stream, columns, row_borders=row_borders)
+    return writer.write_all(rows)
@@ -0,0 +1,125 @@
+##
+## Crash-safe, append-only journal of a batch run.
+##
+## Every batch writes <journal_dir>/run-<timestamp>-<pid>.jsonl: a "run_started" record
+## with the batch's jobs, then one "stage" record per per-app transition (packaged,
+## checked, success / unchanged / skipped / failed_pkg / failed_pub) and finally
+## "run_finished". Each record is flushed and fsync'ed before the pipeline moves on,
+## so a crash, Ctrl+C or a token error loses at most the transition in progress; a torn
+## last line is ignored when the journal is read back.
+##
+## A multi-tenant fan-out writes one journal per tenant (run-<timestamp>-<pid>-<tenant>.jsonl),
+## a matrix run one per architecture / installer context (run-<timestamp>-<pid>-<variant>.jsonl).
+##
+## 'publish_installer.py --resume' replays the newest unfinished journal: finished apps
+## are reported from the journal, packaged apps reuse their recorded version, recorded
+## publish decisions are not asked again, and only the remaining work runs.
+##
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_JOURNAL_DIR = "journals"
+TERMINAL_STAGES = ("success", "unchanged", "skipped") # Never redone on resume
+
+def _fsync_directory(directory):
+    """Persist a new directory entry (POSIX only; Windows has no directory handles for this)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class RunJournal:
+    """Append-only JSON-lines journal; every append is durable before it returns. Thread-safe."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write("\n") # Close a line torn by a crash, or the next record would be lost with it
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @classmethod
+    def create(cls, journal_dir, app_jobs, run_id=None, tenant=None, variant=None):
+        """Start the journal of a new run with its job list (run_id names the file; default: run-<timestamp>-<pid>).
+
+        tenant is the name of the tenant (tenants.py) a fan-out run publishes to, so a resume uses its credentials;
+        variant the architecture / installer context of a matrix run, so a resume uses its package folder.
+        """
+        journal_dir = Path(journal_dir)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        run_id = run_id or f"run-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        journal = cls(journal_dir / f"{run_id}.jsonl")
+        _fsync_directory(journal_dir)
+        journal.append("run_started", run_id=run_id, jobs=app_jobs, **({"tenant": tenant} if tenant else {}), **({"variant": variant} if variant else {}))
+        return journal
+
+    def append(self, event, **fields):
+        record = json.dumps(dict(fields, ts=time.time(), event=event), separators=(',', ':'))
+        with self._lock:
+            self._file.write(record + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def stage(self, package_id, stage, **detail):
+        """Record that an app reached a stage (with details such as version or matches)."""
+        self.append("stage", id=package_id, stage=stage, **detail)
+
+    def finish(self):
+        self.append("run_finished")
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+def read_journal(path):
+    """Replay a journal file.
+
+    Returns {"run_id", "jobs", "tenant" (None unless a fan-out run), "variant" (None unless a
+    matrix run), "apps": {PackageId: merged
+    stage details with the last "stage"}, "finished": bool}. Unparseable lines (a write torn
+    by a crash) are skipped.
+    """
+    state = {"run_id": Path(path).stem, "jobs": [], "tenant": None, "variant": None, "apps": {}, "finished": False}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('event') == "run_started":
+                state["jobs"] = record.get('jobs', [])
+                state["tenant"] = record.get('tenant')
+                state["variant"] = record.get('variant')
+            elif record.get('event') == "stage":
+                app_state = state["apps"].setdefault(record['id'], {})
+                app_state.update({key: value for key, value in record.items() if key not in ("event", "id", "ts")})
+            elif record.get('event') == "run_finished":
+                state["finished"] = True
+    return state
+
+def find_resumable_journal(journal_dir):
+    """Path of the newest journal without a run_finished record, or None."""
+    journal_dir = Path(journal_dir)
+    if not journal_dir.is_dir():
+        return None
+    for path in sorted(journal_dir.glob("run-*.jsonl"), key=lambda item: item.stat().st_mtime, reverse=True):
+        if not read_journal(path)["finished"]:
+            return path
+    return None
+
+def get_journal_dir(config):
+    return Path(config.get('journal_dir', DEFAULT_JOURNAL_DIR))
@@ -0,0 +1,241 @@
+##
+## Timing spans and a metrics summary for batch runs.
+##
+## Instrumented code wraps a unit of work in span():
+##     with span("app.package", app=package_id) as stage:
+##         ...
+##         stage.set(version=version)     # extra attributes
+##         stage.add(bytes=len(chunk))    # summed attributes
+##         stage.error("return code 1")   # mark as failed
+## Finished spans are appended to a JSON-lines trace file (one object per span with name,
+## start, duration_ms, thread, parent span and attributes) and aggregated per name into
+## a Prometheus textfile-collector style summary: count, errors, total / max seconds and
+## the sums of the "bytes", "retries" and "items" attributes, plus Graph request
+## counters per host. Both are written on flush() and at exit.
+##
+## Turned off (the default), span() returns one shared no-op object: the cost of an
+## instrumented call is a flag check.
+##
+## Config keys: "trace_file" (JSON lines, appended) and "metrics_file" (Prometheus text,
+## replaced atomically); publish_installer.py --trace / --metrics set them.
+##
+
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+SUMMED_ATTRIBUTES = ("bytes", "retries", "items")
+METRIC_PREFIX = "automattuner"
+
+_state = {"enabled": False, "trace": None, "trace_path": None, "metrics_path": None, "atexit": False}
+_lock = threading.Lock()
+_local = threading.local()
+_span_ids = itertools.count(1)
+_span_metrics = {} # span name -> {"count", "errors", "seconds", "max_seconds", <summed attributes>}
+_event_counts = {} # event name -> count
+
+class Span:
+    """One timed unit of work; use as a context manager."""
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "started", "_t0", "status")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_span_ids)
+        self.parent_id = None
+        self.status = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **amounts):
+        for key, amount in amounts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def error(self, message=None):
+        self.status = "error"
+        if message:
+            self.attrs["error"] = str(message)
+
+    def __enter__(self):
+        stack = _span_stack()
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        stack = _span_stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None and self.status == "ok":
+            self.error(f"{exc_type.__name__}: {exc}")
+        _finish(self.name, self.started, duration, self.status, self.attrs, self.span_id, self.parent_id)
+        return False
+
+class _NullSpan:
+    """Shared stand-in while telemetry is off: every method is a no-op."""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, **amounts):
+        pass
+
+    def error(self, message=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+def _span_stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def is_enabled():
+    return _state["enabled"]
+
+def span(name, **attrs):
+    """Context manager timing a unit of work (a no-op object while telemetry is off)."""
+    if not _state["enabled"]:
+        return NULL_SPAN
+    return Span(name, attrs)
+
+def current_span():
+    """Innermost open span of this thread (NULL_SPAN if none or telemetry is off)."""
+    if not _state["enabled"]:
+        return NULL_SPAN
+    stack = _span_stack()
+    return stack[-1] if stack else NULL_SPAN
+
+def record_span(name, started, duration, status="ok", **attrs):
+    """Record a span measured by the caller (e.g. across a generator's yields)."""
+    if _state["enabled"]:
+        stack = _span_stack()
+        _finish(name, started, duration, status, attrs, next(_span_ids), stack[-1].span_id if stack else None)
+
+def count(name, amount=1):
+    """Count an event that is too frequent or too cheap for a span (e.g. a token cache hit)."""
+    if _state["enabled"]:
+        with _lock:
+            _event_counts[name] = _event_counts.get(name, 0) + amount
+
+def _finish(name, started, duration, status, attrs, span_id, parent_id):
+    line = None
+    if _state["trace"] is not None: # Serialize outside the lock; metrics-only runs skip it
+        record = {"name": name, "start": round(started, 6), "duration_ms": round(duration * 1000, 3), "status": status,
+                  "thread": threading.current_thread().name, "span_id": span_id, "parent_id": parent_id}
+        if attrs:
+            record["attrs"] = attrs
+        line = json.dumps(record, default=str, separators=(',', ':')) + "\n"
+    with _lock:
+        metrics = _span_metrics.get(name)
+        if metrics is None:
+            metrics = _span_metrics[name] = dict({"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}, **{key: 0 for key in SUMMED_ATTRIBUTES})
+        metrics["count"] += 1
+        metrics["errors"] += status != "ok"
+        metrics["seconds"] += duration
+        metrics["max_seconds"] = max(metrics["max_seconds"], duration)
+        for key in SUMMED_ATTRIBUTES:
+            value = attrs.get(key)
+            if isinstance(value, (int, float)):
+                metrics[key] += value
+        if line is not None and _state["trace"] is not None:
+            _state["trace"].write(line)
+
+###############################################################################
+## Configuration / Output
+###############################################################################
+def configure(config):
+    """Enable telemetry if config has "trace_file" and/or "metrics_file" (otherwise leave it off)."""
+    trace_path = config.get('trace_file')
+    metrics_path = config.get('metrics_file')
+    with _lock:
+        if trace_path != _state["trace_path"]:
+            if _state["trace"] is not None:
+                _state["trace"].close()
+            _state["trace"] = open(trace_path, 'a', encoding='utf-8', buffering=64 * 1024) if trace_path else None
+            _state["trace_path"] = trace_path
+        _state["metrics_path"] = metrics_path
+        _state["enabled"] = bool(trace_path or metrics_path)
+        if _state["enabled"] and not _state["atexit"]:
+            atexit.register(flush)
+            _state["atexit"] = True
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_metrics():
+    """Prometheus text exposition of the span summary, event counts and Graph request counters."""
+    with _lock:
+        span_metrics = {name: dict(metrics) for name, metrics in _span_metrics.items()}
+        event_counts = dict(_event_counts)
+    lines = []
+    def family(metric, metric_type, help_text, samples):
+        """samples: (labels, value) or (labels, value, sample name suffix such as "_sum")."""
+        if not samples:
+            return
+        lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {metric_type}")
+        for labels, value, *suffix in samples:
+            label_text = ",".join(f'{key}="{_label(label)}"' for key, label in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{metric}{''.join(suffix)}{{{label_text}}} {value}")
+
+    spans = sorted(span_metrics.items())
+    family("span_duration_seconds", "summary", "Time spent per span name.",
+           [sample for name, metrics in spans
+            for sample in (({"span": name}, round(metrics["seconds"], 6), "_sum"), ({"span": name}, metrics["count"], "_count"))])
+    family("span_duration_seconds_max", "gauge", "Longest single span per span name.",
+           [({"span": name}, round(metrics["max_seconds"], 6)) for name, metrics in spans])
+    family("span_errors_total", "counter", "Spans that ended with an error.",
+           [({"span": name}, metrics["errors"]) for name, metrics in spans])
+    for key in SUMMED_ATTRIBUTES:
+        family(f"span_{key}_total", "counter", f"Sum of the '{key}' attribute per span name.",
+               [({"span": name}, metrics[key]) for name, metrics in spans if metrics[key]])
+    family("events_total", "counter", "Counted events.", [({"event": name}, value) for name, value in sorted(event_counts.items())])
+
+    throttle = sys.modules.get('graph_throttle') # Only report Graph counters if Graph was used at all
+    if throttle is not None:
+        stats = sorted(throttle.throttle_stats().items())
+        for counter in ("requests", "throttled", "retries", "failures"):
+            family(f"graph_{counter}_total", "counter", f"Graph / token endpoint {counter} per host.",
+                   [({"host": host}, host_stats[counter]) for host, host_stats in stats])
+        family("graph_wait_seconds_total", "counter", "Time requests waited for the rate limiter.",
+               [({"host": host}, host_stats["waited_seconds"]) for host, host_stats in stats])
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path=None):
+    """Write the metrics summary to path (default: metrics_file), replacing it atomically."""
+    path = path or _state["metrics_path"]
+    if not path:
+        return
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(format_metrics())
+    os.replace(temp_path, path) # The node exporter never reads a half-written file
+
+def flush():
+    """Write buffered trace lines and the metrics file."""
+    if not _state["enabled"]:
+        return
+    with _lock:
+        if _state["trace"] is not None:
+            _state["trace"].flush()
+    try:
+        write_metrics()
+    except OSError as e:
+        print(f"Could not write metrics file {_state['metrics_path']}: {e}", file=sys.stderr)
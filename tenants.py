@@ -0,0 +1,86 @@
+##
+## Multi-tenant configuration for the package-once, publish-to-many fan-out.
+##
+## config.json lists the tenants to publish to:
+##   "tenants": [
+##     {"name": "contoso", "intune_tenant_id": "<tenant id>"},
+##     {"name": "fabrikam", "intune_tenant_id": "<tenant id>", "intune_client_id": "<app id>", "intune_client_secret": "<secret>",
+##      "assignments": ["available:<fabrikam group id>"]}
+##   ]
+## Every entry is overlaid on the top-level config, so a multi-tenant app registration
+## only needs the tenant id per entry. Each tenant keeps its own cached state: its own
+## inventory database, token cache file and log directory (named after the tenant);
+## the publish ledger is shared, it is keyed by tenant id. "assignments" in an entry
+## replaces the batch's assignments for that tenant (group ids differ per tenant).
+##
+## Without "tenants", the top-level credentials are the only tenant and nothing changes.
+##
+
+import re
+from pathlib import Path
+from app_assignments import parse_assignment_policy
+
+TENANT_KEYS = ('intune_tenant_id', 'intune_client_id', 'intune_client_secret')
+PER_TENANT_FILES = (('inventory_db', "intune_inventory.db"), ('token_cache_file', None)) # Keys whose file is split per tenant
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+def tenant_file(path, name):
+    """'intune_inventory.db' -> 'intune_inventory.contoso.db'."""
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}.{name}{path.suffix}"))
+
+def is_multi_tenant(config):
+    return bool(config.get('tenants'))
+
+def get_tenant_configs(config, names=None):
+    """One config dict per configured tenant (optionally only those in names), in config order.
+
+    Each has 'tenant_name' set. Without a "tenants" list the config itself is returned
+    as the only tenant. Raises ValueError on incomplete entries, duplicate or unknown names.
+    """
+    entries = config.get('tenants')
+    if not entries:
+        if names:
+            raise ValueError("No 'tenants' list in the config; --tenant needs one.")
+        return [config]
+    tenant_configs, seen = [], set()
+    for entry in entries:
+        name = str(entry.get('name') or '').strip()
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Every tenant needs a 'name' of letters, digits, '.', '_' or '-' (got {name!r}).")
+        if name.lower() in seen:
+            raise ValueError(f"Tenant name '{name}' is used twice.")
+        seen.add(name.lower())
+        tenant_config = dict(config, **{key: value for key, value in entry.items() if key != 'name'}, tenant_name=name)
+        missing = [key for key in TENANT_KEYS if not tenant_config.get(key)]
+        if missing:
+            raise ValueError(f"Tenant '{name}': missing {', '.join(missing)}.")
+        if 'assignments' in entry:
+            try:
+                tenant_config['assignments'] = parse_assignment_policy(entry['assignments'])
+            except ValueError as e:
+                raise ValueError(f"Tenant '{name}': {e}") from e
+        for key, default in PER_TENANT_FILES:
+            path = entry.get(key) or (tenant_file(config[key], name) if config.get(key) else (tenant_file(default, name) if default else None))
+            if path:
+                tenant_config[key] = path
+        if 'log_dir' not in entry:
+            tenant_config['log_dir'] = str(Path(config.get('log_dir', 'logs')) / name)
+        tenant_configs.append(tenant_config)
+    if names:
+        wanted = {name.lower() for name in names}
+        unknown = wanted - seen
+        if unknown:
+            raise ValueError(f"Unknown tenant(s): {', '.join(sorted(unknown))} (configured: {', '.join(entry['name'] for entry in entries)}).")
+        tenant_configs = [tenant_config for tenant_config in tenant_configs if tenant_config['tenant_name'].lower() in wanted]
+    return tenant_configs
+
+def get_tenant_config(config, name):
+    """The config of one named tenant. Raises ValueError if it is not configured."""
+    return get_tenant_configs(config, [name])[0]
+
+def app_label(package_id, config):
+    """'Mozilla.Firefox @ contoso' in a tenant's fan-out, 'Mozilla.Firefox [arm64-user]' in a matrix run, else just the PackageId."""
+    label = f"{package_id} [{config['variant_name']}]" if config.get('variant_name') else package_id
+    tenant_name = config.get('tenant_name')
+    return f"{label} @ {tenant_name}" if tenant_name else label
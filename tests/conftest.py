@@ -0,0 +1,58 @@
+##
+## Shared fixtures: a mock Graph server (benchmarks/mock_graph.py) and the fake wintuner
+## (benchmarks/fake_wintuner.py), so pipeline tests run the real code end to end.
+##
+
+import os
+import sys
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "benchmarks")]
+
+from fake_wintuner import install_shim
+from mock_graph import MockGraphServer
+from run_benchmarks import apply_config, make_config
+
+def mock_app(name, publisher, version="1.0", app_id=None):
+    """A Graph win32LobApp dict for MockGraphServer's app list."""
+    return {"@odata.type": "#microsoft.graph.win32LobApp", "id": app_id or str(uuid.uuid5(uuid.NAMESPACE_URL, name)),
+            "displayName": name, "publisher": publisher, "displayVersion": version, "isAssigned": False,
+            "lastModifiedDateTime": "2025-01-01T00:00:00Z"}
+
+@pytest.fixture
+def graph_server():
+    """Factory starting MockGraphServer instances, stopped after the test."""
+    servers = []
+
+    def start(apps=50, **options):
+        server = MockGraphServer(apps, **options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def pipeline_config(tmp_path, monkeypatch, graph_server):
+    """Factory returning (config, server): a batch config against a fresh mock server and the fake wintuner."""
+    import graph_auth
+    monkeypatch.setattr(graph_auth, "_providers", {}) # Tokens of an earlier test's server are not reused
+
+    def make(apps=50, workers=2, server_options=None, **options):
+        server = graph_server(apps, **(server_options or {}))
+        config = make_config(tmp_path / "work", server, SimpleNamespace(workers=workers, rate_limit=0))
+        config.update(options)
+        apply_config(config)
+        monkeypatch.setenv('PATH', str(install_shim(tmp_path / "bin")) + os.pathsep + os.environ['PATH'])
+        monkeypatch.setenv('AUTOMATTUNER_GRAPH_URL', server.url)
+        monkeypatch.setenv('FAKE_WINTUNER_PACKAGE_SECONDS', "0.05")
+        monkeypatch.setenv('FAKE_WINTUNER_PUBLISH_SECONDS', "0.05")
+        monkeypatch.setenv('FAKE_WINTUNER_SIZE_KB', "4")
+        return config, server
+
+    return make
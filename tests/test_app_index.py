@@ -0,0 +1,52 @@
+from app_index import AppIndex, exact_matches
+from app_inventory import AppRecord
+from conftest import mock_app
+
+def record(name, publisher):
+    return AppRecord(f"id-{name}", name, "win32LobApp", "1.0", None, False, publisher)
+
+def test_match_ranks_exact_before_prefix():
+    index = AppIndex([record("Microsoft Teams", "Microsoft"), record("Mozilla Firefox", "Mozilla"), record("Firefox", "Mozilla"), record("Mozilla Thunderbird", "Mozilla")])
+    matches = index.match("Mozilla.Firefox")
+    assert [match['matchType'] for match in matches] == ["exact", "exact", "prefix"]
+    assert {match['originalDisplayName'] for match in exact_matches(matches)} == {"Mozilla Firefox", "Firefox"}
+
+def test_same_publisher_is_only_a_prefix_match():
+    index = AppIndex([record("Microsoft Teams", "Microsoft"), record("Microsoft Edge", "Microsoft")])
+    matches = index.match("Microsoft.PowerToys")
+    assert {match['matchType'] for match in matches} == {"prefix"}
+    assert exact_matches(matches) == []
+    assert exact_matches(None) == []
+
+def test_decorated_and_catalog_names_are_exact_matches():
+    index = AppIndex([record("Mozilla Firefox (x64 en-US)", "Mozilla"), record("Zoom Workplace 6.1.0", "Zoom Video Communications")])
+    assert [match['originalDisplayName'] for match in exact_matches(index.match("Mozilla.Firefox"))] == ["Mozilla Firefox (x64 en-US)"]
+    assert exact_matches(index.match("Zoom.Zoom")) == []
+    assert [match['originalDisplayName'] for match in exact_matches(index.match("Zoom.Zoom", "Zoom Workplace"))] == ["Zoom Workplace 6.1.0"]
+
+def test_check_and_id_lookup_know_decorated_names(pipeline_config):
+    firefox, zoom = mock_app("Mozilla Firefox (x64 en-US)", "Mozilla", version="128.0"), mock_app("Zoom Workplace", "Zoom")
+    config, _ = pipeline_config(apps=[firefox, zoom])
+    from graph_auth import get_access_token
+    from intune_inventory import find_published_app_id
+    from publish_installer import make_app_jobs, run_batch_pipeline
+    results = run_batch_pipeline(make_app_jobs(["Mozilla.Firefox", "Zoom.Zoom"], None, 'x64', 'system', check=True, publish='if-absent'), config)
+    assert sorted(results["skipped"]) == ["Mozilla.Firefox", "Zoom.Zoom"] # 'Zoom Workplace' is the catalog Name of Zoom.Zoom
+    assert find_published_app_id(get_access_token(config), "Mozilla.Firefox", "128.0") == firefox["id"]
+    assert find_published_app_id(get_access_token(config), "Zoom.Zoom", "1.0", "Zoom Workplace") == zoom["id"]
+
+def test_if_absent_publishes_next_to_same_publisher_apps(pipeline_config):
+    config, _ = pipeline_config(apps=[mock_app("Microsoft Teams", "Microsoft"), mock_app("Mozilla Firefox", "Mozilla")])
+    from publish_installer import make_app_jobs, run_batch_pipeline
+    results = run_batch_pipeline(make_app_jobs(["Microsoft.PowerToys", "Mozilla.Firefox"], None, 'x64', 'system', check=True, publish='if-absent'), config)
+    assert results["success"] == ["Microsoft.PowerToys"]
+    assert results["skipped"] == ["Mozilla.Firefox"]
+    assert results["details"]["Mozilla.Firefox"]["matches"] == [mock_app("Mozilla Firefox", "Mozilla")["id"]]
+    assert "matches" not in results["details"]["Microsoft.PowerToys"]
+
+def test_matrix_check_ignores_same_publisher_apps(pipeline_config):
+    config, _ = pipeline_config(apps=[mock_app("Microsoft Teams", "Microsoft")])
+    from publish_installer import make_app_jobs, run_matrix_pipeline
+    variant_results = run_matrix_pipeline(make_app_jobs(["Microsoft.PowerToys"], None, ['x64', 'arm64'], 'system', check=True, publish='if-absent'), config)
+    assert {name: batch_results["success"] for name, batch_results in variant_results.items()} == {
+        "x64-system": ["Microsoft.PowerToys"], "arm64-system": ["Microsoft.PowerToys"]}
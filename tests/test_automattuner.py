@@ -0,0 +1,20 @@
+import subprocess
+import sys
+import pytest
+from conftest import ROOT
+
+HEAVY_MODULES = {"alive_progress", "sqlite3", "colorama", "graph_auth", "graph_throttle", "graph_batch", "http_client", "intune_inventory"}
+
+def imported_modules(*args):
+    """Top-level names of every module imported by 'python -X importtime automattuner.py args'."""
+    result = subprocess.run([sys.executable, "-X", "importtime", str(ROOT / "automattuner.py"), *args],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    names = [line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")]
+    return {name.split(".")[0] for name in names}
+
+@pytest.mark.parametrize("args", [["--help"], ["catalog", "--help"], ["cache", "--help"]])
+def test_help_does_not_import_heavy_modules(args):
+    modules = imported_modules(*args)
+    assert "argparse" in modules # The measurement itself works
+    assert modules & HEAVY_MODULES == set()
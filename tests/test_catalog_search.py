@@ -0,0 +1,40 @@
+import json
+import pytest
+from catalog_search import CatalogSearch, edit_distance
+from winget_catalog import CatalogIndex, build_catalog_index
+
+@pytest.fixture
+def search(tmp_path):
+    entries = [("Mozilla Firefox", "Mozilla.Firefox"), ("Firefox ESR", "Mozilla.Firefox.ESR"), ("Mozilla Thunderbird", "Mozilla.Thunderbird"),
+               ("Git", "Git.Git"), ("Git Credential Manager", "Git.GCM"), ("Zoom", "Zoom.Zoom"), ("Visual Studio Code", "Microsoft.VisualStudioCode")]
+    source = tmp_path / "index.json"
+    source.write_text(json.dumps([{"Name": name, "PackageId": package_id, "Version": "1.0"} for name, package_id in entries]), encoding='utf-8')
+    build_catalog_index(source, tmp_path / "index.json.idx")
+    catalog = CatalogIndex(tmp_path / "index.json.idx")
+    yield CatalogSearch(catalog)
+    catalog.close()
+
+def test_edit_distance():
+    assert edit_distance("firefox", "firefox") == 0
+    assert edit_distance("firefox", "firefx") == 1 # Deletion
+    assert edit_distance("firefox", "fierfox") == 1 # Adjacent swap counts once
+    assert edit_distance("zoom", "zom.zoom") == 4
+    assert edit_distance("", "git") == 3
+
+def test_search_ranks_ids_and_names(search):
+    assert search.search("Mozila.Firefx")[0]['PackageId'] == "Mozilla.Firefox"
+    assert search.search("visual studio code")[0]['PackageId'] == "Microsoft.VisualStudioCode" # Found by its name
+    assert search.search("  ") == []
+
+def test_resolve_exact_and_typos(search):
+    assert search.resolve("mozilla.firefox") == ("Mozilla.Firefox", []) # Canonical spelling, no suggestions
+    resolved, suggestions = search.resolve("Mozila.Firefox")
+    assert resolved == "Mozilla.Firefox" and suggestions[0]['distance'] == 1
+    assert search.resolve("Zoom.Zom")[0] == "Zoom.Zoom"
+
+def test_resolve_refuses_ambiguous_or_distant_matches(search):
+    resolved, suggestions = search.resolve("Git.Gt") # Short ID: 'Git.Git' and 'Git.GCM' are both close
+    assert resolved is None
+    assert [entry['PackageId'] for entry in suggestions[:2]] == ["Git.Git", "Git.GCM"]
+    assert search.resolve("Mozilla.Frfx")[0] is None # Three edits: suggested, never auto-corrected
+    assert search.resolve("Totally.Unknown")[0] is None
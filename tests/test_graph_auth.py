@@ -0,0 +1,34 @@
+import json
+import time
+from conftest import mock_app
+
+def test_rejected_token_is_renewed_and_the_request_retried(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from app_assignments import assign_apps, parse_assignment_policy
+    from graph_auth import get_access_token
+    from intune_inventory import intune_app_exists
+    app_id = server.apps[0]['id']
+    revoked = get_access_token(config)
+    server.revoke_token(revoked)
+    assert intune_app_exists(revoked, app_id) is True # A caller still holding the old token
+    assert get_access_token(config) != revoked and server.counters["tokens"] == 2
+
+    server.revoke_token(get_access_token(config))
+    outcome = assign_apps(config, {"Mozilla.Firefox": (app_id, parse_assignment_policy(["required:allDevices"]))})
+    assert outcome["Mozilla.Firefox"] == {"done": ["required:allDevices"], "errors": []} # $batch writes too
+    assert server.counters["tokens"] == 3
+
+def test_stale_disk_cached_token_is_replaced(pipeline_config, tmp_path):
+    cache_file = tmp_path / "token.json"
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")], token_cache_file=str(cache_file))
+    from graph_auth import get_access_token
+    from intune_inventory import intune_app_exists
+    from mock_graph import mock_token
+    stale = mock_token(config['intune_tenant_id'])
+    server.revoke_token(stale)
+    cache_file.write_text(json.dumps({"tenant_id": config['intune_tenant_id'], "client_id": config['intune_client_id'],
+                                      "access_token": stale, "expires_at": time.time() + 3000}), encoding='utf-8')
+    assert get_access_token(config) == stale and server.counters["tokens"] == 0
+    assert intune_app_exists(stale, server.apps[0]['id']) is True
+    assert json.loads(cache_file.read_text(encoding='utf-8'))['access_token'] == get_access_token(config) != stale
+    assert server.counters["tokens"] == 1
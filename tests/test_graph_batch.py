@@ -0,0 +1,62 @@
+from conftest import mock_app
+
+GROUP_ID = "5d6e7f80-91a2-4b3c-8d4e-5f60718293a4"
+
+def assignment_requests(app_id, count):
+    from app_assignments import assignment_request, parse_assignment
+    return [assignment_request(app_id, parse_assignment(f"required:{GROUP_ID[:-1]}{index}")) for index in range(count)]
+
+def test_only_throttled_items_are_resent(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from graph_batch import execute_batch
+    app_id = server.apps[0]['id']
+    server.fail_batch_items([(429, False), (503, False), (400, False)])
+    results = execute_batch(config, assignment_requests(app_id, 4))
+    assert [result['status'] for result in results] == [201, 201, 400, 201]
+    assert results[2]['error'].startswith("HTTP 400")
+    assert server.counters["batch_items"] == 6 # The two throttled items once more, nothing else
+    assert len(server.assignments[app_id]) == 3
+
+def test_server_error_on_a_write_is_uncertain_not_resent(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from graph_batch import execute_batch
+    app_id = server.apps[0]['id']
+    server.fail_batch_items([(500, True), (502, False)])
+    results = execute_batch(config, assignment_requests(app_id, 2) + [{"method": "GET", "url": f"/deviceAppManagement/mobileApps/{app_id}/assignments"}])
+    assert [(result['status'], result.get('uncertain')) for result in results[:2]] == [(500, True), (502, True)]
+    assert server.counters["batch_items"] == 3
+
+def test_reads_are_retried_after_server_errors(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from graph_batch import execute_batch
+    server.fail_batch_items([(500, False)])
+    results = execute_batch(config, [{"method": "GET", "url": f"/deviceAppManagement/mobileApps/{server.apps[0]['id']}/assignments"}])
+    assert results[0]['status'] == 200 and results[0]['error'] is None
+
+def test_assignment_after_server_error_is_read_back_before_resending(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla"), mock_app("Zoom", "Zoom")])
+    from app_assignments import assign_apps, parse_assignment_policy
+    firefox, zoom = (app['id'] for app in server.apps)
+    policy = parse_assignment_policy(["required:allDevices"])
+    server.fail_batch_items([(500, True), (500, False)], method="POST") # Firefox's write was applied, Zoom's was not
+    outcome = assign_apps(config, {"Mozilla.Firefox": (firefox, policy), "Zoom.Zoom": (zoom, policy)})
+    assert outcome == {"Mozilla.Firefox": {"done": ["required:allDevices"], "errors": []},
+                       "Zoom.Zoom": {"done": ["required:allDevices"], "errors": []}}
+    assert len(server.assignments[firefox]) == 1 and len(server.assignments[zoom]) == 1
+
+def test_apps_already_in_intune_get_their_assignments(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from app_assignments import parse_assignment_policy
+    from publish_installer import make_app_jobs, run_batch_pipeline
+    policy = parse_assignment_policy(["required:allDevices"])
+    jobs = make_app_jobs(["Mozilla.Firefox", "Zoom.Zoom"], None, 'x64', 'system', check=True, publish='if-absent', assignments=policy)
+    results = run_batch_pipeline(jobs, config)
+    assert (results["success"], results["skipped"]) == (["Zoom.Zoom"], ["Mozilla.Firefox"])
+    assert sorted(results["assigned"]) == ["Mozilla.Firefox", "Zoom.Zoom"]
+    assert len(server.assignments[mock_app("Mozilla Firefox", "Mozilla")["id"]]) == 1
+
+    zoom_id = results["details"]["Zoom.Zoom"]["intune_app_id"]
+    results = run_batch_pipeline(make_app_jobs(["Zoom.Zoom"], None, 'x64', 'system', check=False, publish='always', assignments=policy), config)
+    assert (results["unchanged"], results["assigned"]) == (["Zoom.Zoom"], ["Zoom.Zoom"]) # Identical package: no upload, still assigned
+    assert results["details"]["Zoom.Zoom"]["intune_app_id"] == zoom_id
+    assert len(server.assignments[zoom_id]) == 1 # Already assigned: nothing posted twice
@@ -0,0 +1,70 @@
+import io
+import json
+import pytest
+from intune_inventory import iter_json_page
+
+class ChunkedResponse(io.RawIOBase):
+    """A response whose read() returns at most chunk_size bytes, whatever was asked for."""
+
+    def __init__(self, payload, chunk_size):
+        self.data = payload if isinstance(payload, bytes) else payload.encode('utf-8')
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def read(self, size=-1):
+        chunk = self.data[self.offset:self.offset + self.chunk_size]
+        self.offset += len(chunk)
+        return chunk
+
+PAGE = {
+    "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#deviceAppManagement/mobileApps",
+    "@odata.count": 3,
+    "value": [
+        {"id": "1", "displayName": "Quote \" and backslash \\ in a name", "size": 123456789},
+        {"id": "2", "displayName": "Ünïcödé – 日本語 🚀", "notes": "line\nbreak é \\u0041", "isAssigned": False},
+        {"id": "3", "displayName": "Nested", "largeIcon": {"type": "image/png", "value": "AAAA"}, "tags": [1, [2, 3], {}], "rating": -0.5e-3},
+    ],
+    "@odata.nextLink": "https://graph.microsoft.com/v1.0/deviceAppManagement/mobileApps?$skiptoken=abc%22def",
+}
+
+def parse(payload, chunk_size):
+    events = list(iter_json_page(ChunkedResponse(payload, chunk_size)))
+    return [value for kind, value in events if kind == "item"], events[-1]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_page_split_at_any_byte(chunk_size):
+    items, (kind, meta) = parse(json.dumps(PAGE, ensure_ascii=False, indent=1), chunk_size) # Multi-byte characters split too
+    assert items == PAGE["value"]
+    assert kind == "meta"
+    assert meta == {key: value for key, value in PAGE.items() if key != "value"}
+
+@pytest.mark.parametrize("chunk_size", [1, 5])
+def test_escaped_and_compact_json(chunk_size):
+    items, (_, meta) = parse(json.dumps(PAGE, ensure_ascii=True, separators=(',', ':')), chunk_size)
+    assert items == PAGE["value"]
+    assert meta["@odata.nextLink"].endswith("abc%22def")
+
+def test_number_at_chunk_end_is_not_cut():
+    for chunk_size in range(1, 12):
+        items, (_, meta) = parse('{"@odata.count":12345,"value":[{"id":1}],"x":67890}', chunk_size)
+        assert items == [{"id": 1}] and meta == {"@odata.count": 12345, "x": 67890}
+
+def test_empty_page_and_empty_value():
+    assert parse('{}', 1) == ([], ("meta", {}))
+    assert parse(' { "value" : [ ] } ', 2) == ([], ("meta", {}))
+
+def test_truncated_page_is_an_error():
+    with pytest.raises(ValueError):
+        parse('{"value":[{"id":"1"},{"id":', 4)
+
+def test_listing_progress_is_whole_lines_off_a_terminal(pipeline_config, capsys):
+    config, _ = pipeline_config(apps=30, server_options={"page_size": 10})
+    from concurrent.futures import ThreadPoolExecutor
+    from graph_auth import get_access_token
+    from intune_inventory import get_intune_apps
+    with ThreadPoolExecutor(max_workers=1) as pool: # Like a pipeline publish worker
+        apps = pool.submit(get_intune_apps, get_access_token(config)).result()
+    assert len(apps) == 30
+    lines = capsys.readouterr().out.splitlines() # No progress dots: they would run into other workers' lines
+    assert len(lines) == 2
+    assert lines[0].endswith("Fetching Intune apps... (Filter: None)") and lines[1].endswith("Done fetching Intune apps. Found 30 apps.")
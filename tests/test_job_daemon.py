@@ -0,0 +1,76 @@
+import pytest
+from job_daemon import JobDaemon, JobQueue
+
+@pytest.fixture
+def daemon_config(pipeline_config, tmp_path):
+    """Factory for (JobDaemon, config, server); the daemon's workers are not started, tests claim jobs themselves."""
+    def make(**options):
+        config, server = pipeline_config(apps=[], daemon_db=str(tmp_path / "jobs.db"), daemon_output_dir=str(tmp_path / "output"), **options)
+        return JobDaemon(config), config, server
+    return make
+
+def claim(daemon):
+    with daemon._wakeup:
+        job = daemon._claim()
+    return job['id'] if job else None
+
+def test_queue_transitions_and_requeue(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    first, second = queue.submit('publish', {"jobs": [{"id": "Mozilla.Firefox"}]}), queue.submit('report', {"format": "csv"})
+    assert [job['id'] for job in queue.queued()] == [first, second]
+    assert queue.transition(first, 'queued', 'running', started_at=1.0)
+    assert not queue.transition(first, 'queued', 'running') # Claimed once only
+    assert queue.transition(second, 'queued', 'cancelled')
+    assert (queue.count('queued'), queue.count('running')) == (0, 1)
+
+    assert JobQueue(tmp_path / "jobs.db").requeue_running() == 1 # The next daemon start
+    job = queue.get(first)
+    assert (job['status'], job['started_at'], job['request']) == ('queued', None, {"jobs": [{"id": "Mozilla.Firefox"}]})
+    assert queue.transition(first, 'queued', 'running') and queue.transition(first, 'running', 'succeeded', result={"summary": {}})
+    assert queue.get(first)['result'] == {"summary": {}}
+    assert queue.get(second)['status'] == 'cancelled'
+
+def test_jobs_sharing_an_app_never_run_together(daemon_config):
+    daemon, _, _ = daemon_config()
+    firefox = daemon.submit({"type": "package", "ids": ["Mozilla.Firefox", "Git.Git"]})['id']
+    firefox_again = daemon.submit({"type": "publish", "ids": ["mozilla.firefox"]})['id'] # Same app, other spelling
+    zoom = daemon.submit({"type": "package", "ids": ["Zoom.Zoom"]})['id']
+    assert claim(daemon) == firefox
+    assert claim(daemon) == zoom # Runs next to the first job, the conflicting one waits
+    assert claim(daemon) is None
+    with daemon._wakeup:
+        daemon._running.pop(firefox)
+    assert claim(daemon) == firefox_again
+
+def test_requeued_job_resumes_from_its_journal(daemon_config):
+    daemon, config, server = daemon_config()
+    job = daemon.submit({"type": "publish", "ids": ["Mozilla.Firefox", "Zoom.Zoom"]})
+    assert claim(daemon) == job['id']
+    from run_journal import RunJournal, get_journal_dir
+    journal = RunJournal.create(get_journal_dir(config), job['request']['jobs'], run_id=f"daemon-{job['id']}")
+    journal.stage("Mozilla.Firefox", "success", intune_app_id="firefox-app") # Then the daemon stopped
+    journal.close()
+    daemon.queue.set_journal(job['id'], journal.path)
+
+    restarted = JobDaemon(config)
+    assert restarted.queue.requeue_running() == 1
+    claimed = claim(restarted)
+    assert claimed == job['id']
+    restarted.run_job(restarted.queue.get(claimed))
+    finished = restarted.queue.get(claimed)
+    assert finished['status'] == 'succeeded'
+    assert [app['displayName'] for app in server.apps] == ["Zoom.Zoom"] # Firefox was published before the restart
+    assert {app['id']: app['status'] for app in finished['result']['apps']} == {"Mozilla.Firefox": "success", "Zoom.Zoom": "success"}
+
+def test_daemon_jobs_never_prompt(daemon_config, monkeypatch):
+    daemon, _, _ = daemon_config()
+    monkeypatch.setattr("builtins.input", lambda *args: pytest.fail("a daemon job prompted"))
+    job = daemon.submit({"type": "publish", "publish": "never", "apps": [{"id": "Zoom.Zoom", "check": None, "publish": None}]})
+    assert {key: job['request']['jobs'][0][key] for key in ("check", "publish")} == {"check": False, "publish": "never"}
+
+    stored = daemon.queue.submit('publish', {"jobs": [dict(job['request']['jobs'][0], publish=None)]}) # Queued by an older version
+    daemon.cancel(job['id'])
+    assert claim(daemon) == stored
+    daemon.run_job(daemon.queue.get(stored))
+    failed = daemon.queue.get(stored)
+    assert failed['status'] == 'failed' and "cannot prompt" in failed['error']
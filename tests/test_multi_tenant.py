@@ -0,0 +1,32 @@
+import threading
+
+def test_tenants_publish_each_app_as_soon_as_it_is_packaged(pipeline_config, monkeypatch):
+    config, _ = pipeline_config(apps=[], tenants=[
+        {"name": "contoso", "intune_tenant_id": "contoso-tenant"}, {"name": "fabrikam", "intune_tenant_id": "fabrikam-tenant"}])
+    monkeypatch.setenv('FAKE_WINTUNER_FAIL', "Mozilla.Firefox/x64")
+    import publish_installer
+    from tenants import get_tenant_configs
+    packaged, zoom_published, waited = [], threading.Event(), []
+    package_job, publish_app = publish_installer.package_job, publish_installer.publish_app
+
+    def counting_package_job(job, job_config):
+        if job['id'] == "Git.Git": # The last app is only packaged once the first one is in Intune
+            waited.append(zoom_published.wait(timeout=10))
+        packaged.append(job['id'])
+        return package_job(job, job_config)
+
+    def signalling_publish_app(package_id, *args, **kwargs):
+        result = publish_app(package_id, *args, **kwargs)
+        if package_id == "Zoom.Zoom":
+            zoom_published.set()
+        return result
+
+    monkeypatch.setattr(publish_installer, "package_job", counting_package_job)
+    monkeypatch.setattr(publish_installer, "publish_app", signalling_publish_app)
+    jobs = publish_installer.make_app_jobs(["Zoom.Zoom", "Mozilla.Firefox", "Git.Git"], None, 'x64', 'system', check=False, publish='always')
+    tenant_results = publish_installer.run_multi_tenant_pipeline(jobs, config, get_tenant_configs(config), run_id="fanout")
+    assert waited == [True]
+    assert sorted(packaged) == ["Git.Git", "Mozilla.Firefox", "Zoom.Zoom"] # Once for both tenants
+    for batch_results in tenant_results.values():
+        assert sorted(batch_results["success"]) == ["Git.Git", "Zoom.Zoom"]
+        assert batch_results["failed_pkg"] == ["Mozilla.Firefox"]
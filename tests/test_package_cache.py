@@ -0,0 +1,56 @@
+import os
+import time
+from package_cache import PackageCache
+
+def make_package(cache, package_id, version, files, last_used):
+    package_dir = cache.download_dir / package_id / version
+    package_dir.mkdir(parents=True)
+    for name, content in files.items():
+        (package_dir / name).write_bytes(content)
+    manifest = cache.seal(package_id, version)
+    manifest['last_used'] = last_used
+    cache._write_manifest(package_id, version, manifest)
+    return package_dir
+
+def test_evict_drops_least_recently_used_and_keeps_shared_blobs(tmp_path, monkeypatch):
+    cache = PackageCache(tmp_path)
+    shared = b"S" * 40_000
+    make_package(cache, "Vendor.Old", "1.0", {"setup.exe": b"O" * 100_000, "common.dll": shared}, last_used=1)
+    make_package(cache, "Vendor.Mid", "1.0", {"setup.exe": b"M" * 100_000, "common.dll": shared}, last_used=2)
+    make_package(cache, "Vendor.New", "1.0", {"setup.exe": b"N" * 100_000}, last_used=3)
+    usage = cache.disk_usage()
+
+    walks = []
+    real_disk_usage = cache.disk_usage
+    monkeypatch.setattr(cache, "disk_usage", lambda *args, **kwargs: walks.append(1) or real_disk_usage(*args, **kwargs))
+    assert cache.evict(usage - 50_000) == [("Vendor.Old", "1.0")]
+    assert len(walks) == 1 # Usage after a discard is accounted, not walked again
+    monkeypatch.undo()
+    assert usage - cache.disk_usage() > 100_000 # Its installer and manifest; the shared file is still used
+    assert not (tmp_path / "Vendor.Old" / "1.0").exists()
+    assert cache.verify("Vendor.Mid", "1.0") # Its copy of the shared file is still linked to a blob
+
+    assert cache.evict(0, protect={("Vendor.New", "1.0")}) == [("Vendor.Mid", "1.0")]
+    assert [manifest['package_id'] for manifest in cache.entries()] == ["Vendor.New"]
+    assert 100_000 < cache.disk_usage() < 101_000 # Vendor.New's installer (folder copy and blob are one inode) and manifest
+
+def test_gc_keeps_unsealed_folders_that_may_still_be_packaging(tmp_path):
+    cache = PackageCache(tmp_path, gc_grace_seconds=600)
+    make_package(cache, "Vendor.Sealed", "1.0", {"setup.exe": b"S" * 1_000}, last_used=time.time())
+    for package_id in ("Vendor.Interrupted", "Vendor.Packaging", "Vendor.Pinned"):
+        folder = tmp_path / package_id / "2.0"
+        folder.mkdir(parents=True)
+        (folder / "setup.exe").write_bytes(b"x" * 1_000)
+    an_hour_ago = time.time() - 3600
+    for path in (tmp_path / "Vendor.Interrupted" / "2.0" / "setup.exe", tmp_path / "Vendor.Interrupted" / "2.0",
+                 tmp_path / "Vendor.Pinned" / "2.0" / "setup.exe", tmp_path / "Vendor.Pinned" / "2.0"):
+        os.utime(path, (an_hour_ago, an_hour_ago))
+    cache.pin("Vendor.Pinned", "2.0")
+
+    result = cache.gc()
+    assert result["removed_unsealed"] == 1
+    assert not (tmp_path / "Vendor.Interrupted").exists()
+    assert (tmp_path / "Vendor.Packaging" / "2.0" / "setup.exe").exists()
+    assert (tmp_path / "Vendor.Pinned" / "2.0").exists()
+    assert cache.verify("Vendor.Sealed", "1.0")
+    assert cache.gc(grace_seconds=0)["removed_unsealed"] == 1 # Vendor.Packaging once the grace period is over
@@ -0,0 +1,67 @@
+import os
+import pytest
+from fake_wintuner import install_shim
+from process_supervisor import detect_percent, detect_phase, run_supervised
+
+@pytest.fixture
+def wintuner(tmp_path, monkeypatch):
+    """The fake wintuner on PATH, fast; returns the package folder."""
+    monkeypatch.setenv('PATH', str(install_shim(tmp_path / "bin")) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_WINTUNER_PACKAGE_SECONDS', "0.1")
+    monkeypatch.setenv('FAKE_WINTUNER_PUBLISH_SECONDS', "0.1")
+    monkeypatch.setenv('FAKE_WINTUNER_SIZE_KB', "1")
+    return tmp_path / "packages"
+
+def test_detect_phase_and_percent():
+    assert detect_phase("Downloading installer 40%") == "download"
+    assert detect_phase("Creating intunewin package") == "intunewin"
+    assert detect_phase("Uploading Zoom.Zoom") == "upload"
+    assert detect_phase("Package written") is None
+    assert detect_phase("Packaging Zoom.Zoom 6.0 (x64, system)") is None
+    assert detect_percent("Extracting installer 60%") == 60.0
+    assert detect_percent("version 1.2.3") is None
+    assert detect_percent("250%") is None
+
+def test_package_phases_and_progress(wintuner):
+    events = []
+    process = run_supervised(["wintuner", "package", "Zoom.Zoom", "--package-folder", str(wintuner), "--version", "6.0"], events.append)
+    assert process.returncode == 0
+    assert [phase for phase, _, _ in process.phases] == ["download", "extract", "intunewin"]
+    assert all(ended is not None for _, _, ended in process.phases)
+    assert set(process.phase_durations()) == {"download", "extract", "intunewin"}
+    assert process.progress == 1.0
+    progress = [event.progress for event in events if event.kind in ("phase", "progress")]
+    assert progress == sorted(progress) # Never goes backwards
+    assert events[-1].kind == "exit"
+    assert (wintuner / "Zoom.Zoom" / "6.0" / "installer.exe").is_file()
+
+def test_failing_command(wintuner, monkeypatch):
+    monkeypatch.setenv('FAKE_WINTUNER_FAIL', "Zoom.Zoom")
+    process = run_supervised(["wintuner", "package", "Zoom.Zoom", "--package-folder", str(wintuner)])
+    assert process.returncode == 1
+    assert process.progress < 1.0
+    assert process.stderr_lines == ["Error: simulated failure for Zoom.Zoom"]
+
+def test_run_command_with_progress_logs_and_reports(wintuner, tmp_path, monkeypatch, capsys):
+    from publish_installer import run_command_with_progress
+    log_file = tmp_path / "logs" / "Zoom.Zoom.log" # Folder does not exist yet
+    success, stdout_lines, _ = run_command_with_progress(["wintuner", "publish", "Zoom.Zoom", "--package-folder", str(wintuner), "--token", "secret-token"],
+                                                         "Publishing Zoom.Zoom", log_file=log_file)
+    assert success
+    assert stdout_lines[-1].startswith("Published Zoom.Zoom as app ")
+    log = log_file.read_text(encoding='utf-8')
+    assert "secret-token" not in log and "--token ***" in log
+    assert "--- phases: upload" in log and "=== Return Code: 0" in log
+    assert "Publishing Zoom.Zoom: upload..." in capsys.readouterr().out
+
+    monkeypatch.setenv('FAKE_WINTUNER_FAIL', "Zoom.Zoom")
+    success, _, stderr_lines = run_command_with_progress(["wintuner", "package", "Zoom.Zoom", "--package-folder", str(wintuner)], "Packaging Zoom.Zoom", log_file=log_file)
+    assert not success
+    assert stderr_lines == ["Error: simulated failure for Zoom.Zoom"]
+    assert "=== Return Code: 1" in log_file.read_text(encoding='utf-8')
+
+def test_missing_command(tmp_path):
+    from publish_installer import run_command_with_progress
+    success, _, stderr_lines = run_command_with_progress(["wintuner-not-installed", "package", "X"], "Packaging X", log_file=tmp_path / "x.log")
+    assert not success
+    assert stderr_lines == ["Command not found: wintuner-not-installed"]
@@ -0,0 +1,29 @@
+import threading
+from console import console_lock, console_print
+from conftest import mock_app
+
+def test_prompts_do_not_block_workers(pipeline_config, monkeypatch, capsys):
+    config, _ = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    from publish_installer import make_app_jobs, run_batch_pipeline
+    questions, blocked, printed = [], [], []
+
+    def answer(question):
+        questions.append(question)
+        worker = threading.Thread(target=console_print, args=(f"worker output {len(questions)}",)) # Like a publish worker finishing now
+        worker.start()
+        worker.join(timeout=5)
+        blocked.append(worker.is_alive())
+        assert not console_lock._is_owned()
+        printed.append(capsys.readouterr().out) # The worker line is held back until the answer is in
+        return "y" if "Check Intune" in question else "n"
+
+    monkeypatch.setattr("builtins.input", answer)
+    results = run_batch_pipeline(make_app_jobs(["Mozilla.Firefox", "Zoom.Zoom"], None, 'x64', 'system'), config)
+    expected = ["Check Intune for 'Mozilla.Firefox'", "matching 'Mozilla.Firefox' found", "Check Intune for 'Zoom.Zoom'", "Publish 'Zoom.Zoom'"]
+    assert len(questions) == len(expected) and all(text in question for text, question in zip(expected, questions))
+    assert blocked == [False] * 4
+    assert "Found the following matching app(s) in Intune:" in printed[1]
+    assert not any(f"worker output {n}" in out for n, out in enumerate(printed, 1))
+    assert sorted(results["skipped"]) == ["Mozilla.Firefox", "Zoom.Zoom"]
+    output = "".join(printed[1:]) + capsys.readouterr().out # Each held line shows up once its prompt is answered
+    assert all(f"worker output {n}" in output for n in range(1, 5))
@@ -0,0 +1,53 @@
+from conftest import mock_app
+from publish_ledger import find_intune_app_ids
+
+APP_ID = "2f1b7c3e-8d4a-4e59-9a61-0c2d3e4f5a6b"
+TENANT_ID = "9c0d1e2f-3a4b-4c5d-8e6f-7a8b9c0d1e2f"
+CONTENT_ID = "4b5c6d7e-8f90-4a1b-9c2d-3e4f5a6b7c8d"
+
+def test_app_id_candidates_come_from_app_lines():
+    output = [f"info: Authenticating to tenant {TENANT_ID}", f"info: WinTuner.Publish[0] Win32LobApp {{{APP_ID.upper()}}} created for Mozilla Firefox",
+              f"info: Committed content version {CONTENT_ID}"]
+    assert find_intune_app_ids(output) == [APP_ID]
+    assert find_intune_app_ids([f"PATCH https://graph.microsoft.com/beta/deviceAppManagement/mobileApps/{APP_ID} 204"]) == [APP_ID]
+    assert find_intune_app_ids([f"Published Mozilla.Firefox as app {APP_ID}"]) == [APP_ID]
+    # Newest line first; the tenant id is never a candidate
+    assert find_intune_app_ids([f"App {APP_ID} uploading to tenant {TENANT_ID}", f"Created content version {CONTENT_ID}"],
+                               exclude=(TENANT_ID,)) == [CONTENT_ID, APP_ID]
+
+def test_unrelated_guids_are_not_an_app_id():
+    assert find_intune_app_ids([f"Authenticating to tenant {TENANT_ID}", f"Upload session {APP_ID} finished"]) == []
+
+def test_only_an_id_graph_knows_is_taken(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla", version="128.0")])
+    from graph_auth import get_access_token
+    from publish_installer import created_app_id
+    token, firefox = get_access_token(config), server.apps[0]['id']
+    output = [f"Created app {firefox}", f"Created content version {CONTENT_ID} for the app"]
+    assert created_app_id(token, "Mozilla.Firefox", "128.0", output, config) == firefox
+    # No id in the output that Graph knows: the app is looked up by name and version
+    assert created_app_id(token, "Mozilla.Firefox", "128.0", [f"Created content version {CONTENT_ID}"], config) == firefox
+    assert created_app_id(token, "Mozilla.Firefox", "129.0", [f"Created content version {CONTENT_ID}"], config) is None
+
+def test_graph_lookup_needs_a_unique_name_and_version_match(pipeline_config):
+    config, server = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla", version="128.0"), mock_app("Firefox", "Mozilla", version="127.0"),
+                                           mock_app("Mozilla Thunderbird", "Mozilla", version="128.0")])
+    from graph_auth import get_access_token
+    from intune_inventory import find_published_app_id
+    token = get_access_token(config)
+    assert find_published_app_id(token, "Mozilla.Firefox", "128.0") == mock_app("Mozilla Firefox", "Mozilla")["id"]
+    assert find_published_app_id(token, "Mozilla.Firefox", "129.0") is None
+    assert find_published_app_id(token, "Mozilla.Firefox", None) is None
+    server.add_app(mock_app("Firefox", "Mozilla", version="128.0", app_id="second-firefox"))
+    assert find_published_app_id(token, "Mozilla.Firefox", "128.0") is None # Two candidates: not confirmed
+
+def test_pipeline_records_the_created_app(pipeline_config):
+    config, server = pipeline_config(apps=[])
+    from publish_installer import make_app_jobs, run_batch_pipeline
+    from publish_ledger import get_publish_ledger
+    results = run_batch_pipeline(make_app_jobs(["Mozilla.Firefox"], None, 'x64', 'system', check=False, publish='always'), config)
+    assert results["success"] == ["Mozilla.Firefox"]
+    created = [app['id'] for app in server.apps if app['displayName'] == "Mozilla.Firefox"]
+    assert results["details"]["Mozilla.Firefox"]["intune_app_id"] == created[0]
+    with get_publish_ledger(config)._connect() as conn:
+        assert [row[0] for row in conn.execute("SELECT intune_app_id FROM publishes")] == created
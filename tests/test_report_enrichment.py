@@ -0,0 +1,28 @@
+from conftest import mock_app
+from report_enrichment import enrich_apps, format_assignments, format_install_summary
+
+GROUP_ID = "5d6e7f80-91a2-4b3c-8d4e-5f60718293a4"
+
+def test_enrichment_survives_throttling_and_keeps_order(pipeline_config):
+    apps = [mock_app(f"Vendor App {index}", "Vendor") for index in range(30)]
+    config, server = pipeline_config(apps=apps, server_options={"throttle_every": 10, "retry_after": 0})
+    group_target = {"@odata.type": "#microsoft.graph.groupAssignmentTarget", "groupId": GROUP_ID}
+    for app in apps[:10]:
+        server.assignments[app['id']] = [{"intent": "required", "target": group_target},
+                                         {"intent": "available", "target": {"@odata.type": "#microsoft.graph.allLicensedUsersAssignmentTarget"}}]
+    progress = []
+    enriched = enrich_apps(apps, config, concurrency=4, on_progress=lambda: progress.append(1))
+
+    assert server.counters["throttled"] > 0
+    assert len(progress) == len(apps)
+    assert [app['id'] for app in enriched] == [app['id'] for app in apps]
+    assert not [app for app in enriched if app.get('enrichmentError')]
+    assert format_assignments(enriched[0]['assignments']) == "required: Mock Group, available: All users"
+    assert format_assignments(enriched[-1]['assignments']) == "-"
+    assert format_install_summary(enriched[-1]['installSummary']) == "10 ok / 1 failed / 2 pending"
+
+def test_failed_app_is_marked_not_fatal(pipeline_config):
+    config, _ = pipeline_config(apps=[mock_app("Mozilla Firefox", "Mozilla")])
+    enriched = enrich_apps([{"id": "deleted-app", "displayName": "Gone"}], config, concurrency=2)
+    assert enriched[0]['assignments'] is None and "404" in enriched[0]['enrichmentError']
+    assert format_assignments(enriched[0]['assignments']) == "?"
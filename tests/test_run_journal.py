@@ -0,0 +1,41 @@
+from run_journal import RunJournal, find_resumable_journal, read_journal
+
+def test_torn_last_line_is_ignored(tmp_path):
+    journal = RunJournal.create(tmp_path, [{"id": "Mozilla.Firefox"}], run_id="run-1")
+    journal.stage("Mozilla.Firefox", "packaged", packaged_version="136.0")
+    journal.stage("Mozilla.Firefox", "checked", publish_decision=True)
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"event":"stage","id":"Mozilla.Firefox","stage":"succ') # Crash in the middle of a write
+
+    state = read_journal(journal.path)
+    assert state["run_id"] == "run-1" and not state["finished"]
+    assert state["apps"] == {"Mozilla.Firefox": {"stage": "checked", "packaged_version": "136.0", "publish_decision": True}}
+    assert find_resumable_journal(tmp_path) == journal.path
+
+    journal = RunJournal(journal.path) # Appending after the torn line keeps later records readable
+    journal.stage("Mozilla.Firefox", "success", intune_app_id="app-1")
+    journal.finish()
+    state = read_journal(journal.path)
+    assert state["finished"] and state["apps"]["Mozilla.Firefox"]["stage"] == "success"
+    assert find_resumable_journal(tmp_path) is None
+
+def test_resume_only_runs_the_remaining_work(pipeline_config, tmp_path):
+    config, server = pipeline_config(apps=[])
+    from publish_installer import make_app_jobs, resume_run
+    jobs = make_app_jobs(["Mozilla.Firefox", "Zoom.Zoom", "Git.Git"], None, 'x64', 'system', check=False, publish='always')
+    journal = RunJournal.create(tmp_path / "journals", jobs, run_id="run-interrupted")
+    journal.stage("Mozilla.Firefox", "success", version="136.0", intune_app_id="firefox-app")
+    journal.stage("Zoom.Zoom", "packaged", packaged_version="6.0")
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"event":"stage","id":"Zoom.Zoom","stage":"che')
+
+    assert resume_run(str(journal.path), config) == 0
+    assert sorted(app['displayName'] for app in server.apps) == ["Git.Git", "Zoom.Zoom"] # Firefox is not published again
+    state = read_journal(journal.path)
+    assert state["finished"]
+    assert {package_id: app['stage'] for package_id, app in state["apps"].items()} == {
+        "Mozilla.Firefox": "success", "Zoom.Zoom": "success", "Git.Git": "success"}
+    assert state["apps"]["Zoom.Zoom"]["version"] == "6.0" # The recorded package version is reused
+    assert resume_run(str(journal.path), config) == 0 # Finished: nothing to do
@@ -0,0 +1,28 @@
+import os
+from winget_version import WingetVersion, compare_versions, newest_version, sort_versions
+
+def test_ordering_follows_winget():
+    assert compare_versions("1.10", "1.9") == 1 # Numeric, not lexical
+    assert compare_versions("115.0.5790.110", "115.0.5790.98") == 1
+    assert compare_versions("v1.2", "1.2") == 0
+    assert compare_versions("1.0", "1.0.0.0") == 0
+    assert compare_versions("1.0-beta", "1.0") == -1 # A suffix sorts below the plain number
+    assert compare_versions("1.0-BETA", "1.0-beta") == 0
+    assert compare_versions("1.0b8", "1.0b10") == 1 # Suffixes compare as text, not as numbers
+    assert compare_versions("2", "10") == -1
+
+def test_sort_and_newest():
+    versions = ["1.9", "1.10", "1.10-rc1", "v1.2", "1.2.0.1", "1.0"]
+    assert sort_versions(versions) == ["1.0", "v1.2", "1.2.0.1", "1.9", "1.10-rc1", "1.10"]
+    assert sorted(versions, key=WingetVersion) == sort_versions(versions)
+    assert newest_version(versions) == "1.10"
+    assert newest_version([]) is None
+
+def test_pulled_catalog_version_falls_back_to_winget_latest(pipeline_config, monkeypatch):
+    config, _ = pipeline_config(apps=[])
+    monkeypatch.setenv('FAKE_WINTUNER_FAIL', "Mozilla.Firefox@136.0") # The bundled catalog's version is gone from winget
+    from publish_installer import package_app
+    packaged, version = package_app("Mozilla.Firefox", None, 'x64', 'system', config)
+    assert (packaged, version) == (True, "1.0.0") # Whatever winget packaged without --version
+    assert os.path.isdir(os.path.join(config['wintuner_download_dir'], "Mozilla.Firefox", "1.0.0"))
+    assert package_app("Mozilla.Firefox", "136.0", 'x64', 'system', config) == (False, "136.0") # An explicit version is never replaced
@@ -0,0 +1,308 @@
+##
+## Compact memory-mapped index of the bundled winget catalog (index.json / index.csv).
+##
+## The catalog is compiled once into a binary file holding fixed-size records sorted by
+## case-folded PackageId, each pointing into a UTF-8 string arena. The file is mmap'ed at
+## startup, so opening it costs no parsing and no per-entry allocations; lookups are
+## binary searches over the mapped bytes:
+##   - exact PackageId lookup in O(log n) (case-insensitive, like winget)
+##   - prefix range scans ("Mozilla." -> all Mozilla.* packages)
+##   - publisher-namespace listing
+## The index is rebuilt lazily whenever the source catalog's size/mtime and content hash change.
+##
+## Usage: python winget_catalog.py build | lookup <PackageId> | prefix <Prefix> | publisher <Name>
+##                                 | search <text> (typo-tolerant, see catalog_search.py)
+##
+
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+SCRIPT_DIRECTORY = Path(__file__).resolve().parent
+DEFAULT_CATALOG = SCRIPT_DIRECTORY / "index.json"
+
+INDEX_MAGIC = b"WGCX"
+INDEX_FORMAT_VERSION = 1
+# magic, format version, entry count, source size, source mtime (ns), source sha256
+HEADER = struct.Struct("<4sIIQQ32s")
+# PackageId, Name, Version: (arena offset u32, length u16) each
+RECORD = struct.Struct("<IHIHIH")
+
+###############################################################################
+## Source Catalog Loading
+###############################################################################
+def read_catalog_source(source_path):
+    """Read catalog entries as dicts with PackageId / Name / Version from index.json or index.csv."""
+    source_path = Path(source_path)
+    if source_path.suffix.lower() == ".csv":
+        with open(source_path, 'r', encoding='utf-8', newline='') as f:
+            return [{"PackageId": row.get("PackageId", ""), "Name": row.get("Name", ""), "Version": row.get("Version", "")} for row in csv.DictReader(f)]
+    with open(source_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def fold_key(text):
+    """Case-folded sort/lookup key of a PackageId (ASCII case-insensitive, as bytes)."""
+    return text.strip().encode('utf-8').lower()
+
+def hash_file(path):
+    """SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+###############################################################################
+## Index Build
+###############################################################################
+def build_catalog_index(source_path, index_path):
+    """Compile the source catalog into the binary index file. Returns the number of entries."""
+    source_path = Path(source_path)
+    index_path = Path(index_path)
+    source_stat = source_path.stat()
+    entries = read_catalog_source(source_path)
+
+    by_key = {}
+    for entry in entries:
+        package_id = (entry.get("PackageId") or "").strip()
+        if package_id:
+            by_key[fold_key(package_id)] = entry # Last duplicate wins
+    keys = sorted(by_key) # Plain byte order, the same comparison the binary search uses
+
+    arena = bytearray()
+    interned = {} # Identical strings (versions like "1.0.0") are stored once
+
+    def add_string(text):
+        data = (text or "").encode('utf-8')[:0xFFFF]
+        if data not in interned:
+            interned[data] = len(arena)
+            arena.extend(data)
+        return interned[data], len(data)
+
+    records = bytearray()
+    for key in keys:
+        entry = by_key[key]
+        id_ref = add_string(entry.get("PackageId").strip())
+        name_ref = add_string(entry.get("Name"))
+        version_ref = add_string(entry.get("Version"))
+        records += RECORD.pack(*id_ref, *name_ref, *version_ref)
+
+    header = HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, len(keys), source_stat.st_size, source_stat.st_mtime_ns, hash_file(source_path))
+    temp_path = index_path.with_name(index_path.name + ".tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(records)
+        f.write(arena)
+    os.replace(temp_path, index_path) # Atomic: readers never see a half-written index
+    return len(keys)
+
+def read_index_header(index_path):
+    """Return the unpacked header of an index file, or None if it is missing or not an index."""
+    try:
+        with open(index_path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) != HEADER.size:
+        return None
+    fields = HEADER.unpack(header)
+    if fields[0] != INDEX_MAGIC or fields[1] != INDEX_FORMAT_VERSION:
+        return None
+    return fields
+
+def index_is_current(source_path, index_path):
+    """True if the index was built from the current source content.
+
+    Size and mtime are compared first (one stat call); the content hash is only
+    computed when they differ, so touching the source without changing it does
+    not force a rebuild.
+    """
+    header = read_index_header(index_path)
+    if header is None:
+        return False
+    _, _, _, source_size, source_mtime_ns, source_hash = header
+    source_stat = Path(source_path).stat()
+    if source_stat.st_size == source_size and source_stat.st_mtime_ns == source_mtime_ns:
+        return True
+    if source_stat.st_size != source_size or hash_file(source_path) != source_hash:
+        return False
+    # Same content, new mtime: record the new mtime so the next start skips hashing again
+    with open(index_path, 'r+b') as f:
+        f.write(HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, header[2], source_stat.st_size, source_stat.st_mtime_ns, source_hash))
+    return True
+
+###############################################################################
+## Memory-Mapped Index
+###############################################################################
+class CatalogIndex:
+    """Read-only view of a compiled catalog index file, backed by mmap."""
+
+    def __init__(self, index_path):
+        self.index_path = Path(index_path)
+        with open(self.index_path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = HEADER.unpack_from(self._map, 0)[2]
+        self._records_offset = HEADER.size
+        self._arena_offset = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+
+    def _string(self, offset, length):
+        start = self._arena_offset + offset
+        return self._map[start:start + length]
+
+    def _key(self, position):
+        id_offset, id_length = struct.unpack_from("<IH", self._map, self._records_offset + position * RECORD.size)
+        return self._string(id_offset, id_length).lower()
+
+    def entry(self, position):
+        """Return the catalog entry at a sorted position as a dict (PackageId / Name / Version)."""
+        fields = RECORD.unpack_from(self._map, self._records_offset + position * RECORD.size)
+        return {
+            "PackageId": self._string(fields[0], fields[1]).decode('utf-8'),
+            "Name": self._string(fields[2], fields[3]).decode('utf-8'),
+            "Version": self._string(fields[4], fields[5]).decode('utf-8')
+        }
+
+    def _lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, package_id):
+        """Exact, case-insensitive PackageId lookup. Returns the entry dict or None."""
+        key = fold_key(package_id)
+        position = self._lower_bound(key)
+        if position < self.count and self._key(position) == key:
+            return self.entry(position)
+        return None
+
+    def prefix_range(self, prefix):
+        """Return the (start, stop) positions of all PackageIds starting with prefix (case-insensitive)."""
+        key = fold_key(prefix)
+        start = self._lower_bound(key)
+        # Every key with this prefix sorts before prefix + 0xFF (never valid inside UTF-8)
+        stop = self._lower_bound(key + b"\xff")
+        return start, stop
+
+    def prefix_scan(self, prefix):
+        """Yield entries whose PackageId starts with prefix, in PackageId order (e.g. 'Mozilla.')."""
+        start, stop = self.prefix_range(prefix)
+        for position in range(start, stop):
+            yield self.entry(position)
+
+    def publisher_packages(self, publisher):
+        """List all packages in a publisher namespace ('Mozilla' -> Mozilla.Firefox, Mozilla.Thunderbird, ...)."""
+        return list(self.prefix_scan(publisher.rstrip(".") + "."))
+
+    def publishers(self):
+        """Return the sorted distinct publisher namespaces (first PackageId segment) with package counts."""
+        counts = {}
+        for position in range(self.count):
+            namespace = self._key(position).split(b".", 1)[0].decode('utf-8')
+            counts[namespace] = counts.get(namespace, 0) + 1
+        return counts
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+def get_catalog_paths(config=None):
+    """Resolve (source catalog, compiled index) paths from config keys 'catalog_path' / 'catalog_index_path'."""
+    config = config or {}
+    source_path = Path(config.get('catalog_path') or DEFAULT_CATALOG)
+    index_path = Path(config.get('catalog_index_path') or source_path.with_name(source_path.name + ".idx"))
+    return source_path, index_path
+
+def open_catalog(config=None):
+    """Return the shared CatalogIndex, compiling or rebuilding it first if the source changed."""
+    source_path, index_path = get_catalog_paths(config)
+    with _open_lock:
+        catalog = _open_indexes.get(index_path)
+        if catalog is not None and index_is_current(source_path, index_path):
+            return catalog
+        if catalog is not None:
+            catalog.close() # Unmap before replacing the file (required on Windows)
+            del _open_indexes[index_path]
+        if not index_is_current(source_path, index_path):
+            build_catalog_index(source_path, index_path)
+        catalog = _open_indexes[index_path] = CatalogIndex(index_path)
+        return catalog
+
+def get_catalog_version(package_id, config=None):
+    """Return the catalog's current version of package_id, or None if unknown (or no catalog is available)."""
+    try:
+        entry = open_catalog(config).lookup(package_id)
+    except (OSError, ValueError):
+        return None
+    return entry['Version'] if entry and entry['Version'] else None
+
+def get_catalog_name(package_id, config=None):
+    """Return the catalog's display Name of package_id ('Zoom.Zoom' -> 'Zoom Workplace'), or None if unknown."""
+    try:
+        entry = open_catalog(config).lookup(package_id)
+    except (OSError, ValueError):
+        return None
+    return entry['Name'] if entry and entry['Name'] else None
+
+###############################################################################
+## Command Line
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the compiled winget catalog index.")
+    parser.add_argument("--catalog", help="Source catalog (index.json or index.csv). Default: index.json next to this script.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="(Re)compile the catalog index.")
+    subparsers.add_parser("lookup", help="Exact PackageId lookup.").add_argument("package_id")
+    subparsers.add_parser("prefix", help="List PackageIds starting with a prefix.").add_argument("prefix")
+    subparsers.add_parser("publisher", help="List the packages of a publisher namespace.").add_argument("publisher")
+    search = subparsers.add_parser("search", help="Typo-tolerant search over PackageIds and names, best matches first.")
+    search.add_argument("query", nargs='+')
+    search.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    config = {'catalog_path': args.catalog} if args.catalog else {}
+    if args.command == "build":
+        source_path, index_path = get_catalog_paths(config)
+        count = build_catalog_index(source_path, index_path)
+        print(f"Compiled {count} catalog entries from {source_path} into {index_path}.")
+        return 0
+
+    catalog = open_catalog(config)
+    if args.command == "lookup":
+        entry = catalog.lookup(args.package_id)
+        if not entry:
+            print(f"'{args.package_id}' not found in the catalog.", file=sys.stderr)
+            return 1
+        entries = [entry]
+    elif args.command == "prefix":
+        entries = list(catalog.prefix_scan(args.prefix))
+    elif args.command == "search":
+        from catalog_search import get_catalog_search # Builds the trigram index: only for this command
+        entries = get_catalog_search(config).search(" ".join(args.query), limit=args.limit)
+        if not entries:
+            print(f"Nothing in the catalog resembles '{' '.join(args.query)}'.", file=sys.stderr)
+            return 1
+    else:
+        entries = catalog.publisher_packages(args.publisher)
+    for entry in entries:
+        print(f"{entry['PackageId']:<50} {entry['Version']:<20} {entry['Name']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
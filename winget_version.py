@@ -0,0 +1,119 @@
+##
+## winget-compatible version ordering.
+##
+## Mirrors the rules of winget's own Version class so that "is the catalog newer than
+## what we have?" gives the same answer winget would:
+##   - a leading 'v' / 'V' is ignored ("v1.2" == "1.2")
+##   - parts are split on '.', each part is a leading integer plus an optional suffix
+##     ("0b8" -> 0, "b8"); integers compare numerically, so long build numbers such as
+##     "115.0.5790.110" order correctly
+##   - for equal integers a part without suffix is greater ("1.0" > "1.0-beta"),
+##     suffixes compare case-insensitively
+##   - missing parts count as 0 ("1.0" == "1.0.0")
+## Parsing is cached, so sorting or comparing thousands of versions costs one parse per
+## distinct string plus cheap tuple comparisons.
+##
+
+import re
+from functools import lru_cache
+
+_PART_RE = re.compile(r"\s*(\d*)(.*)")
+_ZERO_PART = (0, 1, "") # Implicit value of a missing part
+
+@lru_cache(maxsize=65536)
+def parse_version(text):
+    """Parse a version string into a tuple of (integer, no-suffix flag, lowercased suffix) parts.
+
+    Trailing zero parts are dropped, so equal versions ("1.0" / "1.0.0") get equal tuples.
+    """
+    text = (text or "").strip()
+    if len(text) > 1 and text[0] in "vV" and text[1].isdigit():
+        text = text[1:]
+    parts = []
+    for raw_part in text.split("."):
+        digits, suffix = _PART_RE.match(raw_part).groups()
+        suffix = suffix.strip().lower()
+        parts.append((int(digits) if digits else 0, 0 if suffix else 1, suffix))
+    while parts and parts[-1] == _ZERO_PART:
+        parts.pop()
+    return tuple(parts)
+
+def compare_versions(left, right):
+    """Return -1, 0 or 1 as version string left is lower than, equal to or greater than right."""
+    return compare_parsed_versions(parse_version(left), parse_version(right))
+
+def compare_parsed_versions(left_parts, right_parts):
+    """compare_versions for tuples already returned by parse_version."""
+    if left_parts == right_parts:
+        return 0
+    if len(left_parts) == len(right_parts):
+        return -1 if left_parts < right_parts else 1
+    # Different lengths: compare as if the shorter one were padded with zero parts
+    for index in range(max(len(left_parts), len(right_parts))):
+        left_part = left_parts[index] if index < len(left_parts) else _ZERO_PART
+        right_part = right_parts[index] if index < len(right_parts) else _ZERO_PART
+        if left_part != right_part:
+            return -1 if left_part < right_part else 1
+    return 0
+
+class WingetVersion:
+    """Orderable version, usable as a sort key: sorted(versions, key=WingetVersion)."""
+
+    __slots__ = ("text", "parts")
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = parse_version(text)
+
+    def __lt__(self, other):
+        return compare_parsed_versions(self.parts, other.parts) < 0
+
+    def __gt__(self, other):
+        return compare_parsed_versions(self.parts, other.parts) > 0
+
+    def __le__(self, other):
+        return compare_parsed_versions(self.parts, other.parts) <= 0
+
+    def __ge__(self, other):
+        return compare_parsed_versions(self.parts, other.parts) >= 0
+
+    def __eq__(self, other):
+        return isinstance(other, WingetVersion) and self.parts == other.parts
+
+    def __hash__(self):
+        return hash(self.parts)
+
+    def __repr__(self):
+        return f"WingetVersion({self.text!r})"
+
+def is_newer(candidate, current):
+    """True if version string candidate is strictly newer than current."""
+    return compare_versions(candidate, current) > 0
+
+def batch_sort_keys(versions):
+    """Return plain tuple sort keys for a batch of version strings.
+
+    Every key is padded with zero parts to the longest version in the batch, which
+    makes built-in tuple comparison exact for that batch (no per-comparison Python call).
+    """
+    parsed = [parse_version(version) for version in versions]
+    width = max(map(len, parsed), default=0)
+    return [parts + (_ZERO_PART,) * (width - len(parts)) for parts in parsed]
+
+def newest_version(versions):
+    """Return the highest version string from an iterable (None if it is empty)."""
+    versions = list(versions)
+    if not versions:
+        return None
+    keys = batch_sort_keys(versions)
+    return versions[max(range(len(versions)), key=keys.__getitem__)]
+
+def sort_versions(versions, reverse=False):
+    """Sort version strings in winget order."""
+    versions = list(versions)
+    keys = batch_sort_keys(versions)
+    return [versions[index] for index in sorted(range(len(versions)), key=keys.__getitem__, reverse=reverse)]
+
+def compare_many(pairs):
+    """Compare many (left, right) version pairs at once; returns a list of -1 / 0 / 1."""
+    return [compare_parsed_versions(parse_version(left), parse_version(right)) for left, right in pairs]